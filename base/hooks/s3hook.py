@@ -231,3 +231,8 @@ class S3Hook(object):
         bucket, path = self.parse_s3_url(dst_key)
         s3_object = self.client.Object(bucket, path)
         s3_object.upload_file(filename)
+
+    def delete_prefix(self, prefix_key):
+        """Delete every object under an S3 prefix."""
+        bucket, path = self.parse_s3_url(prefix_key)
+        self.client.Bucket(bucket).objects.filter(Prefix=path).delete()
@@ -0,0 +1,147 @@
+"""
+Cache of reference matching results, keyed by normalised title.
+
+The same references (e.g. the Global Burden of Disease papers) are cited
+by hundreds of policy documents, and matching them is by far the most
+expensive step of the fuzzy matchers. A TitleMatchCache keeps the result
+of each title in a bounded in-memory LRU and, optionally, in a SQLite
+file on disk, so that repeated titles are only scored once per run and
+reruns against the same publications index skip them altogether.
+
+Entries are stored under a namespace, which callers derive from
+whatever their result depends on (thresholds, index version), so a
+single cache file can safely serve matchers with different settings.
+
+Sample usage::
+
+    cache = TitleMatchCache(cache_dir='/tmp/match-cache')
+    result = cache.get(namespace, title)
+    if result is cache.MISSING:
+        result = expensive_match(title)
+        cache.put(namespace, title, result)
+
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILENAME = 'match-cache.sqlite3'
+
+NON_WORD_RE = re.compile(r'\W+')
+
+
+def normalize_title(title):
+    """
+    Lowercase a title and collapse punctuation and whitespace, which
+    neither TF-IDF nor Elasticsearch scoring depend on.
+    """
+    return NON_WORD_RE.sub(' ', title.lower()).strip()
+
+
+def cache_namespace(*parts):
+    """Build a namespace from the settings a match result depends on."""
+    return '|'.join(str(part) for part in parts)
+
+
+class TitleMatchCache:
+    # Returned by get() on a cache miss, as None is a valid result.
+    MISSING = object()
+
+    def __init__(self, max_size=100000, cache_dir=None):
+        """
+        Args:
+            max_size(int): Maximum number of entries kept in memory.
+            cache_dir(str): Optional directory holding the on-disk tier,
+                shared across runs.
+        """
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.db = None
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.db = sqlite3.connect(
+                os.path.join(cache_dir, CACHE_FILENAME),
+                check_same_thread=False
+            )
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS matches '
+                '(key TEXT PRIMARY KEY, value TEXT)'
+            )
+            self.db.commit()
+
+    @staticmethod
+    def key(namespace, title):
+        return hashlib.sha256(
+            ('%s\0%s' % (namespace, normalize_title(title))).encode('utf-8')
+        ).hexdigest()
+
+    def get(self, namespace, title):
+        """
+        Returns:
+            The cached result for title, or TitleMatchCache.MISSING.
+        """
+        key = self.key(namespace, title)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+            if self.db is not None:
+                row = self.db.execute(
+                    'SELECT value FROM matches WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return self.MISSING
+
+    def put(self, namespace, title, value):
+        """Cache a JSON serialisable result for title."""
+        key = self.key(namespace, title)
+        with self.lock:
+            self._remember(key, value)
+            if self.db is not None:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO matches VALUES (?, ?)',
+                    (key, json.dumps(value))
+                )
+
+    def _remember(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def close(self):
+        """Commit the on-disk tier and log the hit rate."""
+        with self.lock:
+            logger.info(
+                'TitleMatchCache.close: hits=%d misses=%d',
+                self.hits, self.misses
+            )
+            if self.db is not None:
+                self.db.commit()
+                self.db.close()
+                self.db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
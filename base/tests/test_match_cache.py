@@ -0,0 +1,39 @@
+from match_cache import TitleMatchCache, cache_namespace, normalize_title
+
+
+def test_normalize_title():
+    assert normalize_title(' Global Burden of Disease:  2010. ') == \
+        'global burden of disease 2010'
+
+
+def test_miss_then_hit():
+    cache = TitleMatchCache()
+    namespace = cache_namespace('index', 0.8)
+
+    assert cache.get(namespace, 'Malaria') is TitleMatchCache.MISSING
+    cache.put(namespace, 'Malaria', None)
+    assert cache.get(namespace, 'malaria.') is None
+    assert cache.get(cache_namespace('index', 0.9), 'Malaria') is \
+        TitleMatchCache.MISSING
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_lru_eviction():
+    cache = TitleMatchCache(max_size=2)
+    cache.put('ns', 'a', 1)
+    cache.put('ns', 'b', 2)
+    cache.get('ns', 'a')
+    cache.put('ns', 'c', 3)
+
+    assert cache.get('ns', 'b') is TitleMatchCache.MISSING
+    assert cache.get('ns', 'a') == 1
+    assert cache.get('ns', 'c') == 3
+
+
+def test_disk_tier(tmp_path):
+    with TitleMatchCache(cache_dir=str(tmp_path)) as cache:
+        cache.put('ns', 'Zika virus', {'_id': 'pub1', '_score': 60.0})
+
+    with TitleMatchCache(max_size=1, cache_dir=str(tmp_path)) as cache:
+        assert cache.get('ns', 'zika VIRUS') == {'_id': 'pub1', '_score': 60.0}
+        assert cache.get('other', 'Zika virus') is TitleMatchCache.MISSING
@@ -8,6 +8,10 @@ import json
 import gzip
 import argparse
 import os
+import shutil
+from itertools import islice
+
+from botocore.exceptions import ClientError
 
 from hooks.s3hook import S3Hook
 from hooks.sentry import report_exception
@@ -18,22 +22,202 @@ logging.basicConfig()
 logger = logging.getLogger(__name__)
 
 
+class ExtractRefsCheckpoint(object):
+    """
+    Part files and progress marker of an ExtractRefsOperator run, saved
+    under an S3 prefix as documents are processed:
+
+        <prefix>/progress.json
+        <prefix>/split-00000.json.gz
+        <prefix>/parsed-00000.json.gz
+        ...
+
+    A run restarted with the same source, at the same key and with the
+    same ETag, resumes after the documents of the saved parts. Parts are
+    gzip members, which concatenated make up the whole output.
+
+    Args:
+        s3: S3Hook
+        prefix: S3 URL of the checkpoint
+        src_s3_key: S3 URL of the input the checkpoint is for
+        src_etag: ETag of the input, as scraper outputs are published
+            again under the same key by each run
+    """
+
+    def __init__(self, s3, prefix, src_s3_key, src_etag=None):
+        self.s3 = s3
+        self.prefix = prefix.rstrip('/')
+        self.src_s3_key = src_s3_key
+        self.src_etag = src_etag
+        self.parts = 0
+        self.documents = 0
+
+    @property
+    def progress_key(self):
+        return '{}/progress.json'.format(self.prefix)
+
+    def part_key(self, kind, part):
+        return '{}/{}-{:05d}.json.gz'.format(self.prefix, kind, part)
+
+    def load(self):
+        """Read the progress of a previous run, if any."""
+        try:
+            progress = json.loads(self.s3.get(self.progress_key).read())
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchKey':
+                return
+            raise
+
+        if (progress['src_s3_key'] != self.src_s3_key
+                or progress.get('src_etag') != self.src_etag):
+            logger.warning(
+                'ExtractRefsCheckpoint.load: ignoring checkpoint of '
+                'src_s3_key=%s src_etag=%s',
+                progress['src_s3_key'], progress.get('src_etag'))
+            return
+        self.parts = progress['parts']
+        self.documents = progress['documents']
+        logger.info(
+            'ExtractRefsCheckpoint.load: parts=%d documents=%d',
+            self.parts, self.documents)
+
+    def save_part(self, split_filename, parsed_filename, documents):
+        """
+        Upload the next part, then record it in the progress marker, so
+        that the marker never refers to a missing part.
+        """
+        self.s3.load_file(
+            split_filename, self.part_key('split', self.parts), replace=True)
+        self.s3.load_file(
+            parsed_filename, self.part_key('parsed', self.parts), replace=True)
+        self.parts += 1
+        self.documents += documents
+        self.s3.save(
+            json.dumps({
+                'src_s3_key': self.src_s3_key,
+                'src_etag': self.src_etag,
+                'parts': self.parts,
+                'documents': self.documents,
+            }).encode('utf-8'),
+            self.progress_key
+        )
+        logger.info(
+            'ExtractRefsCheckpoint.save_part: parts=%d documents=%d',
+            self.parts, self.documents)
+
+    def stitch(self, kind, fileobj):
+        """Write the parts of kind ('split' or 'parsed') to fileobj."""
+        if not self.parts:
+            # Still a valid, empty, gzip file
+            fileobj.write(gzip.compress(b''))
+        for part in range(self.parts):
+            shutil.copyfileobj(self.s3.get(self.part_key(kind, part)), fileobj)
+
+    def clear(self):
+        self.s3.delete_prefix(self.prefix + '/')
+
+
+def normalized_records(parsed_references, written_documents):
+    """
+    Records of the normalized output of parsed references: one document
+    record, holding the metadata of the document, the first time each
+    document_id is met, and the references without their metadata:
+
+        {"document_id": ..., "document_url": ..., "document_metadata": {...}}
+        {"document_id": ..., "Title": ..., "reference_id": ..., ...}
+        {"document_id": ..., "Title": ..., "reference_id": ..., ...}
+
+    Args:
+        parsed_references: structured references of a document
+        written_documents: set of the document_ids already written to,
+            updated with those written now
+    """
+    for ref in parsed_references:
+        ref = dict(ref)
+        metadata = ref.pop('metadata', {})
+        if ref['document_id'] not in written_documents:
+            written_documents.add(ref['document_id'])
+            yield {
+                'document_id': ref['document_id'],
+                'document_url': ref.get('document_url'),
+                'document_metadata': metadata,
+            }
+        yield ref
+
+
+def write_part(refs, split_f, parsed_f, max_documents,
+               written_documents=None):
+    """
+    Write the references of up to max_documents documents of refs.
+
+    Args:
+        written_documents: set of document_ids, to write the normalized
+            output of parsed references, see normalized_records
+    Returns:
+        The number of documents written.
+    """
+    documents = 0
+    for split_references, parsed_references in islice(refs, max_documents):
+        split_f.write(json.dumps(split_references).encode('utf-8'))
+        split_f.write(b'\n')
+        if written_documents is not None:
+            parsed_references = normalized_records(
+                parsed_references, written_documents)
+        for ref in parsed_references:
+            parsed_f.write(json.dumps(ref).encode('utf-8'))
+            parsed_f.write(b'\n')
+        documents += 1
+    return documents
+
+
 class ExtractRefsOperator(object):
     """
     Reads reference sections from a single newline-delimited
     json.gz file, writing out parsed references as a single
     newline-delimited json.gz file.
 
+    With normalized_output, the metadata of each document is written
+    once, in a document record, rather than in each of its references,
+    see normalized_records.
+
+    Every checkpoint_every documents, the references processed so far
+    are saved to S3 as an ExtractRefsCheckpoint, so that a restarted
+    task only processes the remaining documents.
+
     Args:
         src_s3_key: S3 URL for input
         split_s3_key: S3 URL for split references
         parsed_s3_key: S3 URL for parsed references
+        num_workers: number of processes running the reference parser
+        split_parse_cache_dir: local directory of predictions cached by
+            section text, reused across runs
+        split_parse_cache_s3_url: S3 URL of predictions cached by
+            section text, shared by every run
+        checkpoint_every: number of documents per checkpoint
+        checkpoint_s3_key: S3 URL of the checkpoint prefix, by default
+            next to parsed_s3_key
+        normalized_output: write document records and compact references
+        split_parse_url: URL of a refparse.split_parse_server to send
+            references to, instead of loading the model in this task
     """
 
-    def __init__(self, src_s3_key, split_s3_key, parsed_s3_key):
+    def __init__(self, src_s3_key, split_s3_key, parsed_s3_key,
+                 num_workers=1, split_parse_cache_dir=None,
+                 split_parse_cache_s3_url=None, checkpoint_every=1000,
+                 checkpoint_s3_key=None, normalized_output=False,
+                 split_parse_url=None):
         self.src_s3_key = src_s3_key
         self.split_s3_key = split_s3_key
         self.parsed_s3_key = parsed_s3_key
+        self.num_workers = num_workers
+        self.split_parse_cache_dir = split_parse_cache_dir
+        self.split_parse_cache_s3_url = split_parse_cache_s3_url
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_s3_key = (
+            checkpoint_s3_key or '{}.checkpoint'.format(parsed_s3_key)
+        )
+        self.normalized_output = normalized_output
+        self.split_parse_url = split_parse_url
 
     @report_exception
     def execute(self):
@@ -41,37 +225,46 @@ class ExtractRefsOperator(object):
             from refparse.refparse import yield_structured_references
 
         s3 = S3Hook()
+        checkpoint = ExtractRefsCheckpoint(
+            s3, self.checkpoint_s3_key, self.src_s3_key,
+            s3.get_s3_object(self.src_s3_key).e_tag)
+        checkpoint.load()
 
-        with tempfile.NamedTemporaryFile() as split_rawf, \
-             tempfile.NamedTemporaryFile() as parsed_rawf:
+        refs = yield_structured_references(
+            self.src_s3_key,
+            logger,
+            self.num_workers,
+            self.split_parse_cache_dir,
+            self.split_parse_cache_s3_url,
+            skip_documents=checkpoint.documents,
+            split_parse_url=self.split_parse_url)
+        written_documents = set() if self.normalized_output else None
+        while True:
+            with tempfile.NamedTemporaryFile() as split_rawf, \
+                 tempfile.NamedTemporaryFile() as parsed_rawf:
 
-            with gzip.GzipFile(mode='wb', fileobj=split_rawf) as split_f, \
-                 gzip.GzipFile(mode='wb', fileobj=parsed_rawf) as parsed_f:
+                with gzip.GzipFile(mode='wb', fileobj=split_rawf) as split_f, \
+                     gzip.GzipFile(mode='wb', fileobj=parsed_rawf) as parsed_f:
+                    documents = write_part(
+                        refs, split_f, parsed_f, self.checkpoint_every,
+                        written_documents)
 
-                refs = yield_structured_references(
-                    self.src_s3_key,
-                    logger)
-                for split_references, parsed_references in refs:
-                    split_f.write(json.dumps(split_references).encode('utf-8'))
-                    split_f.write(b'\n')
-                    for ref in parsed_references:
-                        parsed_f.write(json.dumps(ref).encode('utf-8'))
-                        parsed_f.write(b'\n')
+                if not documents:
+                    break
 
-            split_rawf.flush()
-            parsed_rawf.flush()
+                split_rawf.flush()
+                parsed_rawf.flush()
+                checkpoint.save_part(
+                    split_rawf.name, parsed_rawf.name, documents)
 
-            s3.load_file(
-                split_rawf.name,
-                self.split_s3_key,
-                replace=True,
-            )
+        for kind, dst_s3_key in (('split', self.split_s3_key),
+                                 ('parsed', self.parsed_s3_key)):
+            with tempfile.NamedTemporaryFile() as rawf:
+                checkpoint.stitch(kind, rawf)
+                rawf.flush()
+                s3.load_file(rawf.name, dst_s3_key, replace=True)
 
-            s3.load_file(
-                parsed_rawf.name,
-                self.parsed_s3_key,
-                replace=True,
-            )
+        checkpoint.clear()
 
 
 if __name__ == '__main__':
@@ -92,11 +285,64 @@ if __name__ == '__main__':
         help='The destination path to s3 for split refs.'
     )
 
+    arg_parser.add_argument(
+        '--num-workers',
+        type=int,
+        default=int(os.environ.get('EXTRACT_REFS_NUM_WORKERS', 1)),
+        help='Number of processes splitting and parsing references.'
+    )
+    arg_parser.add_argument(
+        '--split-parse-cache-dir',
+        default=os.environ.get('SPLIT_PARSE_CACHE_DIR'),
+        help='Local directory where split and parsed references are '
+             'cached by section text across runs.'
+    )
+    arg_parser.add_argument(
+        '--split-parse-cache-s3-url',
+        default=os.environ.get('SPLIT_PARSE_CACHE_S3_URL'),
+        help='S3 URL where split and parsed references are cached by '
+             'section text across runs.'
+    )
+
+    arg_parser.add_argument(
+        '--checkpoint-every',
+        type=int,
+        default=int(os.environ.get('EXTRACT_REFS_CHECKPOINT_EVERY', 1000)),
+        help='Number of documents processed between checkpoints to S3.'
+    )
+    arg_parser.add_argument(
+        '--checkpoint-s3-key',
+        help='S3 URL where checkpoints are saved, by default next to '
+             'the parsed references.'
+    )
+
+    arg_parser.add_argument(
+        '--normalized-output',
+        action='store_true',
+        default=bool(os.environ.get('EXTRACT_REFS_NORMALIZED_OUTPUT')),
+        help='Write the metadata of each document once, rather than in '
+             'each of its parsed references.'
+    )
+
+    arg_parser.add_argument(
+        '--split-parse-url',
+        default=os.environ.get('SPLIT_PARSE_SERVER_URL'),
+        help='URL of a refparse.split_parse_server with the model loaded, '
+             'e.g. http://localhost:8765, used instead of --num-workers.'
+    )
+
     args = arg_parser.parse_args()
 
     extracter = ExtractRefsOperator(
         args.src_s3_key,
         args.dst_s3_key,
-        args.dst_split_s3_key
+        args.dst_split_s3_key,
+        num_workers=args.num_workers,
+        split_parse_cache_dir=args.split_parse_cache_dir,
+        split_parse_cache_s3_url=args.split_parse_cache_s3_url,
+        checkpoint_every=args.checkpoint_every,
+        checkpoint_s3_key=args.checkpoint_s3_key,
+        normalized_output=args.normalized_output,
+        split_parse_url=args.split_parse_url
     )
     extracter.execute()
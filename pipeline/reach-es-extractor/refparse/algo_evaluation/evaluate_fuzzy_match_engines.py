@@ -0,0 +1,137 @@
+"""
+Compare the recall and latency of the LSH FuzzyMatcher engine against
+the brute force engine it approximates. The LSH engine hashes the set of
+words of each title (the unigrams of the TF-IDF vocabulary), so titles
+are only candidates of each other if they share most of their words.
+Results and when to use the LSH engine are in evaluation.md.
+
+e.g. python -m refparse.algo_evaluation.evaluate_fuzzy_match_engines
+"""
+import json
+import os
+import random
+import time
+
+import pandas as pd
+
+from refparse.algo_evaluation.evaluate_settings import settings
+from refparse.utils import FuzzyMatcher
+
+
+def time_engine(publications, references, match_threshold, engine):
+    """
+    Returns:
+        (matches, build_seconds, match_seconds) for the given engine.
+    """
+    start = time.time()
+    fuzzy_matcher = FuzzyMatcher(publications, match_threshold, engine=engine)
+    build_seconds = time.time() - start
+
+    start = time.time()
+    matches = list(fuzzy_matcher.match_many(references))
+    match_seconds = time.time() - start
+
+    return matches, build_seconds, match_seconds
+
+
+def evaluate_fuzzy_match_engines(publications, references, match_threshold):
+    """
+    Input:
+        publications: list of publication dicts with a 'title'
+        references: list of structured references with 'Title',
+            'Document id' and 'Reference id'
+        match_threshold: FuzzyMatcher similarity threshold
+    Output:
+        metrics: recall of the LSH engine, taking the brute force
+            matches as ground truth, and timings of both engines.
+    """
+    brute_force, bf_build, bf_match = time_engine(
+        publications, references, match_threshold, 'brute_force'
+    )
+    lsh, lsh_build, lsh_match = time_engine(
+        publications, references, match_threshold, 'lsh'
+    )
+
+    expected = [
+        (i, m['Matched title']) for i, m in enumerate(brute_force) if m
+    ]
+    found = set(
+        (i, m['Matched title']) for i, m in enumerate(lsh) if m
+    )
+    recall = round(
+        sum(1 for match in expected if match in found) / max(len(expected), 1),
+        3
+    )
+
+    per_thousand = 1000 / max(len(references), 1)
+    timings = pd.DataFrame(
+        [
+            [bf_build, bf_match, bf_match * per_thousand],
+            [lsh_build, lsh_match, lsh_match * per_thousand],
+        ],
+        columns=[
+            'Index build seconds',
+            'Match seconds',
+            'Match seconds per 1000 references'
+        ],
+        index=['brute_force', 'lsh']
+    ).round(3)
+
+    return {
+        'Score': recall,
+        'Number of publications': len(publications),
+        'Number of references': len(references),
+        'Number of brute force matches': len(expected),
+        'Number of LSH matches': len(found),
+        'Recall against brute force': recall,
+        'Match speedup': round(bf_match / max(lsh_match, 1e-9), 2),
+        'Timings': timings,
+    }
+
+
+def yield_publications(pubs_file, total_N):
+    with open(pubs_file, 'r') as f:
+        for i, line in enumerate(f):
+            if i >= total_N:
+                break
+            publication = json.loads(line)
+            if publication.get('title'):
+                yield {'title': publication['title'], 'uber_id': publication.get('pmid')}
+
+
+def drop_a_word(title, rand):
+    """Make the reference title differ slightly from the publication's."""
+    words = title.split()
+    if len(words) > 2:
+        del words[rand.randrange(len(words))]
+    return ' '.join(words)
+
+
+if __name__ == '__main__':
+    pubs_file = os.path.join(
+        settings.FOLDER_PREFIX,
+        settings.EVAL_PUB_DATA_FILE_NAME
+    )
+    publications = list(yield_publications(pubs_file, settings.EVAL_MATCH_NUMBER))
+
+    rand = random.Random(0)
+    sample = rand.sample(
+        publications,
+        min(settings.EVAL_SAMPLE_MATCH_NUMBER, len(publications))
+    )
+    references = [
+        {
+            'Document id': i,
+            'Reference id': publication['uber_id'],
+            'Title': drop_a_word(publication['title'], rand),
+        }
+        for i, publication in enumerate(sample)
+    ]
+
+    metrics = evaluate_fuzzy_match_engines(
+        publications,
+        references,
+        settings.MATCH_THRESHOLD
+    )
+    for key, value in metrics.items():
+        print('\n{}\n{}'.format(key, value))
@@ -0,0 +1,118 @@
+"""
+Measure how many actual references sections, and references, the
+SectionFilter would skip without parsing them, at the threshold of the
+settings and at each of SECTION_FILTER_EVAL_THRESHOLDS, to choose one.
+
+e.g. python -m refparse.algo_evaluation.evaluate_section_filter
+"""
+import os
+
+import pandas as pd
+
+from refparse.algo_evaluation.evaluate_settings import settings
+from refparse.utils.section_filter import SectionFilter, citation_density
+
+
+def evaluate_section_filter(evaluate_split_section_data, threshold,
+                            thresholds=()):
+    """
+    Input:
+        evaluate_split_section_data: dataframe of the split evaluation
+            data, with the 'Reference section' texts and their
+            'Number of references scraped'
+        threshold: SectionFilter threshold
+        thresholds: other thresholds to compare the proportions kept at
+    Output:
+        metrics: proportion of sections and of references kept by the
+            filter, the citation densities of the skipped sections, and
+            the proportions kept at each of thresholds.
+    """
+    data = evaluate_split_section_data.reset_index(drop=True)
+    section_filter = SectionFilter(threshold)
+
+    data['Citation density'] = citation_density(
+        list(data['Reference section']),
+        section_filter.min_chars
+    ).round(2)
+    data['Kept'] = section_filter.keep(list(data['Reference section']))
+
+    num_references = data['Number of references scraped']
+    section_recall = round(data['Kept'].mean(), 3)
+    reference_recall = round(
+        num_references[data['Kept']].sum() / max(num_references.sum(), 1),
+        3
+    )
+    threshold_metrics = pd.DataFrame(
+        [
+            _proportions_kept(
+                SectionFilter(other_threshold).keep(
+                    list(data['Reference section'])
+                ),
+                num_references
+            )
+            for other_threshold in thresholds
+        ],
+        columns=['Proportion of sections kept',
+                 'Proportion of references kept'],
+        index=pd.Index(thresholds, name='Threshold')
+    )
+    grouped_source_metrics = data.groupby('Source').agg(**{
+        'Number of reference sections in sample': ('Kept', 'size'),
+        'Proportion of sections kept': ('Kept', 'mean'),
+        'Median citation density': ('Citation density', 'median'),
+    })
+
+    return {
+        'Score': reference_recall,
+        'Number of reference sections in sample': len(data),
+        'Number of sections skipped': section_filter.skipped,
+        'Proportion of sections kept': section_recall,
+        'Proportion of references kept': reference_recall,
+        'Skipped sections': data.loc[
+            ~data['Kept'],
+            ['hash', 'Source', 'Citation density',
+             'Number of references scraped']
+        ],
+        'Metrics grouped by source': grouped_source_metrics.T,
+        'Metrics by threshold': threshold_metrics,
+    }
+
+
+def _proportions_kept(kept, num_references):
+    kept = pd.Series(kept, index=num_references.index)
+    return (
+        round(kept.mean(), 3),
+        round(num_references[kept].sum() / max(num_references.sum(), 1), 3)
+    )
+
+
+def load_split_section_data():
+    data = pd.read_csv(
+        os.path.join(settings.FOLDER_PREFIX, settings.NUM_REFS_FILE_NAME)
+    )
+    section_path = os.path.join(
+        settings.FOLDER_PREFIX,
+        settings.NUM_REFS_TEXT_FOLDER_NAME
+    )
+
+    sections = []
+    for doc_hash in data['hash']:
+        path = os.path.join(section_path, '{}.txt'.format(doc_hash))
+        text = None
+        if os.path.isfile(path):
+            with open(path) as f:
+                text = f.read()
+        sections.append(text)
+    data['Reference section'] = sections
+
+    return data.dropna(subset=['Reference section'])
+
+
+if __name__ == '__main__':
+    metrics = evaluate_section_filter(
+        load_split_section_data(),
+        settings.SECTION_FILTER_THRESHOLD,
+        settings.SECTION_FILTER_EVAL_THRESHOLDS
+    )
+    for key, value in metrics.items():
+        print('\n{}\n{}'.format(key, value))
@@ -19,6 +19,9 @@ class TestSettings(BaseSettings):
     SPLIT_SECTION_SIMILARITY_THRESHOLD = 40
     NUM_REFS_FILE_NAME = "split_section_test_data.csv"
     NUM_REFS_TEXT_FOLDER_NAME = "scraped_references_sections"
+    # Section filter thresholds compared, to choose the default of
+    # SECTION_FILTER_THRESHOLD
+    SECTION_FILTER_EVAL_THRESHOLDS = [0.5, 1, 2, 3, 5]
 
     # Variables for parse evaluation data
     LEVENSHTEIN_DIST_PARSE_THRESHOLD = 0.3
@@ -18,6 +18,8 @@ from reach.refparse.algo_evaluation.evaluate_find_section import \
 from reach.refparse.algo_evaluation.evaluate_match_references import \
     evaluate_match_references
 from reach.refparse.algo_evaluation.evaluate_parse import evaluate_parse
+from reach.refparse.algo_evaluation.evaluate_section_filter import \
+    evaluate_section_filter
 from reach.refparse.algo_evaluation.evaluate_settings import settings
 from reach.refparse.algo_evaluation.evaluate_split_section import \
     evaluate_split_section
@@ -243,6 +245,15 @@ if __name__ == '__main__':
         )
     logger.info('main: ---> Took %0.3f seconds', time.time() - start)
 
+    start = time.time()
+    logger.info('main: Running section filter evaluation')
+    eval_score_filter = evaluate_section_filter(
+        evaluate_split_section_data,
+        settings.SECTION_FILTER_THRESHOLD,
+        settings.SECTION_FILTER_EVAL_THRESHOLDS
+        )
+    logger.info('main: ---> Took %0.3f seconds', time.time() - start)
+
     start = time.time()
     logger.info('main: Running parse references evaluation')
     eval_score_parse = evaluate_parse(
@@ -265,6 +276,7 @@ if __name__ == '__main__':
     eval_scores_list = [
         eval_scores_find,
         eval_score_split,
+        eval_score_filter,
         eval_score_parse,
         eval_score_match
         ]
@@ -272,6 +284,7 @@ if __name__ == '__main__':
     eval_names = [
         "How well the scraper finds the references section",
         "How well the splitter predicted how many references there were",
+        "How many references the section filter kept",
         "How well the parser predicted reference component texts",
         "How well the matcher matched references"
     ]
@@ -3,26 +3,35 @@ and a list of publication.
 """
 
 from argparse import ArgumentParser
-from collections import namedtuple
+from collections import deque, namedtuple
 from urllib.parse import urlparse
 from functools import partial
+from itertools import islice
 import os
 import os.path
 import time
 import json
+import hashlib
 
 import sentry_sdk
 import pandas as pd
 
 from .utils import (FileManager,
                    FuzzyMatcher,
+                   ParallelFuzzyMatcher,
+                   SplitParsePool,
+                   SplitParseClient,
+                   SplitParseCache,
+                   CachedSplitParsePool,
+                   split_parse_model_version,
+                   SectionFilter,
+                   QueueStage,
+                   split_windows,
+                   merge_window_predictions,
                    structure_reference,
-                   ExactMatcher)
+                   AhoCorasickExactMatcher)
 from .settings import settings
 
-from deep_reference_parser.split_parse import SplitParser
-from deep_reference_parser.common import MULTITASK_CFG
-
 
 SectionedDocument = namedtuple(
     'SectionedDocument',
@@ -63,6 +72,44 @@ def transform_scraper_file(scraper_data, section_column="sections"):
                         dict(document)
                     )
 
+def transform_scraper_rows(rows, text_documents=None,
+                           section_column="sections", text_column="text"):
+    """Takes an iterable of scraper result rows, as read by
+    read_scraper_file. Yields back the SectionedDocument of each section.
+
+    If text_documents is given, the SectionedDocument of each row's whole
+    text is appended to it as the row is read, so that the exact matcher
+    can be fed from the same read of the scraper file.
+    """
+    for document in rows:
+        if text_documents is not None and document.get(text_column):
+            metadata = {}
+            metadata.update(document.get("source_metadata") or {})
+            metadata.update(document.get("pdf_metadata") or {})
+            text_documents.append(SectionedDocument(
+                document[text_column],
+                document.get('url', None),
+                document['file_hash'],
+                metadata
+            ))
+
+        sections = document.get(section_column)
+        if not sections:
+            continue
+        metadata = {
+            key: value for key, value in document.items()
+            if key not in (section_column, text_column)
+        }
+        for section_list in sections.values():
+            assert isinstance(section_list, list)
+            for section in section_list:
+                yield SectionedDocument(
+                    section,
+                    document.get('url', None),
+                    document['file_hash'],
+                    metadata
+                )
+
 def transform_scraper_text_file(scraper_data, text_column="text"):
     """Takes a pandas dataframe. Yields back individual
     SectionedDocument tuples.
@@ -80,17 +127,26 @@ def transform_scraper_text_file(scraper_data, text_column="text"):
                 metadata
             )
 
+def reference_id(reference):
+    """
+    Stable id of a split reference, the same across runs and processes,
+    unlike hash(). Kept below 2**60 to remain an integer id.
+    """
+    return int(hashlib.sha256(reference.encode('utf-8')).hexdigest()[:15], 16)
+
 def transform_structured_references(
         splitted_references, structured_references,
         document_id, document_uri, document_metadata):
     transformed_structured_references = []
+    # Shared by the references of the document, rather than copied
+    metadata = dict((key, value) for key, value in document_metadata.items() if key != 'sections')
     for structured_reference, splitted_reference in zip(structured_references, splitted_references):
         # Don't return the structured references if no categories were found
         if any(structured_reference.values()):
             structured_reference['document_id'] = document_id
             structured_reference['document_url'] = document_uri
-            structured_reference['reference_id'] = hash(splitted_reference)
-            structured_reference['metadata'] = dict((key, value) for key, value in document_metadata.items() if key != 'sections')
+            structured_reference['reference_id'] = reference_id(splitted_reference)
+            structured_reference['metadata'] = metadata
             transformed_structured_references.append(structured_reference)
 
     return transformed_structured_references
@@ -109,6 +165,25 @@ SCRAPING_COLUMNS = [
     'types'
 ]
 
+def read_scraper_file(file_str, scraping_columns=SCRAPING_COLUMNS):
+    """
+    Stream the rows of a scraper results file, keeping only
+    scraping_columns of each.
+    Args:
+        file_str: path / S3 url to scraper results file, gzipped or not
+    """
+    if file_str.startswith('s3://'):
+        u = urlparse(file_str)
+        fm = FileManager('S3', bucket=u.netloc)
+        file_name = os.path.basename(u.path)
+        file_dir = os.path.dirname(u.path)[1:]  # strip /
+    else:
+        fm = FileManager('LOCAL')
+        file_name = os.path.basename(file_str)
+        file_dir = os.path.dirname(file_str)
+    return fm.yield_scraping_results(file_name, file_dir, scraping_columns)
+
+
 def get_file(
         file_str,
         file_type,
@@ -137,38 +212,201 @@ def get_file(
     return file
 
 
-def yield_structured_references(scraper_file, logger):
+def yield_structured_references(scraper_file, logger, num_workers=None,
+                                split_parse_cache_dir=None,
+                                split_parse_cache_s3_url=None,
+                                skip_documents=0, split_parse_url=None):
     """
-    Split and parse references using a (potentially parallelized) map()
-    implementation, yielding back a list of reference dicts for each
-    document in scraper_file.
+    Split and parse references on a pool of num_workers processes,
+    yielding back a list of reference dicts for each document in
+    scraper_file, in order.
     Args:
         scraper_file: path / S3 url to scraper results file
         logger: logging configuration name
+        num_workers: number of processes running the model
+        split_parse_cache_dir: local directory of cached predictions
+        split_parse_cache_s3_url: S3 URL of cached predictions
+        skip_documents: number of documents at the start of
+            scraper_file already processed, e.g. by an interrupted run
+        split_parse_url: URL of a split_parse_server to send references
+            to, instead of running the model on num_workers processes
     """
 
     logger.info("[+] Reading input files")
 
-    # Loading the scraper results
-    scraper_file = get_file(scraper_file, "", get_scraped=True)
+    # Streaming the scraper results
+    sectioned_documents = transform_scraper_rows(
+        read_scraper_file(scraper_file)
+    )
+    if skip_documents:
+        logger.info("[+] Skipping %d processed documents", skip_documents)
+        sectioned_documents = islice(sectioned_documents, skip_documents, None)
+
+    yield from parse_sectioned_documents(
+        sectioned_documents,
+        logger,
+        num_workers,
+        split_parse_cache_dir,
+        split_parse_cache_s3_url,
+        split_parse_url
+    )
+
+
+def create_split_parse_pool(num_workers=None, split_parse_url=None):
+    """
+    Returns:
+        SplitParseClient of the server at split_parse_url if set, else a
+        SplitParsePool of num_workers processes. Either has to be closed.
+    """
+    if split_parse_url:
+        return SplitParseClient(
+            split_parse_url,
+            batch_size=settings.SPLIT_PARSE_BATCH_SIZE,
+            max_batch_chars=settings.SPLIT_PARSE_BATCH_CHARS
+        )
+
+    # Each worker instantiates the deep_reference_parser model once
+    return SplitParsePool(
+        num_workers,
+        batch_size=settings.SPLIT_PARSE_BATCH_SIZE,
+        max_batch_chars=settings.SPLIT_PARSE_BATCH_CHARS,
+        predict_batch_size=settings.SPLIT_PARSE_PREDICT_BATCH_SIZE
+    )
 
-    sectioned_documents = transform_scraper_file(scraper_file)
 
-    # Instantiate deep_reference_parser model here (not in loop!)
+def parse_sectioned_documents(sectioned_documents, logger, num_workers=None,
+                              split_parse_cache_dir=None,
+                              split_parse_cache_s3_url=None,
+                              split_parse_url=None):
+    """
+    Split and parse the references of sectioned_documents on a pool of
+    num_workers processes, or with the server at split_parse_url,
+    yielding back a list of reference dicts for each, in order. See
+    yield_structured_references for the arguments.
+    """
+    section_filter = create_section_filter()
+
+    with create_split_parse_pool(
+            num_workers, split_parse_url) as split_parse_pool:
+        model_version = None
+        if split_parse_url:
+            # Cached predictions are those of the model the server runs
+            model_version = split_parse_pool.model_version()
+        split_parse_cache = create_split_parse_cache(
+            split_parse_cache_dir,
+            split_parse_cache_s3_url,
+            model_version
+        )
+        if split_parse_cache is not None:
+            split_parse_pool = CachedSplitParsePool(
+                split_parse_pool,
+                split_parse_cache
+            )
+        yield from _yield_structured_references(
+            split_parse_pool, sectioned_documents, logger, section_filter
+        )
+
+    if section_filter is not None:
+        logger.info(
+            "[+] Skipped %d of %d sections without references",
+            section_filter.skipped,
+            section_filter.skipped + section_filter.kept
+        )
 
-    splitter_parser = SplitParser(config_file=MULTITASK_CFG)
 
+def create_split_parse_cache(cache_dir, s3_url, model_version=None):
+    """
+    Returns:
+        SplitParseCache of predictions by section text for model_version,
+        by default the installed model, or None if neither cache_dir nor
+        s3_url is set.
+    """
+    if cache_dir is None and s3_url is None:
+        return None
+    model_version = (
+        model_version or settings.SPLIT_PARSE_MODEL_VERSION
+        or split_parse_model_version()
+    )
+    return SplitParseCache(model_version, cache_dir, s3_url)
+
+
+def create_section_filter():
+    """
+    Returns:
+        SectionFilter skipping sections with less than
+        SECTION_FILTER_THRESHOLD citation markers per thousand
+        characters, or None if the threshold is 0.
+    """
+    if not settings.SECTION_FILTER_THRESHOLD:
+        return None
+    return SectionFilter(
+        settings.SECTION_FILTER_THRESHOLD,
+        batch_size=settings.SECTION_FILTER_BATCH_SIZE
+    )
+
+
+def yield_section_windows(sectioned_documents, section_filter=None):
+    """
+    Cut the section of each document in overlapping windows, so that
+    the model never runs on more than SPLIT_PARSE_WINDOW_CHARS at once.
+    Sections skipped by section_filter are one window with no text.
+    Yields (document, window, is_last) tuples.
+    """
+    if section_filter is None:
+        filtered_documents = ((doc, True) for doc in sectioned_documents)
+    else:
+        filtered_documents = section_filter.filter_many(
+            sectioned_documents,
+            lambda doc: doc.section
+        )
+
+    for doc, keep in filtered_documents:
+        if not keep:
+            yield doc, None, True
+            continue
+        windows = split_windows(
+            doc.section,
+            settings.SPLIT_PARSE_WINDOW_CHARS,
+            settings.SPLIT_PARSE_WINDOW_OVERLAP_CHARS
+        )
+        for window, is_last in windows:
+            yield doc, window, is_last
+
+
+def yield_document_predictions(split_parse_pool, sectioned_documents,
+                               section_filter=None):
+    """
+    Split and parse the windows of each document's section, in
+    parallel, yielding back (document, reference_predictions) tuples in
+    order, with the predictions of windows merged. Documents whose
+    section is skipped by section_filter have no predictions.
+    """
+    window_predictions = []
+    predictions = split_parse_pool.split_parse_many(
+        yield_section_windows(sectioned_documents, section_filter),
+        lambda doc_window: doc_window[1]
+    )
+    for (doc, _, is_last), reference_predictions in predictions:
+        window_predictions.append(reference_predictions)
+        if is_last:
+            yield doc, merge_window_predictions(window_predictions)
+            window_predictions = []
+
+
+def _yield_structured_references(split_parse_pool, sectioned_documents,
+                                 logger, section_filter=None):
     t0 = time.time()
     nb_references = 0
-    for i, doc in enumerate(sectioned_documents):
+    predictions = yield_document_predictions(
+        split_parse_pool,
+        sectioned_documents,
+        section_filter
+    )
+    for i, (doc, reference_predictions) in enumerate(predictions):
         logger.info('[+] Processing references from document {}'.format(
             i
         ))
 
-        reference_predictions = splitter_parser.split_parse(
-            doc.section[0:1000000]
-            )
-
         logger.info('[+] Extracted {} references from document {}'.format(
             len(reference_predictions),
             i
@@ -205,17 +443,22 @@ def yield_structured_references(scraper_file, logger):
     )
 
 
-def parse_references(scraper_file, logger):
+def parse_references(scraper_file, logger, num_workers=None,
+                     split_parse_cache_dir=None):
 
     """
     Entry point for reference parser.
     Args:
         scraper_file: path / S3 url to scraper results file
         logger: logging configuration name
+        num_workers: number of processes running the model
+        split_parse_cache_dir: local directory of cached predictions
     """
 
     yield from yield_structured_references(
-        scraper_file, logger)
+        scraper_file, logger, num_workers, split_parse_cache_dir,
+        settings.SPLIT_PARSE_CACHE_S3_URL,
+        split_parse_url=settings.SPLIT_PARSE_SERVER_URL)
 
 #
 # Module entry points
@@ -231,22 +474,100 @@ def fuzzy_match_reference(fuzzy_matcher, reference):
     """
     return fuzzy_matcher.match(reference)
 
-def exact_match_publication(exact_matcher, publication):
+def fuzzy_match_references(fuzzy_matcher, references):
     """
     Args:
-        exact_matcher_matcher: instance of HardTextMatcher, with index of documents in place.
-        publication: publication
+        fuzzy_matcher: instance of FuzzyMatcher, with index of publications in place.
+        references: list of references
     Returns:
-        matched reference (citations), including publication & doc id.
+        matched references (citations), one per reference, in order.
     """
-    return exact_matcher.match(publication)
+    return fuzzy_matcher.match_many(
+        references,
+        batch_size=settings.FUZZYMATCH_BATCH_SIZE
+    )
+
+def yield_fuzzy_matches(fuzzy_matcher, parsed_references):
+    """
+    Args:
+        fuzzy_matcher: instance of FuzzyMatcher, with index of publications in place.
+        parsed_references: iterable of (split references, structured
+            references) of each document, as parse_references yields them.
+    Yields:
+        (structured references, matched references) of each document.
+    """
+    for _, structured_references in parsed_references:
+        yield structured_references, list(fuzzy_match_references(
+            fuzzy_matcher,
+            structured_references
+        ))
+
+def exact_match_documents(exact_matcher, documents):
+    """
+    Args:
+        exact_matcher: instance of AhoCorasickExactMatcher, with automaton
+            of publication titles in place.
+        documents: iterable of SectionedDocument
+    Returns:
+        matched references (citations), including publication & doc id.
+    """
+    return exact_matcher.match_documents(documents)
 
 #
 # CLI functions
 #
 
+def create_fuzzy_matcher(publications, index_cache_dir=None,
+                         fuzzy_match_workers=None, match_cache=None):
+    """
+    Args:
+        publications: list of publication dicts
+        index_cache_dir: local directory of saved FuzzyMatcher indexes
+        fuzzy_match_workers: if more than one, number of processes
+            scoring shards of the publications index in parallel
+        match_cache: optional TitleMatchCache of best matches by title
+    Returns:
+        FuzzyMatcher, or ParallelFuzzyMatcher which has to be closed.
+    """
+    if fuzzy_match_workers and fuzzy_match_workers > 1:
+        return ParallelFuzzyMatcher(
+            publications,
+            settings.FUZZYMATCH_SIMILARITY_THRESHOLD,
+            index_cache_dir=index_cache_dir,
+            num_workers=fuzzy_match_workers,
+            match_cache=match_cache,
+            engine=settings.FUZZYMATCH_ENGINE
+        )
+
+    return FuzzyMatcher(
+        publications,
+        settings.FUZZYMATCH_SIMILARITY_THRESHOLD,
+        index_cache_dir=index_cache_dir,
+        engine=settings.FUZZYMATCH_ENGINE,
+        match_cache=match_cache
+    )
+
+def create_match_cache(match_cache_dir):
+    """
+    Args:
+        match_cache_dir: local directory of the on-disk match cache, or
+            None to only cache in memory for this run.
+    Returns:
+        TitleMatchCache, which has to be closed.
+    """
+    # Shared with the other pipeline tasks through the base image
+    from match_cache import TitleMatchCache
+
+    return TitleMatchCache(
+        max_size=settings.MATCH_CACHE_SIZE,
+        cache_dir=match_cache_dir
+    )
+
 def refparse(scraper_file, publications_file,
-              output_dir, logger):
+              output_dir, logger, index_cache_dir=None,
+              fuzzy_match_workers=None, match_cache_dir=None,
+              num_workers=None, split_parse_cache_dir=None,
+              split_parse_url=None):
 
     # Loading the references file
     publications_df = get_file(publications_file, 'csv')
@@ -266,58 +587,100 @@ def refparse(scraper_file, publications_file,
         f"exact_{settings.MATCHED_REFS_FILENAME}"
     )
 
-    fuzzy_matcher = FuzzyMatcher(
+    match_cache = create_match_cache(match_cache_dir)
+    fuzzy_matcher = create_fuzzy_matcher(
+        publications,
+        index_cache_dir,
+        fuzzy_match_workers,
+        match_cache
+    )
+    exact_matcher = AhoCorasickExactMatcher(
         publications,
-        settings.FUZZYMATCH_SIMILARITY_THRESHOLD
+        settings.MATCH_TITLE_LENGTH_THRESHOLD
+    )
+
+    # The scraper file is read once: the whole text of each document is
+    # queued for the exact matcher as its sections are sent to the parser.
+    # Reading, parsing, fuzzy matching and writing run on their own threads,
+    # passing documents through bounded queues.
+    document_texts = deque()
+    rows = QueueStage(
+        'read',
+        read_scraper_file(scraper_file, SCRAPING_COLUMNS + ['text']),
+        settings.REFPARSE_QUEUE_SIZE
+    )
+    sectioned_documents = transform_scraper_rows(rows, document_texts)
+    parsed = QueueStage(
+        'split_parse',
+        parse_sectioned_documents(
+            sectioned_documents, logger, num_workers,
+            split_parse_cache_dir, settings.SPLIT_PARSE_CACHE_S3_URL,
+            split_parse_url),
+        settings.REFPARSE_QUEUE_SIZE
+    )
+    matched = QueueStage(
+        'fuzzy_match',
+        yield_fuzzy_matches(fuzzy_matcher, parsed),
+        settings.REFPARSE_QUEUE_SIZE
     )
 
-    with open(structured_references_filepath, 'w') as srefs_f:
-        with open(fuzzy_matched_references_filepath, 'w') as fmrefs_f:
+    def write_exact_matches(emrefs_f):
+        while document_texts:
+            exact_matched_references = exact_match_documents(
+                exact_matcher,
+                [document_texts.popleft()]
+            )
+            for exact_matched_reference in exact_matched_references:
+                emrefs_f.write(json.dumps(exact_matched_reference)+'\n')
 
-            refs = parse_references(
-                scraper_file, logger)
-            for structured_references in refs:
-                for structured_reference in structured_references:
+    try:
+        with open(structured_references_filepath, 'w') as srefs_f, \
+                open(fuzzy_matched_references_filepath, 'w') as fmrefs_f, \
+                open(exact_matched_reference_filepath, 'w') as emrefs_f:
 
-                    fuzzy_matched_reference = fuzzy_match_reference(
-                        fuzzy_matcher,
-                        structured_reference
-                    )
+            for structured_references, fuzzy_matched_references in matched:
+                for structured_reference, fuzzy_matched_reference in zip(
+                        structured_references, fuzzy_matched_references):
                     if fuzzy_matched_reference:
                         fmrefs_f.write(json.dumps(fuzzy_matched_reference)+'\n')
                     if structured_reference:
                         srefs_f.write(json.dumps(structured_reference)+'\n')
-
-    scraper_file = get_file(
-        scraper_file, "",
-        get_scraped=True,
-        scraping_columns=('title', 'file_hash', 'uri', 'text')
-        )
-
-    document_texts = transform_scraper_text_file(scraper_file)
-    exact_matcher = ExactMatcher(document_texts, settings.MATCH_TITLE_LENGTH_THRESHOLD)
-
-    with open(exact_matched_reference_filepath, 'w') as emrefs_f:
-        for publication in publications:
-            exact_matched_references = exact_match_publication(exact_matcher, publication)
-            for exact_matched_reference in exact_matched_references:
-                if exact_matched_reference:
-                    emrefs_f.write(json.dumps(exact_matched_reference)+'\n')
+                write_exact_matches(emrefs_f)
+            # Documents without any section after the last one parsed
+            write_exact_matches(emrefs_f)
+    finally:
+        for stage in (matched, parsed, rows):
+            stage.close()
+            stage.log_stats()
+        if isinstance(fuzzy_matcher, ParallelFuzzyMatcher):
+            fuzzy_matcher.close()
+        match_cache.close()
 
 def refparse_profile(scraper_file, references_file,
-                        output_dir, logger):
+                        output_dir, logger, index_cache_dir=None,
+                        fuzzy_match_workers=None, match_cache_dir=None,
+                        num_workers=None, split_parse_cache_dir=None,
+                        split_parse_url=None):
     """
     Entry point for reference parser, single worker, with profiling.
     Args:
         scraper_file: path / S3 url to scraper results file
         references_file: path/S3 url to references CSV file
         output_dir: file/S3 url for output files
+        index_cache_dir: local directory of saved FuzzyMatcher indexes
+        fuzzy_match_workers: number of fuzzy matching processes
+        match_cache_dir: local directory of the on-disk match cache
+        num_workers: number of processes running the reference parser
+        split_parse_cache_dir: local directory of cached predictions
+        split_parse_url: URL of a split_parse_server to parse with
     """
     import cProfile
     cProfile.run(
         ''.join([
             'refparse(scraper_file, references_file,',
-            'output_dir, logger)'
+            'output_dir, logger, index_cache_dir, fuzzy_match_workers,',
+            'match_cache_dir, num_workers, split_parse_cache_dir,',
+            'split_parse_url)'
         ]),
         'stats_dumps'
     )
@@ -336,12 +699,45 @@ def create_argparser(description):
         default='.'
     )
 
+    parser.add_argument(
+        '--index-cache-dir',
+        help='Local directory where fitted publication indexes are cached',
+        default=settings.FUZZYMATCH_INDEX_CACHE_DIR
+    )
+
+    parser.add_argument(
+        '--fuzzy-match-workers',
+        help='Number of processes scoring shards of the publications index.',
+        type=int
+    )
+
+    parser.add_argument(
+        '--match-cache-dir',
+        help='Local directory where best matches by title are cached '
+             'across runs',
+        default=settings.MATCH_CACHE_DIR
+    )
+
     parser.add_argument(
         '--num-workers',
-        help='Number of workers to use for parallel processing.',
+        help='Number of processes splitting and parsing references.',
         type=int
     )
 
+    parser.add_argument(
+        '--split-parse-cache-dir',
+        help='Local directory where split and parsed references are '
+             'cached by section text across runs',
+        default=settings.SPLIT_PARSE_CACHE_DIR
+    )
+
+    parser.add_argument(
+        '--split-parse-url',
+        help='URL of a refparse.split_parse_server with the model loaded, '
+             'e.g. http://localhost:8765, used instead of --num-workers.',
+        default=settings.SPLIT_PARSE_SERVER_URL
+    )
+
     return parser
 
 
@@ -380,14 +776,26 @@ if __name__ == '__main__':
                 args.scraper_file,
                 args.references_file,
                 args.output_dir,
-                logger
+                logger,
+                args.index_cache_dir,
+                args.fuzzy_match_workers,
+                args.match_cache_dir,
+                args.num_workers,
+                args.split_parse_cache_dir,
+                args.split_parse_url
             )
         else:
             refparse(
                 args.scraper_file,
                 args.references_file,
                 args.output_dir,
-                logger
+                logger,
+                args.index_cache_dir,
+                args.fuzzy_match_workers,
+                args.match_cache_dir,
+                args.num_workers,
+                args.split_parse_cache_dir,
+                args.split_parse_url
             )
 
     except Exception as e:
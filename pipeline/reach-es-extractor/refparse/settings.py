@@ -8,6 +8,40 @@ class BaseSettings:
 
     PREDICTION_PROBABILITY_THRESHOLD = 0.75
     FUZZYMATCH_SIMILARITY_THRESHOLD = 0.8
+    FUZZYMATCH_BATCH_SIZE = 1000
+    FUZZYMATCH_INDEX_CACHE_DIR = os.environ.get('FUZZYMATCH_INDEX_CACHE_DIR')
+    # 'brute_force' or 'lsh', see FuzzyMatcher
+    FUZZYMATCH_ENGINE = os.environ.get('FUZZYMATCH_ENGINE', 'brute_force')
+    MATCH_CACHE_DIR = os.environ.get('MATCH_CACHE_DIR')
+    MATCH_CACHE_SIZE = 100000
+
+    # Sections sent to a reference parser worker in one task, see
+    # SplitParsePool, and chunks of their tokens run through the model
+    # in one call, see split_parse_batch
+    SPLIT_PARSE_BATCH_SIZE = 32
+    SPLIT_PARSE_BATCH_CHARS = 100000
+    SPLIT_PARSE_PREDICT_BATCH_SIZE = 64
+    # Long sections are parsed in overlapping windows, see section_windows
+    SPLIT_PARSE_WINDOW_CHARS = 100000
+    SPLIT_PARSE_WINDOW_OVERLAP_CHARS = 5000
+    # Sections with less citation markers per thousand characters aren't
+    # parsed, see SectionFilter; 0 parses every section, the default until
+    # evaluate_section_filter.py justifies a threshold
+    SECTION_FILTER_THRESHOLD = float(
+        os.environ.get('SECTION_FILTER_THRESHOLD', 0)
+    )
+    SECTION_FILTER_BATCH_SIZE = 256
+    # Predictions cached by section text and model version, see
+    # SplitParseCache; the model version defaults to the installed
+    # deep_reference_parser's
+    SPLIT_PARSE_CACHE_DIR = os.environ.get('SPLIT_PARSE_CACHE_DIR')
+    SPLIT_PARSE_CACHE_S3_URL = os.environ.get('SPLIT_PARSE_CACHE_S3_URL')
+    SPLIT_PARSE_MODEL_VERSION = os.environ.get('SPLIT_PARSE_MODEL_VERSION')
+    # URL of a refparse.split_parse_server with the model loaded, used
+    # instead of loading it in each task
+    SPLIT_PARSE_SERVER_URL = os.environ.get('SPLIT_PARSE_SERVER_URL')
+    # Documents queued between the stages of refparse, see QueueStage
+    REFPARSE_QUEUE_SIZE = 64
 
     BUCKET = "datalabs-data"
 
@@ -0,0 +1,133 @@
+"""Serve the deep reference parser over HTTP on localhost, so that the
+model is loaded once and shared by every task sending it references to
+split and parse, rather than loaded again by each of them.
+
+Tasks use it through SplitParseClient, given its URL with the
+--split-parse-url option of refparse and of extract_refs_task, or the
+SPLIT_PARSE_SERVER_URL environment variable, e.g. http://localhost:8765
+
+    POST /split_parse   {"texts": [...]}  ->  {"predictions": [...]}
+                                          or  500 {"error": "..."}
+    GET /health         ->  {"model_version": ...}
+"""
+
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import logging
+import socketserver
+import threading
+
+from .utils.split_parse_batch import PREDICT_BATCH_SIZE, split_parse_texts
+from .utils.split_parse_pool import create_split_parser
+from .utils.split_parse_cache import split_parse_model_version
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SplitParseRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_error(404)
+            return
+        self.send_json({'model_version': self.server.model_version})
+
+    def do_POST(self):
+        if self.path != '/split_parse':
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers['Content-Length'])
+            texts = json.loads(self.rfile.read(length).decode('utf-8'))['texts']
+        except (TypeError, ValueError, KeyError) as e:
+            self.send_error(400, str(e))
+            return
+        try:
+            predictions = self.server.split_parse(texts)
+        except Exception as e:
+            logger.exception(
+                'SplitParseRequestHandler.do_POST: texts=%d', len(texts)
+            )
+            self.send_json({'error': repr(e)}, status=500)
+            return
+        self.send_json({'predictions': predictions})
+
+    def send_json(self, body, status=200):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug('SplitParseRequestHandler: ' + format, *args)
+
+
+class SplitParseServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    Requests are handled on their own threads, so that health checks
+    are answered during inference, but the model parses one batch at a
+    time, running on the chunks of all its texts at once.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, split_parser, model_version,
+                 predict_batch_size=PREDICT_BATCH_SIZE):
+        """
+        Args:
+            address: (host, port) tuple; port 0 picks a free port.
+            split_parser: loaded BatchSplitParser.
+            model_version(str): Version of the model, see
+                split_parse_model_version.
+            predict_batch_size(int): Maximum number of chunks per call of
+                the model.
+        """
+        super().__init__(address, SplitParseRequestHandler)
+        self.split_parser = split_parser
+        self.model_version = model_version
+        self.predict_batch_size = predict_batch_size
+        self.lock = threading.Lock()
+
+    def split_parse(self, texts):
+        with self.lock:
+            return split_parse_texts(
+                self.split_parser, texts, self.predict_batch_size
+            )
+
+
+def create_argparser(description):
+    parser = ArgumentParser(description)
+    parser.add_argument(
+        '--host',
+        help='Address the server listens on',
+        default='127.0.0.1'
+    )
+    parser.add_argument(
+        '--port',
+        help='Port the server listens on',
+        type=int,
+        default=8765
+    )
+    return parser
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='[%(asctime)s]:%(levelname)s - %(message)s')
+    logger.setLevel('INFO')
+
+    args = create_argparser(description=__doc__.strip()).parse_args()
+
+    logger.info('[+] Loading the reference parser model')
+    server = SplitParseServer(
+        (args.host, args.port),
+        create_split_parser(),
+        split_parse_model_version(),
+        predict_batch_size=settings.SPLIT_PARSE_PREDICT_BATCH_SIZE
+    )
+    logger.info(
+        '[+] Serving %s on http://%s:%d',
+        server.model_version, args.host, args.port
+    )
+    server.serve_forever()
@@ -4,7 +4,7 @@ from collections import namedtuple
 from pandas.util.testing import assert_frame_equal
 import pandas as pd
 
-from refparse.utils import ExactMatcher
+from refparse.utils import ExactMatcher, AhoCorasickExactMatcher
 from refparse.settings import settings
 
 SectionedDocument = namedtuple(
@@ -98,3 +98,61 @@ class TestExactMatch(unittest.TestCase):
         }
         matched_text_generator = exact_matcher.match(publication)
         self.assertEqual(len(list(matched_text_generator)), 0)
+
+
+class TestAhoCorasickExactMatch(unittest.TestCase):
+    def test_no_publications(self):
+        exact_matcher = AhoCorasickExactMatcher([], 3)
+        doc = SectionedDocument("Malaria", 123)
+        self.assertEqual(list(exact_matcher.match_document(doc)), [])
+
+    def test_threshold(self):
+        publications = [{'uber_id': 1, 'title': "Malaria"}]
+        exact_matcher = AhoCorasickExactMatcher(publications, 8)
+        doc = SectionedDocument("Malaria", 0)
+        self.assertEqual(list(exact_matcher.match_document(doc)), [])
+
+    def test_one_match_per_document(self):
+        publications = [{'uber_id': 1, 'title': "Malaria"}]
+        exact_matcher = AhoCorasickExactMatcher(publications, 3)
+        doc = SectionedDocument("Malaria, malaria and more MALARIA", 123)
+        matches = list(exact_matcher.match_document(doc))
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(matches[0]['Document id'], 123)
+
+    def test_shared_title(self):
+        publications = [
+            {'uber_id': 1, 'title': "Malaria"},
+            {'uber_id': 2, 'title': "malaria."},
+        ]
+        exact_matcher = AhoCorasickExactMatcher(publications, 3)
+        doc = SectionedDocument("Malaria", 123)
+        matches = list(exact_matcher.match_document(doc))
+        self.assertEqual(
+            sorted(m['Matched publication id'] for m in matches), [1, 2]
+        )
+
+    def test_same_matches_as_exact_matcher(self):
+        docs = [
+            SectionedDocument("Ebola and\nmalaria are diseases", 1),
+            SectionedDocument("Zika (virus) outbreaks", 2),
+            SectionedDocument("Nothing to see here", 3),
+        ]
+        publications = [
+            {'uber_id': 1, 'title': "Malaria"},
+            {'uber_id': 2, 'title': "Zika virus"},
+            {'uber_id': 3, 'title': "Ebola and malaria"},
+            {'uber_id': 4, 'title': "Yellow fever"},
+            {'uber_id': 5, 'title': "Flu"},
+        ]
+        exact_matcher = ExactMatcher(docs, 4)
+        expected = [
+            match
+            for publication in publications
+            for match in exact_matcher.match(publication)
+        ]
+        ac_matcher = AhoCorasickExactMatcher(publications, 4)
+        found = list(ac_matcher.match_documents(docs))
+
+        key = lambda m: (m['Document id'], m['Matched publication id'])
+        self.assertEqual(sorted(found, key=key), sorted(expected, key=key))
@@ -0,0 +1,216 @@
+import gzip
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+from botocore.exceptions import ClientError
+
+import extract_refs_task
+import refparse.refparse
+from extract_refs_task import ExtractRefsOperator
+
+
+class FakeS3Hook:
+    def __init__(self):
+        self.objects = {}
+        self.etags = {}
+
+    def get_s3_object(self, src_key):
+        return SimpleNamespace(e_tag=self.etags.get(src_key, '"etag"'))
+
+    def get(self, src_key):
+        if src_key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        return io.BytesIO(self.objects[src_key])
+
+    def save(self, body, dst_key):
+        self.objects[dst_key] = body
+
+    def load_file(self, filename, dst_key, replace=False):
+        with open(filename, 'rb') as f:
+            self.objects[dst_key] = f.read()
+
+    def delete_prefix(self, prefix_key):
+        for key in list(self.objects):
+            if key.startswith(prefix_key):
+                del self.objects[key]
+
+
+class Interrupted(Exception):
+    pass
+
+
+def fake_references(num_documents, fail_at=None):
+    def yield_structured_references(src_s3_key, logger, *args,
+                                    skip_documents=0, **kwargs):
+        for i in range(skip_documents, num_documents):
+            if i == fail_at:
+                raise Interrupted()
+            yield {'doc_id': i}, [{'reference_id': i}, {'reference_id': -i}]
+    return yield_structured_references
+
+
+def read_lines(s3, key):
+    return [
+        json.loads(line)
+        for line in gzip.decompress(s3.objects[key]).splitlines()
+    ]
+
+
+def test_resume_after_interruption(monkeypatch):
+    s3 = FakeS3Hook()
+    monkeypatch.setattr(extract_refs_task, 'S3Hook', lambda: s3)
+    operator = ExtractRefsOperator(
+        's3://bucket/src.json.gz',
+        's3://bucket/split.json.gz',
+        's3://bucket/parsed.json.gz',
+        checkpoint_every=3
+    )
+
+    monkeypatch.setattr(
+        refparse.refparse, 'yield_structured_references',
+        fake_references(10, fail_at=7)
+    )
+    with pytest.raises(Interrupted):
+        operator.execute()
+
+    progress = json.loads(
+        s3.objects['s3://bucket/parsed.json.gz.checkpoint/progress.json']
+    )
+    assert (progress['parts'], progress['documents']) == (2, 6)
+    assert 's3://bucket/parsed.json.gz' not in s3.objects
+
+    processed = []
+    resumed = fake_references(10)
+
+    def record_resumed(*args, skip_documents=0, **kwargs):
+        processed.append(skip_documents)
+        return resumed(*args, skip_documents=skip_documents)
+
+    monkeypatch.setattr(
+        refparse.refparse, 'yield_structured_references', record_resumed
+    )
+    operator.execute()
+
+    assert processed == [6]
+    assert read_lines(s3, 's3://bucket/split.json.gz') == \
+        [{'doc_id': i} for i in range(10)]
+    assert [
+        ref['reference_id']
+        for ref in read_lines(s3, 's3://bucket/parsed.json.gz')
+    ] == [j for i in range(10) for j in (i, -i)]
+    # The checkpoint is cleared once the output is uploaded
+    assert sorted(s3.objects) == [
+        's3://bucket/parsed.json.gz', 's3://bucket/split.json.gz'
+    ]
+
+
+def test_checkpoint_of_another_source_is_ignored(monkeypatch):
+    s3 = FakeS3Hook()
+    s3.objects['s3://bucket/parsed.json.gz.checkpoint/progress.json'] = \
+        json.dumps({
+            'src_s3_key': 's3://bucket/other.json.gz',
+            'src_etag': '"etag"',
+            'parts': 1,
+            'documents': 5,
+        }).encode('utf-8')
+    monkeypatch.setattr(extract_refs_task, 'S3Hook', lambda: s3)
+    monkeypatch.setattr(
+        refparse.refparse, 'yield_structured_references', fake_references(4)
+    )
+
+    ExtractRefsOperator(
+        's3://bucket/src.json.gz',
+        's3://bucket/split.json.gz',
+        's3://bucket/parsed.json.gz'
+    ).execute()
+
+    assert read_lines(s3, 's3://bucket/split.json.gz') == \
+        [{'doc_id': i} for i in range(4)]
+
+
+def test_normalized_output(monkeypatch):
+    def yield_structured_references(src_s3_key, logger, *args,
+                                    skip_documents=0, **kwargs):
+        metadata = {'title': 'Document', 'url': 'http://doc'}
+        for section in range(2):
+            yield {'doc_id': 'doc'}, [
+                {'document_id': 'doc', 'document_url': 'http://doc',
+                 'reference_id': 2 * section + i, 'metadata': metadata}
+                for i in range(2)
+            ]
+
+    s3 = FakeS3Hook()
+    monkeypatch.setattr(extract_refs_task, 'S3Hook', lambda: s3)
+    monkeypatch.setattr(
+        refparse.refparse, 'yield_structured_references',
+        yield_structured_references
+    )
+    ExtractRefsOperator(
+        's3://bucket/src.json.gz',
+        's3://bucket/split.json.gz',
+        's3://bucket/parsed.json.gz',
+        normalized_output=True
+    ).execute()
+
+    records = read_lines(s3, 's3://bucket/parsed.json.gz')
+    assert records[0] == {
+        'document_id': 'doc',
+        'document_url': 'http://doc',
+        'document_metadata': {'title': 'Document', 'url': 'http://doc'},
+    }
+    assert [r['reference_id'] for r in records[1:]] == [0, 1, 2, 3]
+    assert not any('metadata' in r for r in records[1:])
+
+
+def test_checkpoint_of_another_version_is_ignored(monkeypatch):
+    s3 = FakeS3Hook()
+    monkeypatch.setattr(extract_refs_task, 'S3Hook', lambda: s3)
+    operator = ExtractRefsOperator(
+        's3://bucket/src.json.gz',
+        's3://bucket/split.json.gz',
+        's3://bucket/parsed.json.gz',
+        checkpoint_every=3
+    )
+    monkeypatch.setattr(
+        refparse.refparse, 'yield_structured_references',
+        fake_references(10, fail_at=7)
+    )
+    with pytest.raises(Interrupted):
+        operator.execute()
+
+    # The scraper published a new source under the same key
+    s3.etags['s3://bucket/src.json.gz'] = '"new-etag"'
+    processed = []
+    resumed = fake_references(4)
+
+    def record_resumed(*args, skip_documents=0, **kwargs):
+        processed.append(skip_documents)
+        return resumed(*args, skip_documents=skip_documents)
+
+    monkeypatch.setattr(
+        refparse.refparse, 'yield_structured_references', record_resumed
+    )
+    operator.execute()
+
+    assert processed == [0]
+    assert read_lines(s3, 's3://bucket/split.json.gz') == \
+        [{'doc_id': i} for i in range(4)]
+
+
+def test_empty_output_is_valid_gzip(monkeypatch):
+    s3 = FakeS3Hook()
+    monkeypatch.setattr(extract_refs_task, 'S3Hook', lambda: s3)
+    monkeypatch.setattr(
+        refparse.refparse, 'yield_structured_references', fake_references(0)
+    )
+
+    ExtractRefsOperator(
+        's3://bucket/src.json.gz',
+        's3://bucket/split.json.gz',
+        's3://bucket/parsed.json.gz'
+    ).execute()
+
+    assert read_lines(s3, 's3://bucket/split.json.gz') == []
+    assert read_lines(s3, 's3://bucket/parsed.json.gz') == []
@@ -1,7 +1,17 @@
+import numpy as np
 import pandas as pd
 import pytest
 from pandas.util.testing import assert_frame_equal
-from refparse.utils import FuzzyMatcher
+from scipy.sparse import csr_matrix
+from sklearn.metrics.pairwise import cosine_similarity
+
+from match_cache import TitleMatchCache
+
+from refparse.utils import (
+    FuzzyMatcher, IncrementalFuzzyMatcher, IncrementalPublicationIndex,
+    ParallelFuzzyMatcher
+)
+from refparse.utils.fuzzy_match import top_k_rows
 
 
 @pytest.fixture
@@ -96,3 +106,354 @@ def test_close_match_reverse(fuzzy_matcher):
 
     matched_publication = fuzzy_matcher.match(reference)
     assert matched_publication is None
+
+
+def brute_force_match(fuzzy_matcher, reference):
+    """Reference implementation: score and fully sort every publication."""
+    title_vector = fuzzy_matcher.vectorizer.transform([reference['Title']])
+    similarities = cosine_similarity(title_vector, fuzzy_matcher.tfidf_matrix)[0]
+    best = sorted(
+        enumerate(similarities), key=lambda item: item[1], reverse=True
+    )[0]
+    return best
+
+def test_match_many_same_as_brute_force():
+    real_publications = [
+        {'title': 'Malaria in Africa', 'pmcid': 0},
+        {'title': 'Zika virus outbreak', 'pmcid': 1},
+        {'title': 'Malaria in Africa', 'pmcid': 2},
+        {'title': 'Ebola outbreak in West Africa', 'pmcid': 3},
+        {'title': 'Treatment of severe malaria', 'pmcid': 4},
+    ]
+    fuzzy_matcher = FuzzyMatcher(real_publications, similarity_threshold=-1)
+    references = [
+        {'Document id': i, 'Reference id': i, 'Title': title}
+        for i, title in enumerate([
+            'Malaria in Africa',
+            'Zika outbreak',
+            'Severe malaria',
+            'Something unrelated',
+            'ebola',
+        ])
+    ]
+    matches = list(fuzzy_matcher.match_many(references, batch_size=2))
+
+    assert len(matches) == len(references)
+    for reference, match in zip(references, matches):
+        index, similarity = brute_force_match(fuzzy_matcher, reference)
+        assert match['Matched title'] == real_publications[index]['title']
+        assert match['Matched publication pmcid'] == index
+        assert match['Similarity'] == pytest.approx(similarity)
+
+def test_match_many_skips_empty_references(fuzzy_matcher):
+    references = [
+        {},
+        {'Document id': 1, 'Reference id': 1, 'Title': 'Malaria'},
+    ]
+    matches = list(fuzzy_matcher.match_many(references))
+    assert matches[0] is None
+    assert matches[1]['Matched title'] == 'Malaria'
+
+def test_best_publications(fuzzy_matcher):
+    results = fuzzy_matcher.best_publications(['Zika', '', 'Dengue'])
+    assert results[0] == ({'title': 'Zika', 'pmcid': 1}, pytest.approx(1))
+    assert results[1:] == [None, None]
+
+def test_search_publications_does_not_mutate(fuzzy_matcher):
+    results = fuzzy_matcher.search_publications({'Title': 'Malaria'})
+    assert [r['title'] for r in results] == ['Malaria', 'Zika']
+    assert 'similarity' not in fuzzy_matcher.publications[0]
+
+def test_top_k_rows_ties():
+    similarities = csr_matrix(np.array([
+        [0.5, 0.9, 0.5, 0.5],
+        [0.0, 0.0, 0.0, 0.0],
+    ]))
+    rows = list(top_k_rows(similarities, 3))
+    assert rows[0][0].tolist() == [1, 0, 2]
+    assert rows[1][0].tolist() == [0, 1, 2]
+    assert rows[1][1].tolist() == [0, 0, 0]
+
+def test_index_cache_dir(tmp_path):
+    real_publications = [
+        {'title': 'Malaria in Africa', 'pmcid': 0},
+        {'title': 'Zika virus outbreak', 'pmcid': 1},
+    ]
+    reference = {'Document id': 1, 'Reference id': 1, 'Title': 'Zika outbreak'}
+
+    fitted = FuzzyMatcher(real_publications, 0.1)
+    saved = FuzzyMatcher(real_publications, 0.1, index_cache_dir=str(tmp_path))
+    loaded = FuzzyMatcher(real_publications, 0.1, index_cache_dir=str(tmp_path))
+
+    assert len(list(tmp_path.iterdir())) == 1
+    # Memory-mapped read only, rather than read into memory
+    assert not loaded.tfidf_matrix.data.flags.writeable
+    assert (loaded.tfidf_matrix != fitted.tfidf_matrix).nnz == 0
+    assert loaded.match(reference) == fitted.match(reference)
+    assert saved.match(reference) == fitted.match(reference)
+
+def test_index_cache_dir_keyed_by_titles(tmp_path):
+    FuzzyMatcher([{'title': 'Malaria'}], index_cache_dir=str(tmp_path))
+    FuzzyMatcher([{'title': 'Zika'}], index_cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 2
+
+def test_parallel_fuzzy_matcher_same_as_serial():
+    real_publications = [
+        {'title': title, 'pmcid': i}
+        for i, title in enumerate([
+            'Malaria in Africa',
+            'Zika virus outbreak',
+            'Malaria in Africa',
+            'Ebola outbreak in West Africa',
+            'Treatment of severe malaria',
+            'Global burden of disease',
+            'Zika virus',
+        ])
+    ]
+    references = [
+        {'Document id': i, 'Reference id': i, 'Title': title}
+        for i, title in enumerate([
+            'Malaria in Africa',
+            'Zika outbreak',
+            'Severe malaria',
+            'Something unrelated',
+            'Burden of disease',
+        ])
+    ]
+    serial = FuzzyMatcher(real_publications, similarity_threshold=-1)
+    expected = list(serial.match_many(references))
+    with ParallelFuzzyMatcher(
+            real_publications, similarity_threshold=-1, num_workers=3
+            ) as parallel:
+        assert len(parallel.shards) > 1
+        assert list(parallel.match_many(references, batch_size=2)) == expected
+        assert parallel.search_publications({'Title': 'Zika virus'}) == \
+            serial.search_publications({'Title': 'Zika virus'})
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        FuzzyMatcher([{'title': 'Malaria'}], engine='quantum')
+
+def test_lsh_engine_same_as_brute_force():
+    real_publications = [
+        {'title': title, 'pmcid': i}
+        for i, title in enumerate([
+            'Malaria in sub saharan Africa a systematic review',
+            'Zika virus outbreak in Brazil and the Americas',
+            'Ebola outbreak in West Africa lessons learned',
+            'Treatment of severe malaria in children',
+            'Global burden of disease study 2010',
+        ])
+    ]
+    references = [
+        {'Document id': i, 'Reference id': i, 'Title': title}
+        for i, title in enumerate([
+            'Malaria in sub saharan Africa: a systematic review',
+            'Treatment of severe malaria in young children',
+            'Something entirely unrelated',
+            '',
+        ])
+    ]
+    brute_force = FuzzyMatcher(real_publications, 0.5)
+    lsh = FuzzyMatcher(real_publications, 0.5, engine='lsh')
+
+    expected = list(brute_force.match_many(references))
+    found = list(lsh.match_many(references))
+    assert [m and m['Matched publication pmcid'] for m in found] == [0, 3, None, None]
+    for expected_match, found_match in zip(expected, found):
+        if expected_match:
+            assert found_match['Similarity'] == pytest.approx(
+                expected_match['Similarity']
+            )
+        else:
+            assert found_match is None
+
+def test_parallel_lsh_engine_same_as_serial():
+    real_publications = [
+        {'title': title, 'pmcid': i}
+        for i, title in enumerate([
+            'Malaria in sub saharan Africa a systematic review',
+            'Zika virus outbreak in Brazil and the Americas',
+            'Malaria in sub saharan Africa a systematic review',
+            'Ebola outbreak in West Africa lessons learned',
+            'Treatment of severe malaria in children',
+            'Global burden of disease study 2010',
+        ])
+    ]
+    references = [
+        {'Document id': i, 'Reference id': i, 'Title': title}
+        for i, title in enumerate([
+            'Malaria in sub saharan Africa: a systematic review',
+            'Treatment of severe malaria in young children',
+            'Something entirely unrelated',
+            'Global burden of disease study 2010',
+        ])
+    ]
+    serial = FuzzyMatcher(real_publications, 0.5, engine='lsh')
+    with ParallelFuzzyMatcher(
+            real_publications, 0.5, num_workers=3, engine='lsh'
+            ) as parallel:
+        assert parallel.lsh is not None
+        assert len(parallel.shards) > 1
+        assert list(parallel.match_many(references, batch_size=2)) == \
+            list(serial.match_many(references))
+
+def test_lsh_query_empty_rows():
+    fuzzy_matcher = FuzzyMatcher(
+        [{'title': 'Malaria in Africa'}, {'title': 'Zika virus'}],
+        engine='lsh'
+    )
+    title_matrix = fuzzy_matcher.vectorizer.transform(['', 'Zika virus'])
+    candidates = fuzzy_matcher.lsh.query(title_matrix)
+    assert candidates[0].tolist() == []
+    assert candidates[1].tolist() == [1]
+
+INCREMENTAL_PUBLICATIONS = [
+    {'title': title, 'uber_id': 'pub%d' % i}
+    for i, title in enumerate([
+        'Malaria in Africa',
+        'Zika virus outbreak',
+        'Ebola outbreak in West Africa',
+        'Treatment of severe malaria',
+    ])
+]
+INCREMENTAL_REFERENCES = [
+    {'Document id': i, 'Reference id': i, 'Title': title}
+    for i, title in enumerate([
+        'Malaria in Africa',
+        'Zika outbreak',
+        'Severe malaria',
+        'Global burden of disease',
+    ])
+]
+
+def assert_same_matches(found, expected):
+    for found_match, expected_match in zip(found, expected):
+        assert (found_match is None) == (expected_match is None)
+        if expected_match:
+            assert found_match['Matched publication id'] == \
+                expected_match['Matched publication id']
+            assert found_match['Similarity'] == pytest.approx(
+                expected_match['Similarity']
+            )
+
+def test_incremental_index_same_as_refit():
+    index = IncrementalPublicationIndex(INCREMENTAL_PUBLICATIONS[:2])
+    index.add_publications(INCREMENTAL_PUBLICATIONS[2:])
+    incremental = IncrementalFuzzyMatcher(index, similarity_threshold=0.1)
+
+    refit = FuzzyMatcher(INCREMENTAL_PUBLICATIONS, similarity_threshold=0.1)
+    assert_same_matches(
+        list(incremental.match_many(INCREMENTAL_REFERENCES)),
+        list(refit.match_many(INCREMENTAL_REFERENCES))
+    )
+
+def test_incremental_index_remove_and_replace():
+    index = IncrementalPublicationIndex(INCREMENTAL_PUBLICATIONS)
+    incremental = IncrementalFuzzyMatcher(index, similarity_threshold=0.1)
+
+    assert index.remove_publications(['pub3', 'unknown']) == 1
+    index.add_publications([
+        {'title': 'Global burden of disease', 'uber_id': 'pub0'}
+    ])
+    assert len(index) == 3
+
+    remaining = [
+        {'title': 'Zika virus outbreak', 'uber_id': 'pub1'},
+        {'title': 'Ebola outbreak in West Africa', 'uber_id': 'pub2'},
+        {'title': 'Global burden of disease', 'uber_id': 'pub0'},
+    ]
+    refit = FuzzyMatcher(remaining, similarity_threshold=0.1)
+    assert_same_matches(
+        list(incremental.match_many(INCREMENTAL_REFERENCES)),
+        list(refit.match_many(INCREMENTAL_REFERENCES))
+    )
+
+def test_incremental_index_deltas(tmp_path):
+    index_dir = str(tmp_path / 'index')
+    index = IncrementalPublicationIndex(INCREMENTAL_PUBLICATIONS[:2])
+    index.save(index_dir)
+
+    index.add_publications(INCREMENTAL_PUBLICATIONS[2:])
+    index.remove_publications(['pub1'])
+    assert index.flush(index_dir) is not None
+    assert index.flush(index_dir) is None
+    deltas_dir = tmp_path / 'index' / 'snapshot-00000001' / 'deltas'
+    assert len(list(deltas_dir.iterdir())) == 1
+
+    loaded = IncrementalPublicationIndex.load(index_dir)
+    assert len(loaded) == 3
+    assert (loaded.df == index.df).all()
+    assert_same_matches(
+        list(IncrementalFuzzyMatcher(loaded, 0.1).match_many(
+            INCREMENTAL_REFERENCES
+        )),
+        list(IncrementalFuzzyMatcher(index, 0.1).match_many(
+            INCREMENTAL_REFERENCES
+        ))
+    )
+
+    loaded.compact(index_dir)
+    assert sorted(p.name for p in (tmp_path / 'index').iterdir()) == \
+        ['CURRENT', 'snapshot-00000002']
+    assert not (tmp_path / 'index' / 'snapshot-00000002' / 'deltas').exists()
+    assert len(IncrementalPublicationIndex.load(index_dir)) == 3
+
+def test_incremental_index_interrupted_save(tmp_path, monkeypatch):
+    index_dir = str(tmp_path / 'index')
+    index = IncrementalPublicationIndex(INCREMENTAL_PUBLICATIONS[:2])
+    index.save(index_dir)
+    index.add_publications(INCREMENTAL_PUBLICATIONS[2:3])
+    index.flush(index_dir)
+
+    # Interrupted once the new snapshot is written, but before it's used
+    def interrupted(src, dst):
+        raise KeyboardInterrupt()
+    monkeypatch.setattr('refparse.utils.incremental_fuzzy_match.os.replace',
+                        interrupted)
+    index.add_publications(INCREMENTAL_PUBLICATIONS[3:])
+    with pytest.raises(KeyboardInterrupt):
+        index.compact(index_dir)
+    monkeypatch.undo()
+
+    # The previous base and its delta are still used...
+    assert len(IncrementalPublicationIndex.load(index_dir)) == 3
+    # ...until the next save, which cleans up the interrupted one.
+    index.save(index_dir)
+    assert len(IncrementalPublicationIndex.load(index_dir)) == 4
+    assert sorted(p.name for p in (tmp_path / 'index').iterdir()) == \
+        ['CURRENT', 'snapshot-00000003']
+
+def test_match_cache(tmp_path):
+    real_publications = [
+        {'title': 'Malaria in Africa', 'pmcid': 0},
+        {'title': 'Zika virus outbreak', 'pmcid': 1},
+    ]
+    references = [
+        {'Document id': i, 'Reference id': i, 'Title': title}
+        for i, title in enumerate([
+            'Zika outbreak',
+            'Zika outbreak.',
+            'Malaria in Africa',
+        ])
+    ]
+    expected = list(
+        FuzzyMatcher(real_publications, 0.1).match_many(references)
+    )
+
+    with TitleMatchCache(cache_dir=str(tmp_path)) as match_cache:
+        fuzzy_matcher = FuzzyMatcher(
+            real_publications, 0.1, match_cache=match_cache
+        )
+        assert list(fuzzy_matcher.match_many(references)) == expected
+        assert match_cache.misses == 3
+        assert match_cache.hits == 0
+
+    # A rerun only reads the on-disk tier
+    with TitleMatchCache(cache_dir=str(tmp_path)) as match_cache:
+        fuzzy_matcher = FuzzyMatcher(
+            real_publications, 0.1, match_cache=match_cache
+        )
+        fuzzy_matcher._search_titles = None
+        assert list(fuzzy_matcher.match_many(references)) == expected
+        assert match_cache.hits == 3
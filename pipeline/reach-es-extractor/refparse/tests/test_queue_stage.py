@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from refparse.utils import QueueStage
+
+
+def test_items_pass_in_order():
+    stage = QueueStage('numbers', iter(range(100)), maxsize=4)
+    assert list(stage) == list(range(100))
+
+    stats = stage.stats()
+    assert stats['items'] == 100
+    assert stats['max_depth'] <= 4
+
+
+def test_stages_chain():
+    first = QueueStage('first', range(10), maxsize=2)
+    second = QueueStage('second', (i * 2 for i in first), maxsize=2)
+    assert list(second) == [i * 2 for i in range(10)]
+
+
+def test_errors_are_raised_to_the_consumer():
+    def failing():
+        yield 1
+        raise ValueError('boom')
+
+    stage = QueueStage('failing', failing())
+    with pytest.raises(ValueError):
+        list(stage)
+
+
+def test_close_stops_the_producer():
+    produced = []
+
+    def endless():
+        i = 0
+        while True:
+            produced.append(i)
+            yield i
+            i += 1
+
+    stage = QueueStage('endless', endless(), maxsize=2)
+    for item in stage:
+        if item == 3:
+            break
+    stage.close()
+
+    assert not stage.thread.is_alive()
+    assert len(produced) <= 3 + 2 + 2
+
+
+def test_slow_consumer_makes_the_producer_wait():
+    stage = QueueStage('fast', range(5), maxsize=1)
+    for _ in stage:
+        time.sleep(0.05)
+
+    assert stage.stats()['put_wait'] > stage.stats()['get_wait']
@@ -0,0 +1,133 @@
+import gzip
+import json
+import logging
+from functools import partial
+
+import pandas as pd
+
+import refparse.refparse
+from refparse.refparse import (
+    read_scraper_file, refparse as run_refparse, transform_scraper_rows
+)
+from refparse.utils import FileManager, SplitParsePool
+from refparse.tests.test_split_parse_pool import create_fake_split_parser
+
+TITLE = 'Malaria treatment guidelines for children under five years old'
+
+ROWS = [
+    {
+        'file_hash': 'doc0',
+        'url': 'http://doc/0',
+        'title': 'Document 0',
+        'sections': {'reference': [
+            TITLE + ' Smith et al. 2019\nOther reference Jones 2018',
+        ]},
+        'text': 'As shown in ' + TITLE + ', children...',
+        'pdf_metadata': {'author': 'WHO'},
+        'unused': 'x' * 1000,
+    },
+    {
+        'file_hash': 'doc1',
+        'url': 'http://doc/1',
+        'title': 'Document 1',
+        'sections': None,
+        'text': 'A document citing ' + TITLE,
+    },
+]
+
+
+def write_scraper_file(path):
+    with gzip.open(str(path), 'wt') as f:
+        for row in ROWS:
+            f.write(json.dumps(row) + '\n')
+        f.write('\n')
+
+
+def test_read_scraper_file_projects_columns(tmpdir):
+    path = tmpdir.join('scraper-results.json.gz')
+    write_scraper_file(path)
+
+    rows = list(read_scraper_file(str(path), ['file_hash', 'sections']))
+
+    assert rows == [
+        {'file_hash': 'doc0', 'sections': ROWS[0]['sections']},
+        {'file_hash': 'doc1', 'sections': None},
+    ]
+
+
+def test_transform_scraper_rows():
+    text_documents = []
+    documents = list(transform_scraper_rows(ROWS, text_documents))
+
+    assert [doc.id for doc in documents] == ['doc0']
+    assert documents[0].section == ROWS[0]['sections']['reference'][0]
+    assert 'text' not in documents[0].metadata
+    assert 'sections' not in documents[0].metadata
+    assert [doc.id for doc in text_documents] == ['doc0', 'doc1']
+    assert text_documents[0].metadata == {'author': 'WHO'}
+
+
+def test_refparse_reads_scraper_file_once(tmpdir, monkeypatch):
+    scraper_path = tmpdir.join('scraper-results.json.gz')
+    write_scraper_file(scraper_path)
+    publications_path = tmpdir.join('publications.csv')
+    pd.DataFrame([
+        {'title': TITLE, 'uber_id': 'pub0'},
+        {'title': 'An unrelated publication about something else',
+         'uber_id': 'pub1'},
+    ]).to_csv(str(publications_path), index=False)
+
+    reads = []
+
+    def counting_read_scraper_file(*args, **kwargs):
+        reads.append(args)
+        return read_scraper_file(*args, **kwargs)
+
+    monkeypatch.setattr(
+        refparse.refparse, 'read_scraper_file', counting_read_scraper_file
+    )
+    monkeypatch.setattr(
+        refparse.refparse, 'SplitParsePool',
+        partial(SplitParsePool, parser_factory=create_fake_split_parser)
+    )
+    monkeypatch.setattr(
+        refparse.refparse.settings, 'SECTION_FILTER_THRESHOLD', 0
+    )
+
+    run_refparse(
+        str(scraper_path), str(publications_path), str(tmpdir),
+        logging.getLogger(__name__)
+    )
+
+    assert len(reads) == 1
+    with open(str(tmpdir.join('structured_references.json'))) as f:
+        structured = [json.loads(line) for line in f]
+    assert [ref['document_id'] for ref in structured] == ['doc0', 'doc0']
+    with open(str(tmpdir.join('exact_matched_references.json'))) as f:
+        exact = [json.loads(line) for line in f]
+    assert [match['Document id'] for match in exact] == ['doc0', 'doc1']
+
+
+class FakeS3:
+    def __init__(self, objects):
+        self.objects = objects
+        self.fetched = []
+
+    def get(self, key, temp_file):
+        self.fetched.append(key)
+        temp_file.write(self.objects[key])
+
+
+def test_yield_scraping_results_downloads_from_s3(tmpdir):
+    path = tmpdir.join('scraper-results.json.gz')
+    write_scraper_file(path)
+    file_manager = FileManager()
+    file_manager.mode = 'S3'
+    file_manager.s3 = FakeS3({'prefix/results.json.gz': path.read_binary()})
+
+    rows = list(file_manager.yield_scraping_results(
+        'results.json.gz', 'prefix', ['file_hash']
+    ))
+
+    assert file_manager.s3.fetched == ['prefix/results.json.gz']
+    assert rows == [{'file_hash': 'doc0'}, {'file_hash': 'doc1'}]
@@ -0,0 +1,68 @@
+import pandas as pd
+
+from refparse.algo_evaluation.evaluate_section_filter import (
+    evaluate_section_filter
+)
+from refparse.utils import SectionFilter
+from refparse.utils.section_filter import citation_density
+
+REFERENCES = '\n'.join([
+    'Smith J, Jones K, et al. Malaria in children. Lancet. '
+    '2015;385(9966):123-9. doi:10.1016/S0140-6736(14)61682-2',
+    'World Health Organization. World malaria report 2018. Geneva: WHO; '
+    '2018. pp. 12-30.',
+    'Brown A. Vaccines and the poor. Health Policy 2009a; vol. 4: 55-60.',
+])
+
+PROSE = (
+    'This section describes the recommendations of the guideline '
+    'committee for the management of uncomplicated malaria in children '
+    'and the actions health workers should take at each visit. '
+) * 5
+
+TABLE = 'Region | Cases | Deaths\nAfrica | 1200 | 30\nAsia | 800 | 12\n' * 10
+
+
+def test_citation_density():
+    densities = citation_density([REFERENCES, PROSE, TABLE, None])
+    assert densities[0] > 10
+    assert list(densities[1:]) == [0, 0, 0]
+
+
+def test_markers_ignore_case():
+    text = 'SMITH J, ET AL. Malaria. VOL. 12, PP. 3-4. ' * 20
+    assert citation_density([text])[0] == \
+        citation_density([text.lower()])[0]
+
+
+def test_filter_many_skips_sections_without_references():
+    section_filter = SectionFilter(threshold=1.0, batch_size=2)
+    texts = [REFERENCES, PROSE, TABLE, REFERENCES, PROSE]
+    results = list(section_filter.filter_many(texts))
+
+    assert [text for text, _ in results] == texts
+    assert [keep for _, keep in results] == [True, False, False, True, False]
+    assert section_filter.kept == 2
+    assert section_filter.skipped == 3
+
+
+def test_short_sections_need_several_markers():
+    section_filter = SectionFilter(threshold=3.0, min_chars=500)
+    assert section_filter.keep(['Published in 2015.', REFERENCES[:200]]) \
+        == [False, True]
+
+
+def test_evaluate_section_filter():
+    data = pd.DataFrame({
+        'hash': ['a', 'b', 'c'],
+        'Source': ['who', 'who', 'nice'],
+        'Reference section': [REFERENCES, PROSE, REFERENCES],
+        'Number of references scraped': [3, 1, 6],
+    })
+    metrics = evaluate_section_filter(data, 1.0, thresholds=[0, 1.0])
+
+    assert metrics['Number of sections skipped'] == 1
+    assert metrics['Proportion of references kept'] == 0.9
+    assert list(metrics['Skipped sections']['hash']) == ['b']
+    assert metrics['Metrics by threshold'].loc[0].tolist() == [1.0, 1.0]
+    assert metrics['Metrics by threshold'].loc[1.0].tolist() == [0.667, 0.9]
@@ -0,0 +1,60 @@
+import pytest
+
+from refparse.utils import merge_window_predictions, split_windows
+
+
+def predictions(*references):
+    return [{'Reference': reference} for reference in references]
+
+
+def test_short_section_is_one_window():
+    assert list(split_windows('a\nb\n', 100, 10)) == [('a\nb\n', True)]
+
+
+def test_windows_end_on_lines_and_overlap():
+    lines = ['line %02d' % i for i in range(40)]
+    text = '\n'.join(lines) + '\n'
+    windows = list(split_windows(text, 50, 20))
+
+    assert [is_last for _, is_last in windows] == \
+        [False] * (len(windows) - 1) + [True]
+    for window, _ in windows:
+        assert len(window) <= 50
+        assert window.endswith('\n')
+    for line in lines:
+        assert any(line + '\n' in window for window, _ in windows)
+    # Consecutive windows share their boundary lines
+    for (previous, _), (window, _) in zip(windows, windows[1:]):
+        assert window.split('\n')[0] in previous
+
+
+def test_long_lines_are_cut():
+    windows = list(split_windows('x' * 250, 100, 10))
+    assert ''.join(window for window, _ in windows) == 'x' * 250
+
+
+@pytest.mark.parametrize('window_chars, overlap_chars', [
+    (100, 100),
+    (100, 150),
+    (100, -1),
+    (0, 0),
+])
+def test_invalid_windows_are_rejected(window_chars, overlap_chars):
+    # Even for short texts, so that bad settings are caught early
+    with pytest.raises(ValueError):
+        list(split_windows('a\nb\n', window_chars, overlap_chars))
+
+
+def test_merge_drops_boundary_duplicates():
+    whole = 'Smith J. Malaria in Africa. Lancet 2010'
+    merged = merge_window_predictions([
+        predictions('First reference of the section', whole[:25]),
+        predictions(whole, 'Jones K. Zika virus outbreak. 2016'),
+        predictions('Zika virus outbreak. 2016', 'Last reference'),
+    ])
+    assert [p['Reference'] for p in merged] == [
+        'First reference of the section',
+        whole,
+        'Jones K. Zika virus outbreak. 2016',
+        'Last reference',
+    ]
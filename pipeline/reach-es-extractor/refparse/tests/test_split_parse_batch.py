@@ -0,0 +1,62 @@
+from refparse.tests.test_split_parse_pool import FakeSplitParser
+from refparse.utils.split_parse_batch import (
+    split_parse_texts, tokens_to_references
+)
+
+
+def test_tokens_to_references():
+    tokens = [
+        'See', ':', '\n', 'Smith', 'J', '.', 'Malaria', '\n', '2010',
+        'Jones', 'A', '.', 'Zika', 'Moore', 'B', 'Ebola', '.', 'Thanks',
+    ]
+    split_labels = [
+        'o', 'o', 'o', 'b-r', 'i-r', 'i-r', 'i-r', 'o', 'e-r',
+        'b-r', 'i-r', 'i-r', 'i-r', 'b-r', 'i-r', 'i-r', 'e-r', 'o',
+    ]
+    parse_labels = [
+        'o', 'o', 'o', 'author', 'author', 'o', 'title', 'o', 'year',
+        'author', 'author', 'o', 'title', 'author', 'author', 'title',
+        'o', 'o',
+    ]
+
+    references = tokens_to_references(tokens, split_labels, parse_labels)
+
+    assert [reference['Reference'] for reference in references] == [
+        'Smith J . Malaria 2010',
+        'Jones A . Zika',
+        'Moore B Ebola .',
+    ]
+    assert references[0]['Attributes'] == [
+        ('Smith', 'author'), ('J', 'author'), ('.', 'o'),
+        ('Malaria', 'title'), ('2010', 'year'),
+    ]
+
+
+def test_references_inside_without_beginning():
+    references = tokens_to_references(
+        ['Smith', 'Malaria', 'Thanks'], ['i-r', 'e-r', 'o'],
+        ['author', 'title', 'o']
+    )
+    assert [reference['Reference'] for reference in references] == \
+        ['Smith Malaria']
+
+
+def test_split_parse_texts_scatters_chunks():
+    split_parser = FakeSplitParser()
+    texts = [
+        'Title0 Author\nTitle1 Author\nTitle2 Author',
+        None,
+        '',
+        'Title3 Author',
+    ]
+
+    predictions = split_parse_texts(split_parser, texts, predict_batch_size=2)
+
+    assert [
+        [reference['Reference'] for reference in text_predictions]
+        for text_predictions in predictions
+    ] == [
+        ['Title0 Author', 'Title1 Author', 'Title2 Author'], [], [],
+        ['Title3 Author'],
+    ]
+    assert split_parser.predict_calls == [2, 1]
@@ -0,0 +1,68 @@
+from refparse.refparse import reference_id
+from refparse.utils import (
+    CachedSplitParsePool, SplitParseCache, SplitParsePool
+)
+from refparse.utils.split_parse_cache import content_hash
+from refparse.tests.test_split_parse_pool import create_fake_split_parser
+
+
+class CountingPool:
+    def __init__(self, pool):
+        self.pool = pool
+        self.parsed = []
+
+    def split_parse_many(self, items, text):
+        def record(item):
+            item_text = text(item)
+            if item_text is not None:
+                self.parsed.append(item_text)
+            return item_text
+        return self.pool.split_parse_many(items, record)
+
+
+def test_content_hash_is_stable():
+    assert content_hash('a', 'b') == content_hash('a', 'b')
+    assert content_hash('a', 'b') != content_hash('ab')
+
+
+def test_reference_id_is_stable():
+    assert reference_id('Smith J. Malaria. 2019') == 0xe9f7b59d0476aeb
+    assert reference_id('Smith J. Malaria. 2019') < 2 ** 60
+
+
+def test_cache_round_trip(tmpdir):
+    cache = SplitParseCache('v1', str(tmpdir))
+    predictions = [{'Reference': 'Title A', 'Attributes': [['Title', 'title']]}]
+
+    assert cache.get('Title A') is None
+    cache.put('Title A', predictions)
+    assert cache.get('Title A') == predictions
+    assert SplitParseCache('v1', str(tmpdir)).get('Title A') == predictions
+    # Predictions of another model aren't reused
+    assert SplitParseCache('v2', str(tmpdir)).get('Title A') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cached_pool_only_parses_new_texts(tmpdir):
+    texts = ['Title1 Author', 'Title2 Author\nTitle3 Author', None]
+
+    with SplitParsePool(parser_factory=create_fake_split_parser) as pool:
+        first = CountingPool(pool)
+        first_results = list(CachedSplitParsePool(
+            first, SplitParseCache('v1', str(tmpdir))
+        ).split_parse_many(texts))
+
+        second = CountingPool(pool)
+        second_results = list(CachedSplitParsePool(
+            second, SplitParseCache('v1', str(tmpdir))
+        ).split_parse_many(texts + ['Title4 Author']))
+
+    assert first.parsed == texts[:2]
+    assert second.parsed == ['Title4 Author']
+    assert [len(p) for _, p in first_results] == [1, 2, 0]
+    assert [len(p) for _, p in second_results] == [1, 2, 0, 1]
+    assert [
+        [r['Reference'] for r in p] for _, p in second_results[:3]
+    ] == [
+        [r['Reference'] for r in p] for _, p in first_results
+    ]
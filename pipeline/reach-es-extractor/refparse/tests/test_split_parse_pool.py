@@ -0,0 +1,169 @@
+import logging
+from collections import namedtuple
+
+import pytest
+
+from refparse.refparse import (
+    _yield_structured_references, yield_document_predictions
+)
+from refparse.settings import settings
+from refparse.utils import SectionFilter, SplitParsePool
+from refparse.utils.split_parse_pool import pack_batches
+
+
+class FakeSplitParser:
+    """
+    Splits one reference per line, with the first word as title. Texts
+    are cut in chunks of two lines.
+    """
+    def __init__(self):
+        # Number of chunks of each call of predict
+        self.predict_calls = []
+
+    def tokenize(self, text):
+        lines = [
+            line.split() + ['\n'] for line in text.splitlines()
+            if line.strip()
+        ]
+        return [sum(lines[i:i + 2], []) for i in range(0, len(lines), 2)]
+
+    def predict(self, chunks):
+        self.predict_calls.append(len(chunks))
+        labels = []
+        for chunk in chunks:
+            split_labels, parse_labels = [], []
+            line_start = True
+            for token in chunk:
+                if token == '\n':
+                    split_labels.append('o')
+                    parse_labels.append('o')
+                    line_start = True
+                    continue
+                split_labels.append('b-r' if line_start else 'i-r')
+                parse_labels.append('title' if line_start else 'author')
+                line_start = False
+            labels.append((split_labels, parse_labels))
+        return labels
+
+
+def create_fake_split_parser():
+    return FakeSplitParser()
+
+
+Document = namedtuple('Document', ['section', 'uri', 'id', 'metadata'])
+
+DOCUMENTS = [
+    Document(
+        '\n'.join('Title%d_%d Author' % (i, j) for j in range(i % 4)),
+        'http://doc/%d' % i,
+        'doc%d' % i,
+        {'title': 'Document %d' % i}
+    )
+    for i in range(20)
+]
+
+
+@pytest.mark.parametrize('num_workers,batch_size', [(1, 1), (3, 1), (3, 4)])
+def test_split_parse_many_in_order(num_workers, batch_size):
+    with SplitParsePool(
+            num_workers, max_pending=4,
+            parser_factory=create_fake_split_parser,
+            batch_size=batch_size, max_batch_chars=30) as pool:
+        results = list(pool.split_parse_many(
+            DOCUMENTS, lambda doc: doc.section
+        ))
+
+    assert [doc for doc, _ in results] == DOCUMENTS
+    assert [
+        [reference['Reference'] for reference in predictions]
+        for _, predictions in results
+    ] == [doc.section.splitlines() for doc in DOCUMENTS]
+
+
+def test_sections_share_model_calls():
+    split_parser = FakeSplitParser()
+    with SplitParsePool(
+            parser_factory=lambda: split_parser, batch_size=8,
+            max_batch_chars=10000, predict_batch_size=5) as pool:
+        results = list(pool.split_parse_many(
+            DOCUMENTS, lambda doc: doc.section
+        ))
+
+    assert [
+        [reference['Reference'] for reference in predictions]
+        for _, predictions in results
+    ] == [doc.section.splitlines() for doc in DOCUMENTS]
+    # The 15 documents with references have 20 chunks, run through the
+    # model 5 at a time within each batch of 8 documents.
+    assert split_parser.predict_calls == [5, 3, 5, 3, 4]
+
+
+def test_yield_structured_references():
+    with SplitParsePool(parser_factory=create_fake_split_parser) as pool:
+        results = list(_yield_structured_references(
+            pool, DOCUMENTS, logging.getLogger(__name__)
+        ))
+
+    split_references, structured_references = results[3]
+    assert split_references['doc_id'] == 'doc3'
+    assert len(structured_references) == 3
+    assert structured_references[0]['Title'] == 'Title3_0'
+    assert structured_references[0]['document_id'] == 'doc3'
+
+
+def test_pack_batches():
+    texts = ['aaaa', 'bb', 'cccccccc', 'd', 'e', 'f']
+    batches = [
+        [text for _, text in batch]
+        for batch in pack_batches(texts, lambda text: text, 2, 6)
+    ]
+    assert batches == [['aaaa', 'bb'], ['cccccccc'], ['d', 'e'], ['f']]
+
+
+class RecordingPool:
+    def __init__(self, pool):
+        self.pool = pool
+        self.texts = []
+
+    def split_parse_many(self, items, text):
+        def record(item):
+            self.texts.append(text(item))
+            return text(item)
+        return self.pool.split_parse_many(items, record)
+
+
+def test_long_sections_parsed_in_windows(monkeypatch):
+    monkeypatch.setattr(settings, 'SPLIT_PARSE_WINDOW_CHARS', 200)
+    monkeypatch.setattr(settings, 'SPLIT_PARSE_WINDOW_OVERLAP_CHARS', 60)
+    lines = ['Title%d Author et al. 2019' % i for i in range(50)]
+    document = Document('\n'.join(lines), 'http://doc', 'doc', {})
+
+    with SplitParsePool(parser_factory=create_fake_split_parser) as pool:
+        windowed_pool = RecordingPool(pool)
+        [(doc, predictions)] = list(
+            yield_document_predictions(windowed_pool, [document])
+        )
+
+    assert max(len(text) for text in windowed_pool.texts) <= 200
+    assert len(windowed_pool.texts) > 1
+    assert [p['Reference'] for p in predictions] == lines
+
+
+def test_skipped_sections_are_not_parsed():
+    documents = [
+        Document('Title0 Author et al. 2019\nTitle1 Author 2018', 'u0', 'd0', {}),
+        Document('Some prose without any citation.', 'u1', 'd1', {}),
+        Document('Title2 Author, Lancet 2015;12(3):45-7', 'u2', 'd2', {}),
+    ]
+    section_filter = SectionFilter(threshold=1.0, batch_size=2)
+
+    with SplitParsePool(parser_factory=create_fake_split_parser) as pool:
+        recording_pool = RecordingPool(pool)
+        results = list(yield_document_predictions(
+            recording_pool, documents, section_filter
+        ))
+
+    assert [doc for doc, _ in results] == documents
+    assert [len(predictions) for _, predictions in results] == [2, 0, 1]
+    assert recording_pool.texts[1] is None
+    assert section_filter.skipped == 1
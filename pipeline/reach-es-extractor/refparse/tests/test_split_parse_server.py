@@ -0,0 +1,85 @@
+import logging
+import threading
+
+import pytest
+
+from refparse.refparse import parse_sectioned_documents
+from refparse.split_parse_server import SplitParseServer
+from refparse.tests.test_split_parse_pool import DOCUMENTS, FakeSplitParser
+from refparse.utils import SplitParseClient, SplitParseServerError
+
+
+class FailingSplitParser(FakeSplitParser):
+    def predict(self, chunks):
+        raise RuntimeError('out of memory')
+
+
+def serve(split_parser):
+    server = SplitParseServer(('127.0.0.1', 0), split_parser, 'fake-1')
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d' % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def server_url():
+    yield from serve(FakeSplitParser())
+
+
+@pytest.fixture
+def failing_server_url():
+    yield from serve(FailingSplitParser())
+
+
+def test_client_split_parse_many(server_url):
+    client = SplitParseClient(server_url, batch_size=3, max_batch_chars=30)
+    texts = [doc.section for doc in DOCUMENTS] + [None]
+    results = list(client.split_parse_many(texts))
+
+    assert client.model_version() == 'fake-1'
+    assert [text for text, _ in results] == texts
+    assert [
+        [reference['Reference'] for reference in predictions]
+        for _, predictions in results
+    ] == [text.splitlines() for text in texts[:-1]] + [[]]
+
+
+def test_parse_sectioned_documents_with_server(server_url, tmpdir,
+                                               monkeypatch):
+    monkeypatch.setattr(
+        'refparse.refparse.settings.SECTION_FILTER_THRESHOLD', 0
+    )
+    results = list(parse_sectioned_documents(
+        DOCUMENTS, logging.getLogger(__name__),
+        split_parse_cache_dir=str(tmpdir),
+        split_parse_url=server_url
+    ))
+
+    split_references, structured_references = results[3]
+    assert split_references['doc_id'] == 'doc3'
+    assert [ref['Title'] for ref in structured_references] == \
+        ['Title3_0', 'Title3_1', 'Title3_2']
+    # Predictions are cached for the model the server runs
+    assert tmpdir.listdir()
+
+
+def test_client_raises_server_errors(failing_server_url):
+    client = SplitParseClient(failing_server_url)
+
+    with pytest.raises(SplitParseServerError) as exc_info:
+        list(client.split_parse_many(['Smith J. Title']))
+    assert exc_info.value.status == 500
+    assert 'out of memory' in exc_info.value.error
+
+    # The server keeps answering after an error
+    assert client.model_version() == 'fake-1'
+
+
+def test_client_raises_bad_requests(server_url):
+    client = SplitParseClient(server_url)
+
+    with pytest.raises(SplitParseServerError) as exc_info:
+        client._request('/split_parse', {'sections': []})
+    assert exc_info.value.status == 400
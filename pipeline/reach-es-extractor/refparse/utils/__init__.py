@@ -1,14 +1,40 @@
 from .parse import structure_reference
 from .fuzzy_match import FuzzyMatcher
+from .parallel_fuzzy_match import ParallelFuzzyMatcher
+from .incremental_fuzzy_match import (
+    IncrementalFuzzyMatcher, IncrementalPublicationIndex
+)
 from .file_manager import FileManager
+from .split_parse_pool import SplitParsePool
+from .split_parse_client import SplitParseClient, SplitParseServerError
+from .split_parse_cache import (
+    CachedSplitParsePool, SplitParseCache, split_parse_model_version
+)
+from .section_filter import SectionFilter
+from .queue_stage import QueueStage
+from .section_windows import split_windows, merge_window_predictions
 from .serialiser import serialise_matched_reference, serialise_reference
-from .exact_match import ExactMatcher
+from .exact_match import ExactMatcher, AhoCorasickExactMatcher
 
 __all__ = [
     structure_reference,
     FuzzyMatcher,
+    ParallelFuzzyMatcher,
+    IncrementalFuzzyMatcher,
+    IncrementalPublicationIndex,
     FileManager,
+    SplitParsePool,
+    SplitParseClient,
+    SplitParseServerError,
+    SplitParseCache,
+    CachedSplitParsePool,
+    split_parse_model_version,
+    SectionFilter,
+    QueueStage,
+    split_windows,
+    merge_window_predictions,
     serialise_matched_reference,
     serialise_reference,
-    ExactMatcher
+    ExactMatcher,
+    AhoCorasickExactMatcher
 ]
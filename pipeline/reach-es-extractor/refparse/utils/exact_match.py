@@ -1,5 +1,36 @@
 import re
 
+import ahocorasick
+
+
+def clean_text(string):
+  """
+  Input:
+  -A string
+  Output:
+  -A string, with white space normalised and
+   non-alphanumeric characters removed
+  Cleans up text such that it can easily be searched
+  """
+
+  string = re.sub("\\n", " ", string)
+  string = re.sub(r"\s{1,}", " ", string)
+  string = re.sub("[^A-Za-z0-9 ]", "", string)
+
+  string = string.lower()
+
+  return string
+
+
+def exact_match_result(doc_id, publication_title, publication):
+  return {
+    'Document id': doc_id,
+    'Matched title': publication_title,
+    'Matched publication id': publication['uber_id'],
+    'Match algorithm': 'Exact match'
+  }
+
+
 class ExactMatcher:
   def __init__(self, sectioned_documents, title_length_threshold):
     self.texts = [
@@ -9,22 +40,7 @@ class ExactMatcher:
     self.title_length_threshold = title_length_threshold
 
   def clean_text(self, string):
-    """
-    Input:
-    -A string
-    Output:
-    -A string, with white space normalised and
-     non-alphanumeric characters removed
-    Cleans up text such that it can easily be searched
-    """
-
-    string = re.sub("\\n", " ", string)
-    string = re.sub("\s{1,}", " ", string)
-    string = re.sub("[^A-Za-z0-9 ]", "", string)
-
-    string = string.lower()
-
-    return string
+    return clean_text(string)
 
   def match(self, publication):
     """
@@ -40,11 +56,81 @@ class ExactMatcher:
     for doc_id, text in self.texts:
 
       if publication_title in text:
-        yield {
-          'Document id': doc_id,
-          'Matched title': publication_title,
-          'Matched publication id': publication['uber_id'],
-          'Match algorithm': 'Exact match'
-        }
+        yield exact_match_result(doc_id, publication_title, publication)
 
     return
+
+
+class AhoCorasickExactMatcher:
+  """
+  Multi-pattern counterpart of ExactMatcher: a single Aho-Corasick
+  automaton is built over every cleaned publication title, and each
+  document is then streamed through it exactly once, instead of
+  scanning every document once per publication.
+
+  Documents are not kept in memory, so they can be fed straight from
+  a generator.
+  """
+  def __init__(self, publications, title_length_threshold):
+    """
+    Input:
+      publications: iterable of dicts containing title and uber_id of
+        academic publications
+      title_length_threshold: cleaned titles shorter than this are
+        never matched
+    """
+    self.title_length_threshold = title_length_threshold
+    self.automaton = ahocorasick.Automaton()
+
+    # Several publications can share the same cleaned title, so each
+    # automaton key maps to the list of publications carrying it.
+    titles = {}
+    for publication in publications:
+      title = publication['title']
+      if not isinstance(title, str):
+        continue
+      publication_title = clean_text(title)
+      if len(publication_title) < self.title_length_threshold:
+        continue
+      titles.setdefault(publication_title, []).append(publication)
+
+    for publication_title, title_publications in titles.items():
+      self.automaton.add_word(
+        publication_title,
+        (publication_title, title_publications)
+      )
+
+    self.nb_titles = len(titles)
+    if self.nb_titles:
+      self.automaton.make_automaton()
+
+  def match_document(self, document):
+    """
+    Input:
+      document: SectionedDocument-like object with id and section
+    Output:
+      matched_reference: dicts linking academic publications with the
+        policy document, one per matched publication
+    """
+    if not self.nb_titles:
+      return
+
+    text = clean_text(document.section)
+    seen = set()
+    for _, (publication_title, title_publications) in self.automaton.iter(text):
+      if publication_title in seen:
+        continue
+      seen.add(publication_title)
+      for publication in title_publications:
+        yield exact_match_result(document.id, publication_title, publication)
+
+  def match_documents(self, documents):
+    """
+    Input:
+      documents: iterable of SectionedDocument-like objects
+    Output:
+      matched_reference: dicts linking academic publications with
+        policy documents
+    """
+    for document in documents:
+      yield from self.match_document(document)
@@ -78,6 +78,50 @@ class FileManager():
 
         return self._get_from_local(file_prefix, file_name, 'json')
 
+    def yield_scraping_results(
+            self, file_name, file_prefix,
+            scraping_columns=('title', 'file_hash', 'sections', 'uri', 'metadata')
+            ):
+        """Streams a scraping result-json, one row at a time. Unlike
+        get_scraping_results, neither the file nor its rows are ever held in
+        memory as a whole, which matters for the largest providers.
+
+        Files from S3 are downloaded to a temporary file first: rows are
+        consumed as fast as the model parses them, over hours, which an S3
+        connection can't be relied upon to last.
+
+            In: file_name: the name of the json file, gzipped or not
+                file_prefix: the path to the file (excluding the file name)
+                scraping_columns: the keys kept of each row
+
+            Out: A generator of dicts, one per line of the file
+        """
+        if self.mode == 'S3':
+            # If we don't have the filename, take the last file
+            if not file_name:
+                file_path = self.s3._get_last_modified_file_key(file_prefix)
+            else:
+                file_path = os.path.join(file_prefix, file_name)
+            with tempfile.TemporaryFile() as tf:
+                self.s3.get(file_path, tf)
+                tf.seek(0)
+                if file_path.endswith('.gz'):
+                    lines = gzip.GzipFile(fileobj=tf, mode='r')
+                else:
+                    lines = tf
+                for lineno, line in enumerate(lines):
+                    if line.strip():
+                        yield self.to_row(line, lineno, scraping_columns)
+            return
+
+        file_path = os.path.join(file_prefix, file_name)
+        self.logger.info('Streaming %s file from local storage', file_path)
+        open_file = gzip.open if file_path.endswith('.gz') else open
+        with open_file(file_path, 'rb') as lines:
+            for lineno, line in enumerate(lines):
+                if line.strip():
+                    yield self.to_row(line, lineno, scraping_columns)
+
     def get_file(self, file_name, file_prefix, file_type):
         if self.mode == 'S3':
             with tempfile.TemporaryFile() as tf:
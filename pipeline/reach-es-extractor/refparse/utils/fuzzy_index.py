@@ -0,0 +1,156 @@
+"""
+On-disk format for a fitted FuzzyMatcher index.
+
+An index directory holds the fitted vocabulary, the IDF weights and the
+CSR arrays of the publications TF-IDF matrix. The numerical arrays are
+stored as .npy files and opened memory-mapped, so loading is close to
+free and several processes on the same host share the same pages.
+
+Indexes are stored under <cache_dir>/<digest>, where the digest is
+computed from the content of the publications, so an index is reused
+for as long as the publications file does not change.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = '1'
+
+META_FILENAME = 'meta.json'
+VOCABULARY_FILENAME = 'vocabulary.json'
+ARRAY_NAMES = ('idf', 'data', 'indices', 'indptr')
+
+
+def titles_digest(titles):
+    """
+    Return a hex digest identifying a list of publication titles, in
+    order, together with the index format version.
+
+    Args:
+        titles(list): Titles the TF-IDF matrix is (or will be) fitted on.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(FORMAT_VERSION.encode('utf-8'))
+    for title in titles:
+        hasher.update(b'\0')
+        hasher.update(title.encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def index_path(cache_dir, digest):
+    return os.path.join(cache_dir, digest)
+
+
+def save_index(index_dir, vectorizer, tfidf_matrix):
+    """
+    Write a fitted vectorizer and its matrix to index_dir.
+
+    The index is written to a temporary directory next to index_dir and
+    renamed into place, so concurrent readers never see a partial index.
+    If another process got there first, its index is kept.
+
+    Args:
+        index_dir(str): Destination directory.
+        vectorizer(TfidfVectorizer): Fitted vectorizer.
+        tfidf_matrix(scipy.sparse.csr_matrix): Publications matrix.
+    """
+    parent_dir = os.path.dirname(os.path.abspath(index_dir))
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir, prefix='.tmp-')
+
+    try:
+        tfidf_matrix = tfidf_matrix.tocsr()
+        arrays = {
+            'idf': vectorizer.idf_,
+            'data': tfidf_matrix.data,
+            'indices': tfidf_matrix.indices,
+            'indptr': tfidf_matrix.indptr,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, name + '.npy'), array)
+
+        # Terms in column order; json is much more compact than a fixed
+        # width numpy string array when a few tokens are very long.
+        terms = [None] * len(vectorizer.vocabulary_)
+        for term, column in vectorizer.vocabulary_.items():
+            terms[column] = term
+        with open(os.path.join(tmp_dir, VOCABULARY_FILENAME), 'w') as f:
+            json.dump(terms, f)
+
+        with open(os.path.join(tmp_dir, META_FILENAME), 'w') as f:
+            json.dump({
+                'format_version': FORMAT_VERSION,
+                'shape': list(tfidf_matrix.shape),
+                'lowercase': vectorizer.lowercase,
+                'ngram_range': list(vectorizer.ngram_range),
+            }, f)
+
+        try:
+            os.rename(tmp_dir, index_dir)
+        except OSError:
+            if not os.path.isdir(index_dir):
+                raise
+            logger.info('save_index: %s already exists, keeping it', index_dir)
+            shutil.rmtree(tmp_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def load_index(index_dir, mmap_mode='r'):
+    """
+    Open an index written by save_index.
+
+    Args:
+        index_dir(str): Index directory.
+        mmap_mode(str): Passed to numpy.load; None reads arrays in memory.
+    Returns:
+        A (vectorizer, tfidf_matrix) tuple, or None if index_dir holds no
+        index of the current format.
+    """
+    meta_path = os.path.join(index_dir, META_FILENAME)
+    if not os.path.isfile(meta_path):
+        return None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('format_version') != FORMAT_VERSION:
+        logger.warning(
+            'load_index: ignoring %s, format_version=%s',
+            index_dir, meta.get('format_version')
+        )
+        return None
+
+    arrays = {
+        name: np.load(
+            os.path.join(index_dir, name + '.npy'),
+            mmap_mode=mmap_mode
+        )
+        for name in ARRAY_NAMES
+    }
+    with open(os.path.join(index_dir, VOCABULARY_FILENAME)) as f:
+        terms = json.load(f)
+
+    vectorizer = TfidfVectorizer(
+        lowercase=meta['lowercase'],
+        ngram_range=tuple(meta['ngram_range']),
+        vocabulary={term: column for column, term in enumerate(terms)}
+    )
+    vectorizer.idf_ = arrays['idf']
+
+    tfidf_matrix = csr_matrix(
+        (arrays['data'], arrays['indices'], arrays['indptr']),
+        shape=tuple(meta['shape']),
+        copy=False
+    )
+
+    return vectorizer, tfidf_matrix
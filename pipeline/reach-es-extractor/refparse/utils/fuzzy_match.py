@@ -1,17 +1,25 @@
+from collections import OrderedDict
 import logging
+import os
 
 import numpy as np
 
 import pandas as pd
+from scipy.sparse import csr_matrix
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+
+from . import fuzzy_index
+from .lsh import MinHashLSH
 
 logger = logging.getLogger(__name__)
 
+ENGINES = ('brute_force', 'lsh')
+
 
 class FuzzyMatcher:
     def __init__(
-        self, publications, similarity_threshold=0.8, title_length_threshold=0
+        self, publications, similarity_threshold=0.8, title_length_threshold=0,
+        index_cache_dir=None, engine='brute_force', match_cache=None
     ):
         """
         Takes information about publications in the format:
@@ -43,6 +51,18 @@ class FuzzyMatcher:
                 higher than this, then nothing is returned.
             title_length_threhold(int): Minimum allowed length of title.
                 Less than this threshold will return no results.
+            index_cache_dir(str): Optional directory where fitted indexes
+                are saved, keyed by a digest of the publication titles. If
+                an index for these publications is found there, it is
+                memory-mapped instead of refitting the vectorizer.
+            engine(str): 'brute_force' scores every publication; 'lsh' only
+                scores the candidates found by a MinHash LSH index over the
+                title words, trading some recall for speed on large
+                publication sets.
+            match_cache(TitleMatchCache): Optional cache of the best match
+                of each normalised title, see base/match_cache.py. Entries
+                are keyed by the publications index and the engine, and
+                thresholds are applied after lookup.
         """
         # Filter out any publications that don't have titles assuming that the
         # input is a jsonl.
@@ -57,11 +77,84 @@ class FuzzyMatcher:
         # Index the remaining publications for faster searching
 
         self.publications = {i:pub for i, pub in enumerate(publications)}
-        self.vectorizer = TfidfVectorizer(lowercase=True, ngram_range=(1, 1))
-        self.tfidf_matrix = self.vectorizer.fit_transform(titles)
+        self.vectorizer, self.tfidf_matrix = self._get_index(
+            titles, index_cache_dir
+        )
+
+        if engine not in ENGINES:
+            raise ValueError('Unknown engine %r' % engine)
+        self.engine = engine
+        self.lsh = MinHashLSH(self.tfidf_matrix) if engine == 'lsh' else None
         self.similarity_threshold = similarity_threshold
         self.title_length_threshold = title_length_threshold
 
+        self.match_cache = match_cache
+        if match_cache is not None:
+            index_version = (
+                os.path.basename(self.index_dir) if self.index_dir
+                else fuzzy_index.titles_digest(titles)
+            )
+            self.cache_namespace = 'fuzzy_match|%s|%s' % (index_version, engine)
+
+    def _get_index(self, titles, index_cache_dir):
+        # Directory of the saved index backing tfidf_matrix, if any
+        self.index_dir = None
+
+        if index_cache_dir is None:
+            vectorizer = TfidfVectorizer(lowercase=True, ngram_range=(1, 1))
+            return vectorizer, vectorizer.fit_transform(titles)
+
+        index_dir = fuzzy_index.index_path(
+            index_cache_dir,
+            fuzzy_index.titles_digest(titles)
+        )
+        index = fuzzy_index.load_index(index_dir)
+        if index is not None:
+            logger.info('FuzzyMatcher: loaded index from %s', index_dir)
+            self.index_dir = index_dir
+            return index
+
+        vectorizer = TfidfVectorizer(lowercase=True, ngram_range=(1, 1))
+        tfidf_matrix = vectorizer.fit_transform(titles)
+        fuzzy_index.save_index(index_dir, vectorizer, tfidf_matrix)
+        logger.info('FuzzyMatcher: saved index to %s', index_dir)
+
+        # Reopen what was saved so that this process shares the
+        # memory-mapped pages with the other workers, too.
+        self.index_dir = index_dir
+        return fuzzy_index.load_index(index_dir)
+
+    def _search_titles(self, titles, nb_results):
+        """
+        Score a block of titles against every publication at once.
+
+        Args:
+            titles(list): Titles to score.
+            nb_results(int): Number of results to keep for each title.
+        Returns:
+            A list with, for each title, an array of publication indices and
+            an array of their similarities, best match first.
+        """
+        title_matrix = self.vectorizer.transform(titles)
+
+        # Rows of both matrices are l2 normalised by TfidfVectorizer, so
+        # their dot product is the cosine similarity.
+
+        if self.lsh is None:
+            similarities = title_matrix.dot(self.tfidf_matrix.T).tocsr()
+        else:
+            similarities = self._candidate_similarities(title_matrix)
+        return list(top_k_rows(similarities, nb_results))
+
+    def _candidate_similarities(self, title_matrix):
+        """
+        Cosine similarities of each title against its LSH candidates only,
+        as a sparse matrix of the same shape as the brute force one.
+        """
+        return candidate_similarities(
+            title_matrix, self.tfidf_matrix, self.lsh.query(title_matrix)
+        )
+
     def search_publications(self, reference, nb_results=10):
         """
         Args:
@@ -71,36 +164,134 @@ class FuzzyMatcher:
             nb_results(int): Number of results to return. This will be the top
                 n results, ordered by similarity score.
         """
-        title_vector = self.vectorizer.transform([reference.get("Title")])[0]
-        title_similarities = cosine_similarity(title_vector, self.tfidf_matrix)[0]
-
-        # Create a dict of similarities indexed by the order of the publications
-
-        similarity_vector = {i:vector for i, vector in enumerate(title_similarities)}
-
-        # Order the similarity vector by similarities (and subset the top nb_results)
+        [(indices, similarities)] = self._search_titles(
+            [reference.get("Title")],
+            nb_results
+        )
 
-        sorted_similarities = sorted(similarity_vector.items(), key=lambda item: item[1], reverse=True)
-        sorted_similarities = sorted_similarities[0:nb_results]
-        similar_doc_indices = [k for k, v in sorted_similarities]
+        # Copy the publications so that the similarity of this search
+        # doesn't leak into the shared publications index.
 
-        # Cycle through just the similar docs, not the entire list of
-        # publications.
-
-        retrieved_publications = {i:self.publications[i] for i in similar_doc_indices}
-
-        # Finally append the similarity to the similar docs based on its index
+        return [
+            dict(self.publications[i], similarity=similarity)
+            for i, similarity in zip(indices, similarities)
+        ]
 
-        for key, doc in retrieved_publications.items():
-            doc.update({"similarity": similarity_vector[key]})
+    def _is_matchable(self, reference):
+        if not reference:
+            return False
 
-        # Convert to a list, again checking that sorting is correct
+        return len(reference["Title"]) >= self.title_length_threshold
 
-        retrieved_publications = [value for key, value in retrieved_publications.items()]
+    def _matched_reference(self, reference, index, similarity):
+        if similarity <= self.similarity_threshold:
+            return None
 
-        retrieved_publications = sorted(retrieved_publications, key=lambda x: x['similarity'], reverse=True)
+        best_match = self.publications[index]
+        return {
+            "Document id": reference["Document id"],
+            "Reference id": reference["Reference id"],
+            "Extracted title": reference["Title"],
+            "Matched title": best_match["title"],
+            "Matched publication id": best_match.get("uber_id"),
+            "Matched publication pmcid": best_match.get("pmcid"),
+            "Matched publication pmid": best_match.get("pmid"),
+            "Matched publication doi": best_match.get("doi"),
+            "Similarity": similarity,
+            "Match algorithm": "Fuzzy match",
+        }
+
+    def match_many(self, references, batch_size=1000):
+        """
+        Match references in blocks: the titles of each block are vectorized
+        together, scored against the publications with one sparse matrix
+        product, and only the best publication of each row is looked up.
 
-        return retrieved_publications
+        Args:
+            references(iterable): Structured references, as for match().
+            batch_size(int): Number of references scored per matrix product.
+        Yields:
+            For each reference, in order, the same value match() returns.
+        """
+        for batch in chunks(references, batch_size):
+            matchable = [
+                reference for reference in batch
+                if self._is_matchable(reference)
+            ]
+            best_matches = iter(self._best_matches(
+                [reference["Title"] for reference in matchable]
+            ))
+
+            for reference in batch:
+                if not self._is_matchable(reference):
+                    yield None
+                    continue
+                index, similarity = next(best_matches)
+                yield self._matched_reference(reference, index, similarity)
+
+    def best_publications(self, titles):
+        """
+        Args:
+            titles(list): Titles to match.
+        Returns:
+            For each title, a (publication, similarity) tuple for its best
+            match above similarity_threshold, or None.
+        """
+        matchable = [
+            title for title in titles
+            if title and len(title) >= self.title_length_threshold
+        ]
+        best_matches = iter(self._best_matches(matchable))
+
+        results = []
+        for title in titles:
+            if not title or len(title) < self.title_length_threshold:
+                results.append(None)
+                continue
+            index, similarity = next(best_matches)
+            if similarity <= self.similarity_threshold:
+                results.append(None)
+            else:
+                results.append((self.publications[index], similarity))
+        return results
+
+    def _best_matches(self, titles):
+        """
+        Returns:
+            For each title, the (publication index, similarity) of its best
+            match, looked up in match_cache first when there is one.
+        """
+        if not titles:
+            return []
+
+        if self.match_cache is None:
+            return [
+                (indices[0], float(similarities[0]))
+                for indices, similarities in self._search_titles(titles, 1)
+            ]
+
+        best_matches = [
+            self.match_cache.get(self.cache_namespace, title)
+            for title in titles
+        ]
+        missing_titles = list(OrderedDict.fromkeys(
+            title for title, best_match in zip(titles, best_matches)
+            if best_match is self.match_cache.MISSING
+        ))
+        scored = {}
+        if missing_titles:
+            for title, (indices, similarities) in zip(
+                    missing_titles, self._search_titles(missing_titles, 1)):
+                scored[title] = (int(indices[0]), float(similarities[0]))
+                self.match_cache.put(
+                    self.cache_namespace, title, scored[title]
+                )
+
+        return [
+            scored[title] if best_match is self.match_cache.MISSING
+            else tuple(best_match)
+            for title, best_match in zip(titles, best_matches)
+        ]
 
     def match(self, reference):
 
@@ -109,28 +300,91 @@ class FuzzyMatcher:
             reference(dict): A structure reference in a dict, that minimally
                 contains the key: 'Title'.
         """
-        if not reference:
-            return None
-
-        if len(reference["Title"]) < self.title_length_threshold:
-            return None
-
-        retrieved_publications = self.search_publications(reference)
-
-        best_match = retrieved_publications[0]
-        best_similarity = best_match["similarity"]
-
-        if best_similarity > self.similarity_threshold:
-            return {
-                "Document id": reference["Document id"],
-                "Reference id": reference["Reference id"],
-                "Extracted title": reference["Title"],
-                "Matched title": best_match["title"],
-                "Matched publication id": best_match.get("uber_id"),
-                "Matched publication pmcid": best_match.get("pmcid"),
-                "Matched publication pmid": best_match.get("pmid"),
-                "Matched publication doi": best_match.get("doi"),
-                "Similarity": best_similarity,
-                "Match algorithm": "Fuzzy match",
-            }
-
+        return next(self.match_many([reference]))
+
+
+def chunks(iterable, size):
+    """Yield lists of at most size consecutive items from iterable."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def candidate_similarities(title_matrix, tfidf_matrix, candidates):
+    """
+    Cosine similarities of each title against its candidates only, as a
+    sparse matrix of shape (number of titles, number of publications).
+
+    Args:
+        title_matrix, tfidf_matrix: l2 normalised TF-IDF rows of the
+            titles and of the publications.
+        candidates(list): For each title, an array of publication rows.
+    """
+    rows = np.repeat(
+        np.arange(len(candidates)),
+        [len(row_candidates) for row_candidates in candidates]
+    )
+    columns = np.concatenate(candidates)
+    shape = (title_matrix.shape[0], tfidf_matrix.shape[0])
+
+    if not len(columns):
+        return csr_matrix(shape)
+
+    # Row-wise dot products of each (title, candidate) pair
+    values = np.asarray(
+        title_matrix[rows].multiply(tfidf_matrix[columns]).sum(axis=1)
+    ).ravel()
+
+    similarities = csr_matrix((values, (rows, columns)), shape=shape)
+    similarities.eliminate_zeros()
+    return similarities
+
+
+def top_k_rows(similarities, k):
+    """
+    Select the k highest similarities of every row of a sparse matrix,
+    without densifying it.
+
+    Ties are broken by lowest column index, and rows with fewer than k
+    stored values are padded with zero-similarity columns, so the result
+    is the same as fully sorting each dense row.
+
+    Args:
+        similarities(scipy.sparse.csr_matrix): One row per query, one column
+            per publication. Values are expected to be non-negative.
+        k(int): Number of results to keep per row.
+    Yields:
+        (indices, values) numpy arrays for each row, best first.
+    """
+    similarities.sort_indices()
+    nb_columns = similarities.shape[1]
+    k = min(k, nb_columns)
+    indptr = similarities.indptr
+
+    for row in range(similarities.shape[0]):
+        indices = similarities.indices[indptr[row]:indptr[row + 1]]
+        values = similarities.data[indptr[row]:indptr[row + 1]]
+
+        if len(values) > k:
+            # Everything strictly above the k-th value is kept, the
+            # remaining slots go to the lowest indices equal to it.
+            kth = values[np.argpartition(-values, k - 1)[k - 1]]
+            above = np.flatnonzero(values > kth)
+            ties = np.flatnonzero(values == kth)[:k - len(above)]
+            keep = np.concatenate([above, ties])
+            indices, values = indices[keep], values[keep]
+        elif len(values) < k:
+            padding = np.setdiff1d(
+                np.arange(min(nb_columns, k + len(values))),
+                indices
+            )[:k - len(values)]
+            indices = np.concatenate([indices, padding])
+            values = np.concatenate([values, np.zeros(len(padding))])
+
+        order = np.lexsort((indices, -values))
+        yield indices[order], values[order]
@@ -0,0 +1,448 @@
+"""
+Publication index that can be updated in place, and the FuzzyMatcher
+built on it.
+
+Titles are vectorized with a HashingVectorizer, which needs no fitted
+vocabulary, and the index keeps raw term counts per publication plus
+the document frequency of every hashed feature. Adding or removing
+publications only vectorizes the titles concerned and updates the
+document frequencies; IDF weights and the normalised TF-IDF matrix are
+then recomputed with vectorized operations when next needed. Up to
+hash collisions, weights are those of TfidfVectorizer's defaults.
+
+On disk, an index is a base snapshot plus numbered deltas holding the
+publications added and removed since, so weekly updates only write
+what changed. compact() folds the deltas back into the base.
+
+A base and its deltas live together in a numbered snapshot directory,
+and the CURRENT file names the snapshot in use. save() writes a whole
+new snapshot before pointing CURRENT to it, so that an index
+interrupted while saving still loads its previous snapshot.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from scipy.sparse import csr_matrix, diags, vstack
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+from .fuzzy_match import FuzzyMatcher
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = '2'
+
+CURRENT_FILENAME = 'CURRENT'
+SNAPSHOT_PREFIX = 'snapshot-'
+BASE_DIRNAME = 'base'
+DELTAS_DIRNAME = 'deltas'
+META_FILENAME = 'meta.json'
+PUBLICATIONS_FILENAME = 'publications.jsonl'
+REMOVED_FILENAME = 'removed.json'
+COUNTS_ARRAYS = ('data', 'indices', 'indptr')
+
+
+def _json_default(value):
+    # numpy scalars, as found in publications read with pandas
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def _save_counts(dirname, counts):
+    for name in COUNTS_ARRAYS:
+        np.save(
+            os.path.join(dirname, 'counts_%s.npy' % name),
+            getattr(counts, name)
+        )
+
+
+def _load_counts(dirname, n_features):
+    data, indices, indptr = (
+        np.load(os.path.join(dirname, 'counts_%s.npy' % name))
+        for name in COUNTS_ARRAYS
+    )
+    return csr_matrix(
+        (data, indices, indptr),
+        shape=(len(indptr) - 1, n_features)
+    )
+
+
+def _save_publications(dirname, publications):
+    with open(os.path.join(dirname, PUBLICATIONS_FILENAME), 'w') as f:
+        for publication in publications:
+            f.write(json.dumps(publication, default=_json_default) + '\n')
+
+
+def _load_publications(dirname):
+    with open(os.path.join(dirname, PUBLICATIONS_FILENAME)) as f:
+        return [json.loads(line) for line in f]
+
+
+class IncrementalPublicationIndex:
+    def __init__(self, publications=(), n_features=2 ** 20,
+                 id_field='uber_id'):
+        """
+        Args:
+            publications(iterable): Initial publications, dicts with at
+                least a title and an id_field.
+            n_features(int): Number of hashed features.
+            id_field(str): Publication key used to update or remove
+                publications.
+        """
+        self.n_features = n_features
+        self.id_field = id_field
+        self.hashing_vectorizer = HashingVectorizer(
+            lowercase=True,
+            ngram_range=(1, 1),
+            n_features=n_features,
+            norm=None,
+            alternate_sign=False
+        )
+
+        self.df = np.zeros(n_features, dtype=np.int64)
+        self.publications = {}
+        self.rows_by_id = {}
+        self.nb_rows = 0
+        self._live = np.zeros(0, dtype=bool)
+        self._count_blocks = []
+        self._tfidf_matrix = None
+        self._idf = None
+
+        # Changes not yet written to disk by flush()
+        self._pending_rows = []
+        self._pending_removed = []
+
+        self.add_publications(publications)
+
+    def __len__(self):
+        return int(self._live.sum())
+
+    @property
+    def counts(self):
+        """Raw term counts, one row per publication ever added."""
+        if len(self._count_blocks) > 1:
+            self._count_blocks = [vstack(self._count_blocks, format='csr')]
+        if not self._count_blocks:
+            return csr_matrix((0, self.n_features))
+        return self._count_blocks[0]
+
+    def _invalidate(self):
+        self._tfidf_matrix = None
+        self._idf = None
+
+    def _document_frequencies(self, counts):
+        return np.bincount(counts.indices, minlength=self.n_features)
+
+    def _add_counts(self, publications, counts, update_df=True):
+        counts = csr_matrix(counts)
+        counts.sum_duplicates()
+
+        first_row = self.nb_rows
+        self.nb_rows += len(publications)
+        self._count_blocks.append(counts)
+        self._live = np.concatenate([
+            self._live, np.ones(len(publications), dtype=bool)
+        ])
+        if update_df:
+            self.df += self._document_frequencies(counts)
+
+        rows = list(range(first_row, self.nb_rows))
+        for row, publication in zip(rows, publications):
+            self.publications[row] = publication
+            publication_id = publication.get(self.id_field)
+            if publication_id is not None:
+                self.rows_by_id[publication_id] = row
+
+        self._invalidate()
+        return rows
+
+    def add_publications(self, publications):
+        """
+        Vectorize and add publications. A publication whose id is already
+        in the index replaces it; publications without title are skipped.
+        Publications without id can't be removed later.
+
+        Returns:
+            The number of publications added.
+        """
+        # Last occurrence wins within the batch, too
+        by_id = {}
+        anonymous = []
+        for publication in publications:
+            if not publication.get('title'):
+                continue
+            publication_id = publication.get(self.id_field)
+            if publication_id is None:
+                anonymous.append(publication)
+            else:
+                by_id.pop(publication_id, None)
+                by_id[publication_id] = publication
+        publications = anonymous + list(by_id.values())
+        if not publications:
+            return 0
+
+        self.remove_publications(by_id)
+        counts = self.hashing_vectorizer.transform(
+            [p['title'] for p in publications]
+        )
+        self._pending_rows.extend(self._add_counts(publications, counts))
+
+        return len(publications)
+
+    def remove_publications(self, publication_ids):
+        """
+        Returns:
+            The number of publications removed. Unknown ids are ignored.
+        """
+        removed_rows = []
+        for publication_id in publication_ids:
+            row = self.rows_by_id.pop(publication_id, None)
+            if row is None:
+                continue
+            removed_rows.append(row)
+            self._pending_removed.append(publication_id)
+
+        if not removed_rows:
+            return 0
+
+        removed_counts = self.counts[removed_rows]
+        self.df -= self._document_frequencies(removed_counts)
+        self._live[removed_rows] = False
+
+        # Removed rows keep their row number, and their publication, so
+        # that row numbers held by callers stay valid; their TF-IDF
+        # rows are zeroed and they are dropped on compaction.
+        removed = set(removed_rows)
+        self._pending_rows = [
+            row for row in self._pending_rows if row not in removed
+        ]
+
+        self._invalidate()
+        return len(removed_rows)
+
+    @property
+    def idf(self):
+        """Smoothed IDF weights, as computed by TfidfTransformer."""
+        if self._idf is None:
+            nb_documents = len(self)
+            self._idf = np.log((1 + nb_documents) / (1 + self.df)) + 1
+        return self._idf
+
+    @property
+    def tfidf_matrix(self):
+        """l2 normalised TF-IDF rows; removed publications are all zeros."""
+        if self._tfidf_matrix is None:
+            weighted = diags(self._live.astype(np.float64)).dot(
+                self.counts.dot(diags(self.idf))
+            )
+            self._tfidf_matrix = normalize(csr_matrix(weighted))
+        return self._tfidf_matrix
+
+    def transform(self, titles):
+        """
+        Vectorize titles like the publications of the index. As with a
+        fitted TfidfVectorizer, words absent from the index are ignored.
+        """
+        counts = self.hashing_vectorizer.transform(titles)
+        weights = np.where(self.df > 0, self.idf, 0)
+        return normalize(csr_matrix(counts.dot(diags(weights))))
+
+    @staticmethod
+    def _snapshot_dir(index_dir):
+        """Path of the snapshot CURRENT names, None if there's none."""
+        try:
+            with open(os.path.join(index_dir, CURRENT_FILENAME)) as f:
+                return os.path.join(index_dir, f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def save(self, index_dir):
+        """
+        Write a full snapshot of the live publications to index_dir,
+        replacing any previous base and deltas.
+        """
+        live_rows = np.flatnonzero(self._live)
+        os.makedirs(index_dir, exist_ok=True)
+        # Numbered after any snapshot, including one left by an
+        # interrupted save.
+        snapshot_name = '%s%08d' % (SNAPSHOT_PREFIX, 1 + max([
+            int(name[len(SNAPSHOT_PREFIX):])
+            for name in os.listdir(index_dir)
+            if name.startswith(SNAPSHOT_PREFIX)
+        ] or [0]))
+        tmp_dir = tempfile.mkdtemp(dir=index_dir, prefix='.tmp-')
+
+        try:
+            base_dir = os.path.join(tmp_dir, BASE_DIRNAME)
+            os.mkdir(base_dir)
+            _save_counts(base_dir, self.counts[live_rows])
+            np.save(os.path.join(base_dir, 'df.npy'), self.df)
+            _save_publications(
+                base_dir, (self.publications[row] for row in live_rows)
+            )
+            with open(os.path.join(base_dir, META_FILENAME), 'w') as f:
+                json.dump({
+                    'format_version': FORMAT_VERSION,
+                    'n_features': self.n_features,
+                    'id_field': self.id_field,
+                }, f)
+            snapshot_dir = os.path.join(index_dir, snapshot_name)
+            os.rename(tmp_dir, snapshot_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        # Until CURRENT is replaced, the previous snapshot stays in use.
+        current_tmp = os.path.join(index_dir, CURRENT_FILENAME + '.tmp')
+        with open(current_tmp, 'w') as f:
+            f.write(snapshot_name)
+        os.replace(current_tmp, os.path.join(index_dir, CURRENT_FILENAME))
+
+        # Remove the previous snapshot, and any left by an interrupted save.
+        for name in os.listdir(index_dir):
+            if name.startswith(SNAPSHOT_PREFIX) and name != snapshot_name:
+                shutil.rmtree(
+                    os.path.join(index_dir, name), ignore_errors=True
+                )
+
+        self._pending_rows = []
+        self._pending_removed = []
+        logger.info(
+            'IncrementalPublicationIndex.save: index_dir=%s publications=%d',
+            index_dir, len(live_rows)
+        )
+
+    def flush(self, index_dir):
+        """
+        Write the publications added and removed since the last save,
+        flush or load as a new delta of index_dir.
+
+        Returns:
+            The path of the delta, or None if there was nothing to write.
+        """
+        snapshot_dir = self._snapshot_dir(index_dir)
+        if snapshot_dir is None:
+            self.save(index_dir)
+            return None
+
+        if not self._pending_rows and not self._pending_removed:
+            return None
+
+        deltas_dir = os.path.join(snapshot_dir, DELTAS_DIRNAME)
+        os.makedirs(deltas_dir, exist_ok=True)
+        delta_dir = os.path.join(
+            deltas_dir, '%08d' % (len(self._delta_names(snapshot_dir)) + 1)
+        )
+        tmp_dir = tempfile.mkdtemp(dir=deltas_dir, prefix='.tmp-')
+
+        try:
+            _save_counts(tmp_dir, self.counts[self._pending_rows])
+            _save_publications(
+                tmp_dir, (self.publications[row] for row in self._pending_rows)
+            )
+            with open(os.path.join(tmp_dir, REMOVED_FILENAME), 'w') as f:
+                json.dump(
+                    self._pending_removed, f, default=_json_default
+                )
+            os.rename(tmp_dir, delta_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        logger.info(
+            'IncrementalPublicationIndex.flush: delta=%s added=%d removed=%d',
+            delta_dir, len(self._pending_rows), len(self._pending_removed)
+        )
+        self._pending_rows = []
+        self._pending_removed = []
+        return delta_dir
+
+    @staticmethod
+    def _delta_names(snapshot_dir):
+        deltas_dir = os.path.join(snapshot_dir, DELTAS_DIRNAME)
+        if not os.path.isdir(deltas_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(deltas_dir)
+            if not name.startswith('.')
+        )
+
+    @classmethod
+    def load(cls, index_dir):
+        """Open the current base of index_dir and replay its deltas."""
+        snapshot_dir = cls._snapshot_dir(index_dir)
+        if snapshot_dir is None:
+            raise FileNotFoundError('No index in %s' % index_dir)
+        base_dir = os.path.join(snapshot_dir, BASE_DIRNAME)
+        with open(os.path.join(base_dir, META_FILENAME)) as f:
+            meta = json.load(f)
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(
+                'Unsupported index format_version=%s' %
+                meta.get('format_version')
+            )
+
+        index = cls(n_features=meta['n_features'], id_field=meta['id_field'])
+        index._add_counts(
+            _load_publications(base_dir),
+            _load_counts(base_dir, index.n_features),
+            update_df=False
+        )
+        index.df = np.load(os.path.join(base_dir, 'df.npy'))
+
+        delta_names = cls._delta_names(snapshot_dir)
+        for name in delta_names:
+            delta_dir = os.path.join(snapshot_dir, DELTAS_DIRNAME, name)
+            with open(os.path.join(delta_dir, REMOVED_FILENAME)) as f:
+                index.remove_publications(json.load(f))
+            index._add_counts(
+                _load_publications(delta_dir),
+                _load_counts(delta_dir, index.n_features)
+            )
+
+        index._pending_rows = []
+        index._pending_removed = []
+        logger.info(
+            'IncrementalPublicationIndex.load: index_dir=%s publications=%d '
+            'deltas=%d', index_dir, len(index), len(delta_names)
+        )
+        return index
+
+    def compact(self, index_dir):
+        """Fold the deltas of index_dir into a new base snapshot."""
+        self.save(index_dir)
+
+
+class IncrementalFuzzyMatcher(FuzzyMatcher):
+    """
+    FuzzyMatcher matching against an IncrementalPublicationIndex, so that
+    publications can be added or removed between matches without
+    refitting. Only the brute force engine is supported.
+    """
+    def __init__(self, index, similarity_threshold=0.8,
+                 title_length_threshold=0):
+        """
+        Args:
+            index(IncrementalPublicationIndex): Publications to match
+                against; later changes to it are picked up by the matcher.
+            similarity_threshold, title_length_threshold: See FuzzyMatcher.
+        """
+        self.index = index
+        self.vectorizer = index
+        self.publications = index.publications
+        self.similarity_threshold = similarity_threshold
+        self.title_length_threshold = title_length_threshold
+        self.index_dir = None
+        self.engine = 'brute_force'
+        self.lsh = None
+        # Results change with the index, so they aren't cached
+        self.match_cache = None
+
+    @property
+    def tfidf_matrix(self):
+        return self.index.tfidf_matrix
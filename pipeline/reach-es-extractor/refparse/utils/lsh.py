@@ -0,0 +1,138 @@
+"""
+MinHash / locality sensitive hashing index over publication titles.
+
+Titles are represented by the set of their words, i.e. the unigrams of
+the fitted TF-IDF vocabulary they contain, not by word shingles: the
+word ids of a title are the column indices of its row in the TF-IDF
+matrix, so no extra tokenization is needed and signatures are computed
+with numpy over the CSR arrays. The Jaccard similarity estimated is
+hence that of the sets of words of two titles, regardless of their
+order.
+
+Each signature is cut into bands; two titles become candidates when all
+the hashes of at least one band are equal, which happens with high
+probability when their Jaccard similarity is above roughly
+(1 / bands) ** (1 / rows_per_band).
+"""
+import numpy as np
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+BAND_HASH_MULTIPLIER = np.uint64(1000003)
+
+
+class MinHashLSH:
+    def __init__(self, tfidf_matrix, num_perm=64, bands=16, seed=1,
+                 chunk_size=50000):
+        """
+        Args:
+            tfidf_matrix(scipy.sparse.csr_matrix): Publications matrix, one
+                row per publication.
+            num_perm(int): Number of hash permutations in a signature.
+            bands(int): Number of bands; must divide num_perm.
+            seed(int): Seed of the hash permutations.
+            chunk_size(int): Number of rows hashed at once, bounding the
+                size of the intermediate (num_perm, nnz) hash arrays.
+        """
+        if num_perm % bands:
+            raise ValueError(
+                'num_perm=%d is not a multiple of bands=%d' % (num_perm, bands)
+            )
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.chunk_size = chunk_size
+
+        random_state = np.random.RandomState(seed)
+        self.a = random_state.randint(
+            1, MAX_HASH, size=(num_perm, 1), dtype=np.uint64
+        )
+        self.b = random_state.randint(
+            0, MAX_HASH, size=(num_perm, 1), dtype=np.uint64
+        )
+
+        keys, row_ids = self.band_keys(tfidf_matrix)
+
+        # One sorted array of keys per band, with the matching rows, so
+        # that buckets are looked up with searchsorted.
+        order = np.argsort(keys, axis=1, kind='stable')
+        self.sorted_keys = np.take_along_axis(keys, order, axis=1)
+        self.sorted_rows = row_ids[order]
+
+    def signatures(self, matrix):
+        """
+        Args:
+            matrix(scipy.sparse.csr_matrix): Rows of word ids.
+        Returns:
+            (signatures, row_ids): a (num_perm, n) array of MinHash
+            signatures for the n non-empty rows of matrix, and their row
+            numbers. Empty rows have no words, hence no signature.
+        """
+        indptr = matrix.indptr
+        row_lengths = np.diff(indptr)
+        row_ids = np.flatnonzero(row_lengths)
+        signatures = np.empty((self.num_perm, len(row_ids)), dtype=np.uint64)
+
+        for start in range(0, len(row_ids), self.chunk_size):
+            chunk_rows = row_ids[start:start + self.chunk_size]
+            begin, end = indptr[chunk_rows[0]], indptr[chunk_rows[-1] + 1]
+            words = matrix.indices[begin:end].astype(np.uint64)
+
+            hashes = (self.a * words + self.b) % MERSENNE_PRIME & MAX_HASH
+            signatures[:, start:start + len(chunk_rows)] = np.minimum.reduceat(
+                hashes,
+                indptr[chunk_rows] - begin,
+                axis=1
+            )
+
+        return signatures, row_ids
+
+    def band_keys(self, matrix):
+        """
+        Returns:
+            (keys, row_ids): a (bands, n) array with one hash per band for
+            the n non-empty rows of matrix, and their row numbers.
+        """
+        signatures, row_ids = self.signatures(matrix)
+        keys = np.zeros((self.bands, len(row_ids)), dtype=np.uint64)
+        for band in range(self.bands):
+            band_rows = signatures[
+                band * self.rows_per_band:(band + 1) * self.rows_per_band
+            ]
+            for hashes in band_rows:
+                keys[band] = keys[band] * BAND_HASH_MULTIPLIER + hashes
+        return keys, row_ids
+
+    def query(self, matrix):
+        """
+        Args:
+            matrix(scipy.sparse.csr_matrix): Query rows, vectorized with the
+                same vocabulary as the index.
+        Returns:
+            A list with, for each row of matrix, the sorted array of
+            candidate publication rows sharing at least one band.
+        """
+        candidates = [np.empty(0, dtype=self.sorted_rows.dtype)] * matrix.shape[0]
+        keys, row_ids = self.band_keys(matrix)
+
+        lefts = np.empty(keys.shape, dtype=np.int64)
+        rights = np.empty(keys.shape, dtype=np.int64)
+        for band in range(self.bands):
+            lefts[band] = np.searchsorted(
+                self.sorted_keys[band], keys[band], side='left'
+            )
+            rights[band] = np.searchsorted(
+                self.sorted_keys[band], keys[band], side='right'
+            )
+
+        for i, row in enumerate(row_ids):
+            buckets = [
+                self.sorted_rows[band, lefts[band, i]:rights[band, i]]
+                for band in range(self.bands)
+                if rights[band, i] > lefts[band, i]
+            ]
+            if buckets:
+                candidates[row] = np.unique(np.concatenate(buckets))
+
+        return candidates
@@ -0,0 +1,191 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from . import fuzzy_index
+from .fuzzy_match import FuzzyMatcher, candidate_similarities, top_k_rows
+
+logger = logging.getLogger(__name__)
+
+# Publications matrix of a worker process, memory-mapped from the saved
+# index so that every worker shares the same physical pages.
+_worker_tfidf_matrix = None
+
+
+def _init_worker(index_dir):
+    global _worker_tfidf_matrix
+    _, _worker_tfidf_matrix = fuzzy_index.load_index(index_dir)
+
+
+def _row_shard(tfidf_matrix, start, stop):
+    """
+    Return rows [start, stop) of a CSR matrix. data and indices are views
+    of the (memory-mapped) parent arrays; only indptr is copied.
+    """
+    indptr = tfidf_matrix.indptr
+    begin, end = indptr[start], indptr[stop]
+    return csr_matrix(
+        (
+            tfidf_matrix.data[begin:end],
+            tfidf_matrix.indices[begin:end],
+            np.asarray(indptr[start:stop + 1]) - begin
+        ),
+        shape=(stop - start, tfidf_matrix.shape[1]),
+        copy=False
+    )
+
+
+def _score_shard(task):
+    title_matrix, start, stop, nb_results, candidates = task
+    shard = _row_shard(_worker_tfidf_matrix, start, stop)
+    if candidates is None:
+        similarities = title_matrix.dot(shard.T).tocsr()
+    else:
+        similarities = candidate_similarities(title_matrix, shard, candidates)
+    return [
+        (indices + start, values)
+        for indices, values in top_k_rows(similarities, nb_results)
+    ]
+
+
+def merge_top_k(shard_results, k):
+    """
+    Merge the per-shard top k of every row into the global top k, with
+    the same ordering and tie breaking as top_k_rows.
+
+    Args:
+        shard_results(list): For each shard, a list with one
+            (indices, values) tuple per row, indices being global.
+        k(int): Number of results to keep per row.
+    Returns:
+        A list with one (indices, values) tuple per row, best first.
+    """
+    merged = []
+    for row_results in zip(*shard_results):
+        indices = np.concatenate([indices for indices, _ in row_results])
+        values = np.concatenate([values for _, values in row_results])
+        order = np.lexsort((indices, -values))[:k]
+        merged.append((indices[order], values[order]))
+    return merged
+
+
+class ParallelFuzzyMatcher(FuzzyMatcher):
+    """
+    FuzzyMatcher scoring each block of titles on a pool of processes.
+
+    The publications matrix is split in row shards with about the same
+    number of stored values. For every block of titles, each shard is
+    scored by one worker and the per-shard top results are merged, so
+    results are identical to the serial FuzzyMatcher. With the 'lsh'
+    engine, candidates are looked up in this process, and each worker
+    only scores the candidates in its shard.
+
+    Workers open the saved index memory-mapped, which is how the matrix
+    is shared between processes: it is held once in the page cache
+    rather than copied into each worker. Without index_cache_dir, the
+    index is saved to a temporary directory for the lifetime of the
+    matcher.
+
+    Use as a context manager, or call close(), to stop the workers.
+    """
+    def __init__(
+        self, publications, similarity_threshold=0.8, title_length_threshold=0,
+        index_cache_dir=None, num_workers=None, match_cache=None,
+        engine='brute_force'
+    ):
+        """
+        Args:
+            publications, similarity_threshold, title_length_threshold,
+            index_cache_dir, match_cache, engine: See FuzzyMatcher.
+            num_workers(int): Number of worker processes, and of shards.
+                Defaults to the number of CPUs.
+        """
+        super().__init__(
+            publications,
+            similarity_threshold,
+            title_length_threshold,
+            index_cache_dir,
+            engine=engine,
+            match_cache=match_cache
+        )
+
+        self._tmp_dir = None
+        if self.index_dir is None:
+            self._tmp_dir = tempfile.mkdtemp(prefix='fuzzy-index-')
+            self.index_dir = os.path.join(self._tmp_dir, 'index')
+            fuzzy_index.save_index(
+                self.index_dir, self.vectorizer, self.tfidf_matrix
+            )
+
+        self.num_workers = num_workers or os.cpu_count()
+        self.shards = self._shard_bounds(self.num_workers)
+        self.pool = multiprocessing.Pool(
+            self.num_workers,
+            initializer=_init_worker,
+            initargs=(self.index_dir,)
+        )
+        logger.info(
+            'ParallelFuzzyMatcher: num_workers=%d index_dir=%s engine=%s',
+            self.num_workers, self.index_dir, self.engine
+        )
+
+    def _shard_bounds(self, nb_shards):
+        """Split rows in contiguous ranges holding similar numbers of values."""
+        indptr = self.tfidf_matrix.indptr
+        nb_rows = self.tfidf_matrix.shape[0]
+        cuts = np.searchsorted(
+            indptr,
+            np.linspace(0, indptr[-1], nb_shards + 1)[1:-1]
+        )
+        bounds = np.unique(np.concatenate([[0], cuts, [nb_rows]]))
+        return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+    @staticmethod
+    def _shard_candidates(candidates, start, stop):
+        """Candidates in rows [start, stop), as rows of the shard."""
+        if candidates is None:
+            return None
+        return [
+            row_candidates[
+                (row_candidates >= start) & (row_candidates < stop)
+            ] - start
+            for row_candidates in candidates
+        ]
+
+    def _search_titles(self, titles, nb_results):
+        title_matrix = self.vectorizer.transform(titles)
+        candidates = (
+            self.lsh.query(title_matrix) if self.lsh is not None else None
+        )
+        shard_results = self.pool.map(
+            _score_shard,
+            [
+                (
+                    title_matrix, start, stop, nb_results,
+                    self._shard_candidates(candidates, start, stop)
+                )
+                for start, stop in self.shards
+            ]
+        )
+        nb_results = min(nb_results, self.tfidf_matrix.shape[0])
+        return merge_top_k(shard_results, nb_results)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,119 @@
+"""
+Stages of a pipeline running on their own threads.
+
+A QueueStage consumes an iterator on a background thread, handing its
+items over to the next stage through a bounded queue. Chaining stages,
+e.g. reading, parsing, matching and writing, lets them overlap - the
+model runs while the next documents are downloaded and the previous
+references are matched - with at most maxsize items waiting between
+two stages.
+
+Each stage records how full its queue was and how long each side of it
+waited: a producer waiting on a full queue is faster than its consumer,
+a consumer waiting on an empty queue is faster than its producer, which
+shows where the bottleneck of the pipeline sits.
+"""
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class QueueStage:
+    def __init__(self, name, iterable, maxsize=64):
+        """
+        Args:
+            name(str): Name of the stage, in logs and stats.
+            iterable(iterable): Items produced by the stage, iterated on
+                its thread.
+            maxsize(int): Maximum number of items produced and not yet
+                consumed.
+        """
+        self.name = name
+        self.iterable = iterable
+        self.queue = queue.Queue(maxsize)
+        self.stopped = threading.Event()
+        self.error = None
+
+        self.items = 0
+        self.depth_total = 0
+        self.max_depth = 0
+        self.put_wait = 0.0
+        self.get_wait = 0.0
+
+        self.thread = threading.Thread(
+            target=self._produce, name='QueueStage-' + name, daemon=True
+        )
+        self.thread.start()
+
+    def _produce(self):
+        try:
+            for item in self.iterable:
+                if not self._put(item):
+                    return
+        except BaseException as e:
+            self.error = e
+        self._put(_DONE)
+
+    def _put(self, item):
+        t0 = time.time()
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            self.put_wait += time.time() - t0
+            return True
+        return False
+
+    def __iter__(self):
+        try:
+            while True:
+                depth = self.queue.qsize()
+                t0 = time.time()
+                item = self.queue.get()
+                self.get_wait += time.time() - t0
+                if item is _DONE:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                self.items += 1
+                self.depth_total += depth
+                self.max_depth = max(self.max_depth, depth)
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the producing thread, e.g. when the consumer gave up."""
+        self.stopped.set()
+        self.thread.join()
+
+    def stats(self):
+        """
+        Returns:
+            dict of the number of items passed, the mean and max number of
+            items queued when one was consumed, and the seconds spent by
+            the producer waiting on a full queue and the consumer waiting
+            on an empty one.
+        """
+        return {
+            'items': self.items,
+            'mean_depth': self.depth_total / max(self.items, 1),
+            'max_depth': self.max_depth,
+            'put_wait': self.put_wait,
+            'get_wait': self.get_wait,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(
+            'QueueStage.log_stats: stage=%s items=%d mean_depth=%.1f '
+            'max_depth=%d put_wait=%.3f get_wait=%.3f',
+            self.name, stats['items'], stats['mean_depth'],
+            stats['max_depth'], stats['put_wait'], stats['get_wait']
+        )
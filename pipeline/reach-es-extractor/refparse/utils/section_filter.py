@@ -0,0 +1,100 @@
+"""
+Cheap pre-filter of the sections sent to the reference parser.
+
+Many sections found by the PDF parser are tables or prose which don't
+cite anything, and running the deep reference parser on them is wasted
+time. A SectionFilter counts the markers references are made of -
+years, DOIs, "et al.", volume(issue):pages, "pp." and "vol." - in
+batches of sections at once, using pandas' vectorised string methods,
+and skips the sections with fewer than threshold markers per thousand
+characters.
+
+The threshold is deliberately low: a reference section has several
+markers per reference, so skipping one by mistake is much worse than
+parsing some tables with years in them. See
+algo_evaluation/evaluate_section_filter.py for the recall it costs; the
+filter is off (SECTION_FILTER_THRESHOLD=0) until that has been measured.
+"""
+from itertools import islice
+import re
+
+import numpy as np
+import pandas as pd
+
+CITATION_PATTERNS = [
+    # Years, e.g. 2019 or 2019a
+    r'\b(?:19|20)\d{2}[a-z]?\b',
+    # DOIs
+    r'\b10\.\d{4,9}/\S+',
+    r'\bet\.? al\b',
+    # Volume(issue):pages, e.g. 12(3):45-67
+    r'\b\d+\s?\(\d+\)\s?:\s?\d+',
+    r'\bpp?\.\s?\d+',
+    r'\bvol\.\s?\d+',
+]
+
+# Markers are matched ignoring case, e.g. "Et al" or "VOL. 3"
+CITATION_RE = re.compile(
+    '|'.join('(?:%s)' % pattern for pattern in CITATION_PATTERNS),
+    re.IGNORECASE
+)
+
+
+def citation_density(texts, min_chars=500):
+    """
+    Args:
+        texts(list): Section texts.
+        min_chars(int): Shorter texts are scored as if they were
+            min_chars long, so that a single year in a few words isn't
+            taken for a reference section.
+    Returns:
+        numpy array of the number of citation markers per thousand
+        characters of each text.
+    """
+    texts = pd.Series(texts, dtype=object).fillna('')
+    counts = texts.str.count(CITATION_RE).to_numpy(dtype=float)
+    lengths = np.maximum(texts.str.len().to_numpy(dtype=float), min_chars)
+    return 1000 * counts / lengths
+
+
+class SectionFilter:
+    def __init__(self, threshold=1.0, batch_size=256, min_chars=500):
+        """
+        Args:
+            threshold(float): Minimum number of citation markers per
+                thousand characters of the sections kept.
+            batch_size(int): Number of sections scored at once.
+            min_chars(int): See citation_density.
+        """
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.min_chars = min_chars
+        self.kept = 0
+        self.skipped = 0
+
+    def keep(self, texts):
+        """
+        Returns:
+            List of booleans, True for each of texts worth parsing.
+        """
+        scores = citation_density(texts, self.min_chars)
+        keep = (scores >= self.threshold).tolist()
+        kept = sum(keep)
+        self.kept += kept
+        self.skipped += len(keep) - kept
+        return keep
+
+    def filter_many(self, items, text=lambda item: item):
+        """
+        Args:
+            items(iterable): Items to filter, e.g. SectionedDocuments.
+            text(callable): Returns the section text of an item.
+        Yields:
+            (item, keep) tuples, in the order of items.
+        """
+        items = iter(items)
+        while True:
+            batch = list(islice(items, self.batch_size))
+            if not batch:
+                break
+            yield from zip(batch, self.keep([text(item) for item in batch]))
@@ -0,0 +1,116 @@
+"""
+Sliding windows over long reference sections.
+
+Long sections (some WHO reports have reference sections of millions of
+characters) are cut on line boundaries into windows of bounded size,
+which are parsed independently. Consecutive windows overlap by a few
+lines, so that a reference cut by the end of a window is found whole in
+the next one; references found twice around a boundary, whole or cut,
+are then dropped when merging the predictions of the windows.
+"""
+import re
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def split_windows(text, window_chars, overlap_chars):
+    """
+    Cut text in windows of at most window_chars characters, ending on line
+    boundaries, each starting about overlap_chars characters before the
+    end of the previous one. Lines longer than a window are cut.
+
+    Yields:
+        (window, is_last) tuples.
+    Raises:
+        ValueError: if window_chars isn't positive, or overlap_chars isn't
+            between 0 and window_chars, as windows wouldn't move forward.
+    """
+    if window_chars <= 0:
+        raise ValueError(
+            'window_chars must be positive, got %r' % window_chars
+        )
+    if not 0 <= overlap_chars < window_chars:
+        raise ValueError(
+            'overlap_chars must be at least 0 and less than window_chars '
+            '(%r), got %r' % (window_chars, overlap_chars)
+        )
+
+    if len(text) <= window_chars:
+        yield text, True
+        return
+
+    start = 0
+    while True:
+        end = start + window_chars
+        if end >= len(text):
+            yield text[start:], True
+            return
+
+        # End on the last line break of the window, if there is one past
+        # the overlap; otherwise cut the line.
+        line_end = text.rfind('\n', start + overlap_chars + 1, end)
+        if line_end != -1:
+            end = line_end + 1
+        yield text[start:end], False
+
+        # Start the next window on the first line beginning in the
+        # overlap, making sure windows move forward.
+        next_start = text.find('\n', end - overlap_chars, end - 1)
+        start = next_start + 1 if next_start != -1 else end
+
+
+def _normalize(reference):
+    return WHITESPACE_RE.sub(' ', reference).strip()
+
+
+def _is_duplicate(reference, others, min_chars):
+    return any(
+        reference == other or (
+            len(reference) >= min_chars and reference in other
+        )
+        for other in others
+    )
+
+
+def merge_window_predictions(window_predictions, min_chars=20):
+    """
+    Concatenate the reference predictions of consecutive windows of a
+    section, dropping references of a window which repeat, or are a part
+    of, a reference of the window next to it. Parts are only considered
+    for references of at least min_chars characters.
+
+    Args:
+        window_predictions(list): For each window, in order, the
+            predictions of SplitParser.split_parse.
+    Returns:
+        The reference predictions of the whole section.
+    """
+    merged = []
+    for i, predictions in enumerate(window_predictions):
+        previous = {
+            _normalize(p['Reference'])
+            for p in (window_predictions[i - 1] if i > 0 else [])
+        }
+        following = {
+            _normalize(p['Reference'])
+            for p in (
+                window_predictions[i + 1]
+                if i + 1 < len(window_predictions) else []
+            )
+        }
+        for prediction in predictions:
+            reference = _normalize(prediction['Reference'])
+            # A reference at the start of a window may be the end of one
+            # found whole in the previous window...
+            if _is_duplicate(reference, previous, min_chars):
+                continue
+            # ...and one at its end may have been cut, and be found whole
+            # in the next window.
+            if any(
+                reference != other and reference in other
+                and len(reference) >= min_chars
+                for other in following
+            ):
+                continue
+            merged.append(prediction)
+    return merged
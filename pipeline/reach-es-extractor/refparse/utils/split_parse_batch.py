@@ -0,0 +1,153 @@
+"""
+Run the deep reference parser model on the chunks of many sections at
+once.
+
+SplitParser.split_parse tokenizes a section, cuts its tokens in chunks
+of at most line_limit tokens and runs the model on the chunks of that
+one section, so the model is called once per section, however short,
+and its per call overhead is paid again and again. BatchSplitParser
+separates tokenizing from predicting: split_parse_texts tokenizes the
+sections of a batch, runs the model on all their chunks in batches of
+predict_batch_size chunks, and scatters the labels back to their
+sections, which are then cut in references.
+"""
+import configparser
+
+# Chunks run through the model in one call
+PREDICT_BATCH_SIZE = 64
+# Version of tokens_to_references, part of the model version of cached
+# predictions
+REFERENCES_VERSION = '1'
+
+SPLIT_LABEL_BEGIN = 'b-r'
+SPLIT_LABELS_INSIDE = ('i-r', 'e-r')
+SPLIT_LABEL_END = 'e-r'
+
+
+class BatchSplitParser:
+    """
+    Wraps a deep_reference_parser SplitParser. Any object with the same
+    tokenize and predict methods can be used by split_parse_texts.
+    """
+    def __init__(self, split_parser, config_file):
+        """
+        Args:
+            split_parser: loaded SplitParser.
+            config_file(str): Its config file, giving the maximum number
+                of tokens of a chunk.
+        """
+        # Imported here, as for SplitParser itself
+        from spacy.lang.en import English
+
+        config = configparser.ConfigParser()
+        config.read(config_file)
+        self.line_limit = config.getint('data', 'line_limit')
+        self.split_parser = split_parser
+        self.nlp = English()
+        self.weights_loaded = False
+
+    def tokenize(self, text):
+        """
+        Returns:
+            The tokens of text, as lists of at most line_limit tokens,
+            like SplitParser.split_parse cuts them.
+        """
+        tokens = [token.text for token in self.nlp(text)]
+        return [
+            tokens[start:start + self.line_limit]
+            for start in range(0, len(tokens), self.line_limit)
+        ]
+
+    def predict(self, chunks):
+        """
+        Args:
+            chunks(list): Lists of tokens, which the model pads.
+        Returns:
+            A (split_labels, parse_labels) tuple for each chunk, with one
+            label per token.
+        """
+        split_labels, parse_labels = self.split_parser.drp.predict(
+            chunks, load_weights=not self.weights_loaded
+        )
+        self.weights_loaded = True
+        return list(zip(split_labels, parse_labels))
+
+    def split_parse(self, text):
+        """Same as SplitParser.split_parse."""
+        return split_parse_texts(self, [text])[0]
+
+
+def tokens_to_references(tokens, split_labels, parse_labels):
+    """
+    Cut the labelled tokens of a section in references: a reference
+    begins with a b-r token, goes on with i-r tokens and ends with an
+    e-r one, or where the next begins. Whitespace tokens, e.g. line
+    breaks, are left out.
+
+    Returns:
+        Reference predictions, as SplitParser.split_parse.
+    """
+    references = []
+    reference = None
+    for token, split_label, parse_label in zip(
+            tokens, split_labels, parse_labels):
+        if token.isspace():
+            continue
+        if split_label == SPLIT_LABEL_BEGIN or (
+                reference is None and split_label in SPLIT_LABELS_INSIDE):
+            reference = []
+            references.append(reference)
+        elif split_label not in SPLIT_LABELS_INSIDE:
+            reference = None
+        if reference is None:
+            continue
+        reference.append((token, parse_label))
+        if split_label == SPLIT_LABEL_END:
+            reference = None
+
+    return [
+        {
+            'Reference': ' '.join(token for token, _ in attributes),
+            'Attributes': attributes,
+        }
+        for attributes in references
+    ]
+
+
+def split_parse_texts(split_parser, texts,
+                      predict_batch_size=PREDICT_BATCH_SIZE):
+    """
+    Args:
+        split_parser: BatchSplitParser.
+        texts(list): Texts to parse, or None for sections with nothing
+            to parse, e.g. skipped by a SectionFilter.
+        predict_batch_size(int): Maximum number of chunks per call of
+            the model.
+    Returns:
+        The reference predictions of each text.
+    """
+    text_chunks = [
+        split_parser.tokenize(text) if text is not None else []
+        for text in texts
+    ]
+    chunks = [chunk for chunks in text_chunks for chunk in chunks]
+
+    labels = []
+    for start in range(0, len(chunks), predict_batch_size):
+        labels.extend(
+            split_parser.predict(chunks[start:start + predict_batch_size])
+        )
+
+    labels = iter(labels)
+    predictions = []
+    for chunks in text_chunks:
+        tokens, split_labels, parse_labels = [], [], []
+        for chunk in chunks:
+            chunk_split_labels, chunk_parse_labels = next(labels)
+            tokens.extend(chunk)
+            split_labels.extend(chunk_split_labels)
+            parse_labels.extend(chunk_parse_labels)
+        predictions.append(
+            tokens_to_references(tokens, split_labels, parse_labels)
+        )
+    return predictions
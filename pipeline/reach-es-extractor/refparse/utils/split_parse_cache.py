@@ -0,0 +1,182 @@
+"""
+Content-addressed cache of the reference parser's predictions.
+
+Most documents of a monthly scrape haven't changed since the previous
+one, and parsing their sections again gives the same predictions. A
+SplitParseCache stores the predictions of each text parsed under a
+SHA-256 of the text and of the model version, in a local directory
+and, optionally, under an S3 prefix shared by every run, so that only
+new or changed sections, or a new model, cost a prediction.
+
+Sample usage::
+
+    cache = SplitParseCache(split_parse_model_version(), '/tmp/cache')
+    with SplitParsePool(num_workers) as pool:
+        cached_pool = CachedSplitParsePool(pool, cache)
+        for item, predictions in cached_pool.split_parse_many(items):
+            ...
+
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from urllib.parse import urlparse
+
+from .split_parse_batch import REFERENCES_VERSION
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(*texts):
+    """SHA-256 hex digest of texts, which doesn't change across runs."""
+    sha = hashlib.sha256()
+    for text in texts:
+        sha.update(text.encode('utf-8'))
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def split_parse_model_version():
+    """
+    Version of the model run by create_split_parser, which cached
+    predictions are only valid for. It includes the version of the way
+    split_parse_batch cuts labelled tokens in references.
+    """
+    # Imported here, as pkg_resources scans every installed package.
+    import pkg_resources
+
+    version = pkg_resources.get_distribution('deep_reference_parser').version
+    return 'deep_reference_parser-{}-multitask-{}'.format(
+        version, REFERENCES_VERSION
+    )
+
+
+class SplitParseCache:
+    def __init__(self, model_version, cache_dir=None, s3_url=None):
+        """
+        Args:
+            model_version(str): Version of the model, part of every key.
+            cache_dir(str): Local directory of cached predictions.
+            s3_url(str): S3 URL of a prefix of cached predictions, read
+                when they aren't found locally.
+        """
+        self.model_version = model_version
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+        self.s3 = None
+        if s3_url is not None:
+            import boto3
+
+            u = urlparse(s3_url)
+            self.s3 = boto3.client('s3')
+            self.bucket = u.netloc
+            self.prefix = u.path.strip('/')
+
+    def key(self, text):
+        return content_hash(self.model_version, text)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def _s3_key(self, key):
+        return '/'.join(p for p in (self.prefix, key + '.json') if p)
+
+    def get(self, text):
+        """
+        Returns:
+            The cached predictions of text, or None.
+        """
+        key = self.key(text)
+        predictions = None
+        if self.cache_dir is not None:
+            predictions = self._get_local(key)
+        if predictions is None and self.s3 is not None:
+            predictions = self._get_s3(key)
+            if predictions is not None and self.cache_dir is not None:
+                self._put_local(key, predictions)
+
+        if predictions is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return predictions
+
+    def put(self, text, predictions):
+        key = self.key(text)
+        if self.cache_dir is not None:
+            self._put_local(key, predictions)
+        if self.s3 is not None:
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=self._s3_key(key),
+                Body=json.dumps(predictions).encode('utf-8')
+            )
+
+    def _get_local(self, key):
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _put_local(self, key, predictions):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside then renamed, so that concurrent runs never read
+        # a partial file.
+        with tempfile.NamedTemporaryFile(
+                'w', dir=os.path.dirname(path), delete=False) as f:
+            json.dump(predictions, f)
+        os.replace(f.name, path)
+
+    def _get_s3(self, key):
+        try:
+            response = self.s3.get_object(
+                Bucket=self.bucket,
+                Key=self._s3_key(key)
+            )
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        return json.loads(response['Body'].read().decode('utf-8'))
+
+
+class CachedSplitParsePool:
+    """
+    Wraps a SplitParsePool, only sending it the texts whose predictions
+    aren't cached yet, and caching them.
+    """
+    def __init__(self, split_parse_pool, cache):
+        self.split_parse_pool = split_parse_pool
+        self.cache = cache
+
+    def split_parse_many(self, items, text=lambda item: item):
+        """
+        Same as SplitParsePool.split_parse_many.
+        """
+        def lookup(item):
+            item_text = text(item)
+            cached = None
+            if item_text is not None:
+                cached = self.cache.get(item_text)
+            return item, item_text, cached
+
+        predictions = self.split_parse_pool.split_parse_many(
+            (lookup(item) for item in items),
+            lambda entry: entry[1] if entry[2] is None else None
+        )
+        for (item, item_text, cached), reference_predictions in predictions:
+            if cached is not None:
+                yield item, cached
+                continue
+            if item_text is not None:
+                self.cache.put(item_text, reference_predictions)
+            yield item, reference_predictions
+
+        logger.info(
+            'CachedSplitParsePool.split_parse_many: hits=%d misses=%d',
+            self.cache.hits, self.cache.misses
+        )
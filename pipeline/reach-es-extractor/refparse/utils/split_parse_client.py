@@ -0,0 +1,98 @@
+"""
+Client of the reference parser served by refparse.split_parse_server.
+
+A SplitParseClient stands in for a SplitParsePool: tasks using it don't
+load the model themselves, and start parsing right away, sending their
+sections by batches to a server which has the model loaded already.
+"""
+import json
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from .split_parse_pool import pack_batches
+
+
+class SplitParseServerError(Exception):
+    """Exception to raise when the server answers a request with an
+       error status.
+    """
+    def __init__(self, url, status, error):
+        super().__init__('url=%s status=%s error=%s' % (url, status, error))
+        self.url = url
+        self.status = status
+        self.error = error
+
+
+class SplitParseClient:
+    def __init__(self, url, batch_size=1, max_batch_chars=100000,
+                 timeout=600):
+        """
+        Args:
+            url(str): Base URL of the server, e.g. http://localhost:8765
+            batch_size(int): Maximum number of sections per request.
+            max_batch_chars(int): Maximum number of characters per
+                request; longer sections are sent on their own.
+            timeout(int): Seconds to wait for each response.
+        """
+        self.url = url.rstrip('/')
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.timeout = timeout
+
+    def _request(self, path, body=None):
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+        request = Request(
+            self.url + path,
+            data=data,
+            headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except HTTPError as e:
+            # Parsing errors come with a JSON body, others with the
+            # reason of their status only.
+            try:
+                error = json.loads(e.read().decode('utf-8'))['error']
+            except (TypeError, ValueError, KeyError):
+                error = e.reason
+            raise SplitParseServerError(
+                self.url + path, e.code, error
+            ) from None
+
+    def model_version(self):
+        """Version of the model the server runs."""
+        return self._request('/health')['model_version']
+
+    def split_parse_batch(self, texts):
+        return self._request('/split_parse', {'texts': texts})['predictions']
+
+    def split_parse_many(self, items, text=lambda item: item):
+        """
+        Same as SplitParsePool.split_parse_many.
+        """
+        batches = pack_batches(
+            items, text, self.batch_size, self.max_batch_chars
+        )
+        for batch in batches:
+            texts = [item_text for _, item_text in batch
+                     if item_text is not None]
+            predictions = iter(
+                self.split_parse_batch(texts) if texts else []
+            )
+            for item, item_text in batch:
+                if item_text is None:
+                    yield item, []
+                else:
+                    yield item, next(predictions)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
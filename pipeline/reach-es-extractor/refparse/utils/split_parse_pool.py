@@ -0,0 +1,180 @@
+"""
+Pool of processes running the deep reference parser.
+
+Each worker loads its own SplitParser once, when it starts, and then
+parses the sections it is sent. Sections are submitted as they are read,
+with at most max_pending batches of them queued or being parsed at once,
+so that memory stays bounded however large the input is, and
+predictions are yielded back in input order.
+
+Sections of consecutive documents are packed into batches, up to a
+number of sections and of characters, and each batch is one task for a
+worker. Many short sections thus share one round trip to a worker, and
+workers get tasks of similar sizes, which keeps them all busy. Within a
+batch, the model runs on the chunks of all its sections at once, see
+split_parse_batch, and predictions are scattered back to their
+documents. With one worker, batches are parsed in this process alike.
+
+Workers are started with the 'spawn' method, as forking a process which
+has loaded tensorflow isn't safe.
+"""
+from collections import deque
+import logging
+import multiprocessing
+
+from .split_parse_batch import (
+    PREDICT_BATCH_SIZE, BatchSplitParser, split_parse_texts
+)
+
+logger = logging.getLogger(__name__)
+
+# BatchSplitParser of a worker process, and its predict_batch_size
+_worker_split_parser = None
+_worker_predict_batch_size = None
+
+
+def create_split_parser():
+    # Imported here, as loading the model libraries takes a while and
+    # only the processes actually parsing need them.
+    from deep_reference_parser.split_parse import SplitParser
+    from deep_reference_parser.common import MULTITASK_CFG
+
+    return BatchSplitParser(
+        SplitParser(config_file=MULTITASK_CFG), MULTITASK_CFG
+    )
+
+
+def _init_worker(parser_factory, predict_batch_size):
+    global _worker_split_parser, _worker_predict_batch_size
+    _worker_split_parser = parser_factory()
+    _worker_predict_batch_size = predict_batch_size
+
+
+def _split_parse_batch(texts):
+    return split_parse_texts(
+        _worker_split_parser, texts, _worker_predict_batch_size
+    )
+
+
+def pack_batches(items, text, batch_size, max_batch_chars):
+    """
+    Group consecutive items in batches of at most batch_size items, and
+    of at most max_batch_chars characters of text unless a single item
+    is longer.
+
+    Yields:
+        Lists of (item, text) tuples.
+    """
+    batch = []
+    batch_chars = 0
+    for item in items:
+        item_text = text(item)
+        item_chars = len(item_text) if item_text is not None else 0
+        if batch and (len(batch) == batch_size
+                      or batch_chars + item_chars > max_batch_chars):
+            yield batch
+            batch = []
+            batch_chars = 0
+        batch.append((item, item_text))
+        batch_chars += item_chars
+    if batch:
+        yield batch
+
+
+class SplitParsePool:
+    """
+    Use as a context manager, or call close(), to stop the workers.
+    """
+    def __init__(self, num_workers=1, max_pending=None,
+                 parser_factory=create_split_parser, batch_size=1,
+                 max_batch_chars=100000,
+                 predict_batch_size=PREDICT_BATCH_SIZE):
+        """
+        Args:
+            num_workers(int): Number of worker processes. With one worker,
+                sections are parsed in this process.
+            max_pending(int): Maximum number of batches submitted and not
+                yet yielded back. Defaults to twice the number of workers.
+            parser_factory(callable): Module level function returning a
+                BatchSplitParser, called once by each worker.
+            batch_size(int): Maximum number of sections per batch.
+            max_batch_chars(int): Maximum number of characters per batch;
+                longer sections make a batch of their own.
+            predict_batch_size(int): Maximum number of chunks of the
+                sections of a batch per call of the model.
+        """
+        self.num_workers = max(num_workers or 1, 1)
+        self.max_pending = max_pending or 2 * self.num_workers
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.predict_batch_size = predict_batch_size
+
+        self.pool = None
+        self.split_parser = None
+        if self.num_workers == 1:
+            self.split_parser = parser_factory()
+        else:
+            self.pool = multiprocessing.get_context('spawn').Pool(
+                self.num_workers,
+                initializer=_init_worker,
+                initargs=(parser_factory, predict_batch_size)
+            )
+        logger.info(
+            'SplitParsePool: num_workers=%d max_pending=%d batch_size=%d '
+            'max_batch_chars=%d predict_batch_size=%d', self.num_workers,
+            self.max_pending, self.batch_size, self.max_batch_chars,
+            self.predict_batch_size
+        )
+
+    def split_parse_many(self, items, text=lambda item: item):
+        """
+        Args:
+            items(iterable): Items to parse, e.g. SectionedDocuments.
+            text(callable): Returns the text to parse of an item, or None
+                if it has nothing to parse.
+        Yields:
+            (item, reference_predictions) tuples, in the order of items.
+        """
+        batches = pack_batches(
+            items, text, self.batch_size, self.max_batch_chars
+        )
+        if self.pool is None:
+            for batch in batches:
+                predictions = split_parse_texts(
+                    self.split_parser,
+                    [item_text for _, item_text in batch],
+                    self.predict_batch_size
+                )
+                for (item, _), item_predictions in zip(batch, predictions):
+                    yield item, item_predictions
+            return
+
+        pending = deque()
+        for batch in batches:
+            texts = [item_text for _, item_text in batch]
+            pending.append(
+                (batch, self.pool.apply_async(_split_parse_batch, (texts,)))
+            )
+            if len(pending) >= self.max_pending:
+                yield from self._scatter(*pending.popleft())
+        while pending:
+            yield from self._scatter(*pending.popleft())
+
+    @staticmethod
+    def _scatter(batch, result):
+        for (item, _), predictions in zip(batch, result.get()):
+            yield item, predictions
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is not None and self.pool is not None:
+            self.pool.terminate()
+        self.close()
@@ -8,15 +8,52 @@ import gzip
 import json
 import os
 import argparse
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from elasticsearch.exceptions import TransportError
 
 import elastic.common
 from hooks import s3hook
 from hooks.sentry import report_exception
+from match_cache import TitleMatchCache, cache_namespace
+from safe_import import safe_import
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+BACKENDS = ('es', 'local-index')
+
+# Elasticsearch answers these when it is overloaded; such requests are
+# retried with exponential backoff.
+RETRY_STATUSES = (429, 503)
+MAX_RETRIES = 8
+BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 30
+
+
+def backoff_seconds(attempt):
+    """Exponential backoff with jitter, so that threads don't retry in sync."""
+    return min(
+        MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** attempt
+    ) * random.uniform(0.5, 1)
+
+
+def chunks(iterable, size):
+    """Yield lists of at most size consecutive items from iterable."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 def yield_structured_references(s3, structured_references_path):
     with tempfile.TemporaryFile(mode='rb+') as tf:
         key = s3.get_s3_object(structured_references_path)
@@ -27,6 +64,40 @@ def yield_structured_references(s3, structured_references_path):
                 yield json.loads(line)
 
 
+def join_document_metadata(records):
+    """
+    Yield the references of parsed references records, attaching to
+    each the metadata of its document.
+
+    In the normalized output of ExtractRefsOperator, the metadata of a
+    document is only written once, in a document record preceding its
+    references, which is kept here by document_id and shared by them.
+    References which hold their own metadata are yielded as they are.
+    """
+    documents = {}
+    for record in records:
+        if 'document_metadata' in record:
+            documents[record['document_id']] = record['document_metadata']
+            continue
+        if 'metadata' not in record:
+            record['metadata'] = documents.get(record.get('document_id'), {})
+        yield record
+
+
+def yield_publications(s3, publications_path):
+    """
+    Yield EPMC metadata records, as imported into Elasticsearch, from a
+    local or S3 json.gz file.
+    """
+    if publications_path.startswith('s3://'):
+        yield from yield_structured_references(s3, publications_path)
+        return
+
+    with gzip.open(publications_path, 'rb') as f:
+        for line in f:
+            yield json.loads(line)
+
+
 def map_author(author):
     return "%s %s" % (
         author.get(
@@ -35,19 +106,195 @@ def map_author(author):
         ), author.get("Initials", "?"),)
 
 
+class SearchErrorException(Exception):
+    """Exception to raise when an Elasticsearch query of a multi search
+       fails.
+    """
+    def __init__(self, status, error):
+        super().__init__('status=%s error=%s' % (status, error))
+        self.status = status
+        self.error = error
+
+
 class ElasticsearchFuzzyMatcher:
     MAX_TITLE_LENGTH = 512
 
     def __init__(self, es, score_threshold, should_match_threshold,
-                 es_index, organisation, min_title_length=0):
+                 es_index, organisation, min_title_length=0,
+                 match_cache=None, index_version=''):
+        """
+        Args:
+            match_cache: optional TitleMatchCache of the best hit of each
+                normalised title; the score threshold is applied after
+                lookup.
+            index_version: identifies the content of es_index, so that
+                cached hits are not reused once it is rebuilt.
+        """
         self.es = es
         self.es_index = es_index
         self.score_threshold = score_threshold
         self.min_title_length = min_title_length
         self.should_match_threshold = should_match_threshold
         self.organisation = organisation
+        self.match_cache = match_cache
+        self.cache_namespace = cache_namespace(
+            'es_fuzzy_match', es_index, index_version,
+            should_match_threshold, self.MAX_TITLE_LENGTH
+        )
 
-    def match(self, reference):
+    def query_body(self, title):
+        return {
+            "query": {
+                "match": {
+                    "doc.title": {
+                        "query": title,
+                        "minimum_should_match": f"{self.should_match_threshold}%"
+                    }
+                }
+            }
+        }
+
+    @staticmethod
+    def best_hit(res):
+        """
+        Returns:
+            The best hit of a search response, or None if nothing matched.
+        """
+        if res['hits']['total']['value'] == 0:
+            return None
+
+        hit = res['hits']['hits'][0]
+        return {
+            '_id': hit.get('_id'),
+            '_score': hit['_score'],
+            '_source': hit['_source'],
+        }
+
+    def search_best_matches(self, titles):
+        """
+        Look up the best hit of each title, sending the titles which
+        aren't cached in a single _msearch request.
+
+        Returns:
+            A list with the best hit, or None, of each title.
+        """
+        if self.match_cache is None:
+            best_matches = [None] * len(titles)
+            missing = list(range(len(titles)))
+        else:
+            best_matches = [
+                self.match_cache.get(self.cache_namespace, title)
+                for title in titles
+            ]
+            missing = [
+                i for i, best_match in enumerate(best_matches)
+                if best_match is self.match_cache.MISSING
+            ]
+
+        # Query each distinct title once
+        missing_titles = list(dict.fromkeys(titles[i] for i in missing))
+        if missing_titles:
+            searched = self.msearch_best_hits(missing_titles)
+            if self.match_cache is not None:
+                for title, best_match in searched.items():
+                    self.match_cache.put(
+                        self.cache_namespace, title, best_match
+                    )
+
+            for i in missing:
+                best_matches[i] = searched[titles[i]]
+
+        return best_matches
+
+    def msearch_best_hits(self, titles):
+        """
+        Returns:
+            dict of the best hit, or None, of each title, from _msearch
+            requests. Queries rejected because ES is overloaded are sent
+            again after a backoff.
+        """
+        best_hits = {}
+        pending = titles
+        for attempt in range(MAX_RETRIES + 1):
+            body = []
+            for title in pending:
+                body.append({})
+                body.append(dict(self.query_body(title), size=1))
+            res = self.with_backoff(
+                self.es.msearch, body=body, index=self.es_index
+            )
+
+            rejected = []
+            for title, response in zip(pending, res['responses']):
+                if 'error' not in response:
+                    best_hits[title] = self.best_hit(response)
+                elif (response.get('status') in RETRY_STATUSES
+                        and attempt < MAX_RETRIES):
+                    rejected.append(title)
+                else:
+                    raise SearchErrorException(
+                        response.get('status'), response['error']
+                    )
+
+            if not rejected:
+                break
+            pending = rejected
+            seconds = backoff_seconds(attempt)
+            logger.info(
+                'ElasticsearchFuzzyMatcher.msearch_best_hits: '
+                'rejected=%d attempt=%d sleep=%.1f',
+                len(rejected), attempt + 1, seconds
+            )
+            time.sleep(seconds)
+
+        return best_hits
+
+    @staticmethod
+    def with_backoff(request, *args, **kwargs):
+        """Call request, retrying it while ES answers 429 or 503."""
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                return request(*args, **kwargs)
+            except TransportError as e:
+                if e.status_code not in RETRY_STATUSES or \
+                        attempt == MAX_RETRIES:
+                    raise
+                seconds = backoff_seconds(attempt)
+                logger.info(
+                    'ElasticsearchFuzzyMatcher.with_backoff: '
+                    'status=%s attempt=%d sleep=%.1f',
+                    e.status_code, attempt + 1, seconds
+                )
+                time.sleep(seconds)
+
+    def search_best_match(self, title):
+        """
+        Returns:
+            The best hit for title, or None if nothing matched.
+        """
+        if self.match_cache is not None:
+            best_match = self.match_cache.get(self.cache_namespace, title)
+            if best_match is not self.match_cache.MISSING:
+                return best_match
+
+        res = self.with_backoff(
+            self.es.search,
+            index=self.es_index,
+            body=self.query_body(title),
+            size=1
+        )
+        best_match = self.best_hit(res)
+
+        if self.match_cache is not None:
+            self.match_cache.put(self.cache_namespace, title, best_match)
+        return best_match
+
+    def query_title(self, reference):
+        """
+        Returns:
+            The title to search for reference, or None if it can't be
+            matched.
+        """
         if not reference.get('Title'):
             return
 
@@ -72,28 +319,67 @@ class ElasticsearchFuzzyMatcher:
                 'orig-length=%d doc-id=%s truncated-title=%r',
                 title_len, reference.get('document_id', "Unkown ID"), title
             )
+        return title
 
-        body = {
-            "query": {
-                "match": {
-                    "doc.title": {
-                        "query": title,
-                        "minimum_should_match": f"{self.should_match_threshold}%"
-                    }
-                }
-            }
-        }
-        res = self.es.search(
-            index=self.es_index,
-            body=body,
-            size=1
+    def match(self, reference):
+        title = self.query_title(reference)
+        if title is None:
+            return
+
+        return self.matched_reference(
+            reference, self.search_best_match(title)
         )
 
-        matches_count = res['hits']['total']['value']
-        if matches_count == 0:
+    def match_many(self, references, batch_size=100, concurrency=1):
+        """
+        Match references by batches of batch_size, each sent as one
+        _msearch request.
+
+        With a concurrency above 1, batches are matched on a pool of
+        threads keeping that many requests in flight, while the next
+        batches are read ahead from references. At most 2 * concurrency
+        batches are held at once.
+
+        Yields:
+            For each reference, in order, the same value match() returns.
+        """
+        batches = chunks(references, batch_size)
+        if concurrency <= 1:
+            for batch in batches:
+                yield from self.match_batch(batch)
+            return
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            in_flight = deque()
+            for batch in batches:
+                in_flight.append(executor.submit(self.match_batch, batch))
+                if len(in_flight) >= 2 * concurrency:
+                    yield from in_flight.popleft().result()
+            while in_flight:
+                yield from in_flight.popleft().result()
+
+    def match_batch(self, references):
+        titles = [self.query_title(reference) for reference in references]
+        searchable = [title for title in titles if title is not None]
+
+        t0 = time.time()
+        best_matches = iter(self.search_best_matches(searchable))
+        logger.info(
+            'ElasticsearchFuzzyMatcher.match_batch: '
+            'references=%d titles=%d seconds=%.3f',
+            len(references), len(searchable), time.time() - t0
+        )
+
+        return [
+            None if title is None
+            else self.matched_reference(reference, next(best_matches))
+            for reference, title in zip(references, titles)
+        ]
+
+    def matched_reference(self, reference, best_match):
+        if best_match is None:
             return
 
-        best_match = res['hits']['hits'][0]
         best_score = best_match['_score']
         if best_score > self.score_threshold:
             matched_reference = best_match['_source']
@@ -102,37 +388,110 @@ class ElasticsearchFuzzyMatcher:
             #     'doc-id=%s similarity=%.1f',
             #     reference['Document id'], best_score
             # )
-            ref_metadata = reference.get('metadata', {})
-            return {
-                'reference_id': reference.get('reference_id', None),
-                'extracted_title': reference.get('Title', None),
-                'similarity': best_score,
-
-                # Matched reference information
-                'match_id': best_match.get('_id'),
-                'match_title': matched_reference.get('doc', {}).get('title', 'Unknown'),
-                'match_algo': 'Fuzzy match',
-                'match_pub_year': matched_reference.get('doc', {}).get('pubYear', None),
-                'match_authors': ", ".join(list(map(map_author, matched_reference.get('doc', {}).get('authors', [])))),
-                'match_publication': matched_reference.get('doc', {}).get('journalTitle', 'Unknown'),
-                'match_pmcid': matched_reference.get('doc', {}).get('pmcid', None),
-                'match_pmid': matched_reference.get('doc', {}).get('pmid', None),
-                'match_doi': matched_reference.get('doc', {}).get('doi', None),
-                'match_issn': matched_reference.get('doc', {}).get('journalISSN', None),
-                'match_source': 'EPMC',
-                'associated_policies_count': 1,
-
-                # Policy information
-                'policies': [{
-                    'doc_id': ref_metadata.get("file_hash", None),
-                    'source_url': ref_metadata.get('url', None),
-                    'title': ref_metadata.get('title', None),
-                    'source_page': ref_metadata.get('source_page', None),
-                    'source_page_title': ref_metadata.get('source_page_title', None),
-                    'pdf_creator': ref_metadata.get('creator', None),
-                    'organisation': self.organisation,
-                }]
-            }
+            return match_record(
+                reference,
+                best_match.get('_id'),
+                best_score,
+                matched_reference.get('doc', {}),
+                self.organisation
+            )
+
+
+class LocalFuzzyMatcher:
+    """
+    Matches references in process with refparse's TF-IDF FuzzyMatcher,
+    which holds the publications, yielding the same records as
+    ElasticsearchFuzzyMatcher. Similarities are cosine similarities, in
+    [0, 1], rather than Elasticsearch scores, and match ids are those of
+    local_match_id rather than Elasticsearch ids.
+    """
+    def __init__(self, fuzzy_matcher, organisation):
+        self.fuzzy_matcher = fuzzy_matcher
+        self.organisation = organisation
+
+    def match_many(self, references, batch_size=1000, concurrency=1):
+        """
+        Match references by batches of batch_size titles, each scored
+        with one sparse matrix product. Matching is CPU bound, so
+        concurrency is ignored.
+
+        Yields:
+            For each reference, in order, a match record or None.
+        """
+        for batch in chunks(references, batch_size):
+            best_publications = self.fuzzy_matcher.best_publications(
+                [reference.get('Title') for reference in batch]
+            )
+            for reference, best_publication in zip(batch, best_publications):
+                if best_publication is None:
+                    yield None
+                    continue
+                publication, similarity = best_publication
+                yield match_record(
+                    reference,
+                    local_match_id(publication),
+                    similarity,
+                    publication,
+                    self.organisation
+                )
+
+    def match(self, reference):
+        return next(self.match_many([reference]))
+
+
+def local_match_id(publication):
+    """
+    Stable id of a publication of the local index, standing in for the
+    id Elasticsearch gives to its documents.
+
+    The two can't be the same: EPMC metadata is bulk imported into
+    Elasticsearch without ids, so its ids are generated anew by every
+    import. The same publication thus has a different match_id with each
+    backend; match ids are only meant to group the references matched
+    to a publication within one output.
+    """
+    for key in ('pmid', 'pmcid', 'doi'):
+        if publication.get(key):
+            return str(publication[key])
+    return publication['title']
+
+
+def match_record(reference, match_id, similarity, doc, organisation):
+    """
+    Returns:
+        The output record of a reference matched to publication doc.
+    """
+    ref_metadata = reference.get('metadata', {})
+    return {
+        'reference_id': reference.get('reference_id', None),
+        'extracted_title': reference.get('Title', None),
+        'similarity': similarity,
+
+        # Matched reference information
+        'match_id': match_id,
+        'match_title': doc.get('title', 'Unknown'),
+        'match_algo': 'Fuzzy match',
+        'match_pub_year': doc.get('pubYear', None),
+        'match_authors': ", ".join(list(map(map_author, doc.get('authors', [])))),
+        'match_publication': doc.get('journalTitle', 'Unknown'),
+        'match_pmcid': doc.get('pmcid', None),
+        'match_pmid': doc.get('pmid', None),
+        'match_doi': doc.get('doi', None),
+        'match_issn': doc.get('journalISSN', None),
+        'match_source': 'EPMC',
+        'associated_policies_count': 1,
+
+        # Policy information
+        'policies': [{
+            'doc_id': ref_metadata.get("file_hash", None),
+            'source_url': ref_metadata.get('url', None),
+            'title': ref_metadata.get('title', None),
+            'source_page': ref_metadata.get('source_page', None),
+            'source_page_title': ref_metadata.get('source_page_title', None),
+            'pdf_creator': ref_metadata.get('creator', None),
+            'organisation': organisation,
+        }]
+    }
 
 
 class FuzzyMatchRefsOperator(object):
@@ -141,6 +500,13 @@ class FuzzyMatchRefsOperator(object):
 
     Args:
         references: The references to match against the database
+        backend: 'es' to query the EPMC index of Elasticsearch, or
+            'local-index' to match in process against the publications
+            of publications_path, with refparse's FuzzyMatcher.
+        msearch_batch_size: references per _msearch request, with the es
+            backend.
+        local_batch_size: references per matrix product, with the
+            local-index backend.
     """
 
     template_fields = (
@@ -151,7 +517,21 @@ class FuzzyMatchRefsOperator(object):
     def __init__(self, es_hosts, src_s3_key, dst_s3_key, es_index,
                  score_threshold=50,
                  organisation=None,
-                 should_match_threshold=80):
+                 should_match_threshold=80,
+                 match_cache_dir=None,
+                 match_cache_size=100000,
+                 msearch_batch_size=100,
+                 local_batch_size=1000,
+                 concurrency=1,
+                 backend='es',
+                 publications_path=None,
+                 index_cache_dir=None,
+                 similarity_threshold=0.8):
+
+        if backend not in BACKENDS:
+            raise ValueError('Unknown backend %r' % backend)
+        if backend == 'local-index' and not publications_path:
+            raise ValueError('The local-index backend needs publications_path')
 
         self.src_s3_key = src_s3_key
         self.dst_s3_key = dst_s3_key
@@ -159,32 +539,98 @@ class FuzzyMatchRefsOperator(object):
         self.should_match_threshold = should_match_threshold
         self.es_index = es_index
         self.organisation = organisation
-
-        self.es = elastic.common.connect(es_hosts)
+        self.match_cache_dir = match_cache_dir
+        self.match_cache_size = match_cache_size
+        self.msearch_batch_size = msearch_batch_size
+        self.local_batch_size = local_batch_size
+        self.concurrency = concurrency
+        self.backend = backend
+        self.publications_path = publications_path
+        self.index_cache_dir = index_cache_dir
+        self.similarity_threshold = similarity_threshold
+
+        self.es = None
+        if backend == 'es':
+            self.es = elastic.common.connect(es_hosts)
+
+    def index_version(self):
+        """
+        Identify the current content of es_index (or of the indices it
+        is an alias of) by their UUIDs, which change on every reimport.
+        """
+        index_settings = self.es.indices.get_settings(index=self.es_index)
+        return ','.join(sorted(
+            settings['settings']['index']['uuid']
+            for settings in index_settings.values()
+        ))
 
     @report_exception
     def execute(self):
         s3 = s3hook.S3Hook()
 
-        fuzzy_matcher = ElasticsearchFuzzyMatcher(
-            self.es,
-            self.score_threshold,
-            self.should_match_threshold,
-            self.es_index,
-            self.organisation,
+        match_cache = TitleMatchCache(
+            max_size=self.match_cache_size,
+            cache_dir=self.match_cache_dir
+        )
+        with match_cache:
+            fuzzy_matcher = self.create_fuzzy_matcher(match_cache, s3)
+            references = self.match_references(fuzzy_matcher, s3)
+        self.write_references(references, s3)
+
+    def create_fuzzy_matcher(self, match_cache, s3):
+        if self.backend == 'es':
+            return ElasticsearchFuzzyMatcher(
+                self.es,
+                self.score_threshold,
+                self.should_match_threshold,
+                self.es_index,
+                self.organisation,
+                match_cache=match_cache,
+                index_version=self.index_version(),
+            )
+
+        with safe_import():
+            from refparse.utils import FuzzyMatcher
+
+        publications = list(yield_publications(s3, self.publications_path))
+        logger.info(
+            'FuzzyMatchRefsOperator: publications=%d', len(publications)
+        )
+        return LocalFuzzyMatcher(
+            FuzzyMatcher(
+                publications,
+                self.similarity_threshold,
+                index_cache_dir=self.index_cache_dir,
+                match_cache=match_cache
+            ),
+            self.organisation
+        )
+
+    def match_references(self, fuzzy_matcher, s3):
+        """
+        Returns:
+            dict of matched references by match_id, with the policies
+            citing them.
+        """
+        refs = join_document_metadata(
+            yield_structured_references(s3, self.src_s3_key)
         )
-        refs = yield_structured_references(s3, self.src_s3_key)
         match_count = 0
         count = 0
         references = {}
-        for count, structured_reference in enumerate(refs, 1):
+        if self.backend == 'es':
+            batch_size = self.msearch_batch_size
+        else:
+            batch_size = self.local_batch_size
+        fuzzy_matched_references = fuzzy_matcher.match_many(
+            refs, batch_size, self.concurrency
+        )
+        for count, fuzzy_matched_reference in enumerate(
+                fuzzy_matched_references, 1):
             if count % 500 == 0:
                 logger.info(
                     'FuzzyMatchRefsOperator: references=%d', count
                 )
-            fuzzy_matched_reference = fuzzy_matcher.match(
-                structured_reference
-            )
             if fuzzy_matched_reference:
                 ref_id = fuzzy_matched_reference['match_id']
                 if ref_id in references.keys():
@@ -204,7 +650,9 @@ class FuzzyMatchRefsOperator(object):
                         'FuzzyMatchRefsOperator: matches=%d',
                         match_count
                     )
+        return references
 
+    def write_references(self, references, s3):
         with tempfile.NamedTemporaryFile(mode='wb') as output_raw_f:
             with gzip.GzipFile(mode='wb', fileobj=output_raw_f) as output_f:
                 # This probably looks really odd, but we're basically ensuring that if there are no citations,
@@ -228,10 +676,9 @@ class FuzzyMatchRefsOperator(object):
 
 
 if __name__ == '__main__':
-    es_host = os.environ['ES_HOST']
-    es_port = os.environ.get('ES_PORT', 9200)
-
-    es_hosts = [(es_host, es_port)]
+    es_hosts = None
+    if 'ES_HOST' in os.environ:
+        es_hosts = [(os.environ['ES_HOST'], os.environ.get('ES_PORT', 9200))]
     arg_parser = argparse.ArgumentParser(
         description='Run a web scraper for a given organisation and writes the'
                     ' results to the given S3 path.'
@@ -252,7 +699,8 @@ if __name__ == '__main__':
     )
     arg_parser.add_argument(
         'epmc_es_index',
-        help='The index where EPMC data is stored.'
+        nargs='?',
+        help='The index where EPMC data is stored, for the es backend.'
     )
     arg_parser.add_argument(
         '--score_threshold',
@@ -265,6 +713,64 @@ if __name__ == '__main__':
         help="The maximum number of items to index."
     )
 
+    arg_parser.add_argument(
+        '--msearch_batch_size',
+        default=100,
+        type=int,
+        help="Number of references matched per Elasticsearch _msearch "
+             "request."
+    )
+    arg_parser.add_argument(
+        '--local_batch_size',
+        default=1000,
+        type=int,
+        help="Number of references matched per matrix product, with the "
+             "local-index backend."
+    )
+    arg_parser.add_argument(
+        '--backend',
+        choices=BACKENDS,
+        default='es',
+        help="Match against Elasticsearch, or in process against a local "
+             "index of the publications of --publications_path. Match ids "
+             "differ between the two."
+    )
+    arg_parser.add_argument(
+        '--publications_path',
+        help="Local path or S3 URL of the EPMC metadata json.gz file, for "
+             "the local-index backend."
+    )
+    arg_parser.add_argument(
+        '--index_cache_dir',
+        help="Local directory where the local-index backend keeps its "
+             "prebuilt publication indexes."
+    )
+    arg_parser.add_argument(
+        '--similarity_threshold',
+        default=0.8,
+        type=float,
+        help="Minimum cosine similarity of a match, for the local-index "
+             "backend."
+    )
+    arg_parser.add_argument(
+        '--concurrency',
+        default=1,
+        type=int,
+        help="Number of _msearch requests kept in flight."
+    )
+    arg_parser.add_argument(
+        '--match_cache_dir',
+        default=os.environ.get('MATCH_CACHE_DIR'),
+        help="Local directory where best matches by title are cached "
+             "across runs."
+    )
+    arg_parser.add_argument(
+        '--match_cache_size',
+        default=100000,
+        type=int,
+        help="Maximum number of titles cached in memory."
+    )
+
     args = arg_parser.parse_args()
 
     fuzzy_matcher = FuzzyMatchRefsOperator(
@@ -274,6 +780,15 @@ if __name__ == '__main__':
         args.epmc_es_index,
         score_threshold=args.score_threshold,
         organisation=args.organisation,
-        should_match_threshold=args.should_match_threshold
+        should_match_threshold=args.should_match_threshold,
+        match_cache_dir=args.match_cache_dir,
+        match_cache_size=args.match_cache_size,
+        msearch_batch_size=args.msearch_batch_size,
+        local_batch_size=args.local_batch_size,
+        concurrency=args.concurrency,
+        backend=args.backend,
+        publications_path=args.publications_path,
+        index_cache_dir=args.index_cache_dir,
+        similarity_threshold=args.similarity_threshold
     )
     fuzzy_matcher.execute()
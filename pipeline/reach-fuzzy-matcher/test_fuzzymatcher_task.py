@@ -0,0 +1,300 @@
+import random
+import time
+
+import pytest
+from elasticsearch.exceptions import TransportError
+
+import fuzzymatcher_task
+from fuzzymatcher_task import (
+    ElasticsearchFuzzyMatcher, FuzzyMatchRefsOperator, LocalFuzzyMatcher,
+    SearchErrorException, join_document_metadata
+)
+
+TOPICS = [
+    'malaria', 'tuberculosis', 'measles', 'cholera', 'influenza', 'dengue',
+    'rabies', 'polio', 'typhoid', 'leprosy', 'ebola', 'zika', 'anthrax',
+    'tetanus', 'rubella', 'mumps', 'diphtheria', 'pertussis', 'hepatitis',
+    'plague',
+]
+
+PUBLICATIONS = [
+    {
+        'pmid': str(i),
+        'title': 'Treatment guidelines for %s in children' % topic,
+        'journalTitle': 'Journal %d' % i,
+        'authors': [{'LastName': 'Smith', 'Initials': 'J'}],
+    }
+    for i, topic in enumerate(TOPICS)
+]
+
+
+def es_response(publication):
+    if publication is None:
+        return {'hits': {'total': {'value': 0}, 'hits': []}}
+    return {'hits': {'total': {'value': 1}, 'hits': [{
+        '_id': 'es-%s' % publication['pmid'],
+        '_score': 100,
+        '_source': {'doc': publication},
+    }]}}
+
+
+class FakeElasticsearch:
+    """
+    Answers each query with the publication of the same title, if any.
+    """
+    def __init__(self, publications=PUBLICATIONS, rejections=(),
+                 delay=0):
+        """
+        Args:
+            rejections: statuses the next msearch calls fail with, either
+                as a TransportError (an int) or as the error of each of
+                their queries (a tuple of one status per query)
+            delay: maximum seconds each msearch call takes
+        """
+        self.publications = dict(
+            (publication['title'], publication)
+            for publication in publications
+        )
+        self.rejections = list(rejections)
+        self.delay = delay
+        self.msearch_titles = []
+
+    def title(self, query):
+        return query['query']['match']['doc.title']['query']
+
+    def msearch(self, body, index):
+        titles = [self.title(query) for query in body[1::2]]
+        self.msearch_titles.append(titles)
+        if self.delay:
+            time.sleep(random.uniform(0, self.delay))
+
+        rejection = self.rejections.pop(0) if self.rejections else None
+        if isinstance(rejection, int):
+            raise TransportError(rejection, 'rejected')
+        statuses = rejection or [None] * len(titles)
+        return {'responses': [
+            {'status': status, 'error': {'type': 'rejected'}} if status
+            else es_response(self.publications.get(title))
+            for title, status in zip(titles, statuses)
+        ]}
+
+
+def references(titles):
+    return [
+        {'reference_id': i, 'Title': title, 'metadata': {'file_hash': 'doc'}}
+        for i, title in enumerate(titles)
+    ]
+
+
+def create_matcher(es):
+    return ElasticsearchFuzzyMatcher(es, 50, 80, 'epmc', 'who_iris')
+
+
+def test_match_many_batches_msearch_requests():
+    es = FakeElasticsearch()
+    titles = [
+        PUBLICATIONS[0]['title'],
+        None,
+        'An unknown title',
+        PUBLICATIONS[0]['title'],
+        PUBLICATIONS[1]['title'],
+    ]
+
+    matches = list(create_matcher(es).match_many(
+        references(titles), batch_size=2
+    ))
+
+    # References without a title aren't queried, and a title is queried
+    # once per batch.
+    assert es.msearch_titles == [
+        [PUBLICATIONS[0]['title']],
+        ['An unknown title', PUBLICATIONS[0]['title']],
+        [PUBLICATIONS[1]['title']],
+    ]
+    assert [m and m['match_id'] for m in matches] == \
+        ['es-0', None, None, 'es-0', 'es-1']
+    assert matches[0]['reference_id'] == 0
+    assert matches[0]['match_title'] == PUBLICATIONS[0]['title']
+
+
+def test_match_many_skips_cached_titles():
+    from match_cache import TitleMatchCache
+
+    es = FakeElasticsearch()
+    matcher = ElasticsearchFuzzyMatcher(
+        es, 50, 80, 'epmc', 'who_iris', match_cache=TitleMatchCache()
+    )
+    titles = [PUBLICATIONS[0]['title'], PUBLICATIONS[1]['title']]
+
+    list(matcher.match_many(references(titles), batch_size=10))
+    matches = list(matcher.match_many(references(titles), batch_size=10))
+
+    assert es.msearch_titles == [titles]
+    assert [m['match_id'] for m in matches] == ['es-0', 'es-1']
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(fuzzymatcher_task.time, 'sleep', sleeps.append)
+    return sleeps
+
+
+def test_rejected_queries_are_retried(sleeps):
+    es = FakeElasticsearch(rejections=[(None, 429, None), (503,)])
+    titles = [PUBLICATIONS[i]['title'] for i in range(3)]
+
+    matches = list(create_matcher(es).match_many(references(titles)))
+
+    assert es.msearch_titles == [titles, [titles[1]], [titles[1]]]
+    assert [m['match_id'] for m in matches] == ['es-0', 'es-1', 'es-2']
+    assert len(sleeps) == 2
+
+
+def test_overloaded_requests_are_retried(sleeps):
+    es = FakeElasticsearch(rejections=[503, 429])
+    titles = [PUBLICATIONS[0]['title']]
+
+    matches = list(create_matcher(es).match_many(references(titles)))
+
+    assert len(es.msearch_titles) == 3
+    assert matches[0]['match_id'] == 'es-0'
+    assert len(sleeps) == 2
+
+
+def test_other_errors_are_raised(sleeps):
+    es = FakeElasticsearch(rejections=[(400,)])
+
+    with pytest.raises(SearchErrorException):
+        list(create_matcher(es).match_many(
+            references([PUBLICATIONS[0]['title']])
+        ))
+    assert sleeps == []
+
+
+def test_retries_give_up(sleeps):
+    es = FakeElasticsearch(
+        rejections=[503] * (fuzzymatcher_task.MAX_RETRIES + 1)
+    )
+
+    with pytest.raises(TransportError):
+        list(create_matcher(es).match_many(
+            references([PUBLICATIONS[0]['title']])
+        ))
+    assert len(sleeps) == fuzzymatcher_task.MAX_RETRIES
+
+
+def test_concurrent_matches_keep_reference_order():
+    es = FakeElasticsearch(delay=0.01)
+    titles = [
+        random.Random(i).choice([p['title'] for p in PUBLICATIONS] + [None])
+        for i in range(50)
+    ]
+
+    matches = list(create_matcher(es).match_many(
+        references(titles), batch_size=3, concurrency=4
+    ))
+
+    assert [m and m['reference_id'] for m in matches] == [
+        i if title else None for i, title in enumerate(titles)
+    ]
+    assert [m and m['match_title'] for m in matches] == titles
+
+
+def test_local_and_es_backends_match_alike():
+    from refparse.utils import FuzzyMatcher
+
+    titles = [
+        PUBLICATIONS[3]['title'],
+        'An unknown title',
+        None,
+        PUBLICATIONS[7]['title'],
+    ]
+    es_matches = list(create_matcher(FakeElasticsearch()).match_many(
+        references(titles)
+    ))
+    local_matches = list(LocalFuzzyMatcher(
+        FuzzyMatcher(PUBLICATIONS, 0.8), 'who_iris'
+    ).match_many(references(titles)))
+
+    assert [m and m['match_id'] for m in local_matches] == \
+        ['3', None, None, '7']
+    for es_match, local_match in zip(es_matches, local_matches):
+        if es_match is None:
+            assert local_match is None
+            continue
+        # Only ids and similarities differ between backends
+        for key in ('match_id', 'similarity'):
+            es_match.pop(key)
+            local_match.pop(key)
+        assert local_match == es_match
+
+
+def test_batch_size_of_each_backend(monkeypatch):
+    class RecordingMatcher:
+        def match_many(self, references, batch_size, concurrency):
+            self.batch_size = batch_size
+            return iter([])
+
+    monkeypatch.setattr(
+        fuzzymatcher_task, 'yield_structured_references',
+        lambda s3, key: iter([])
+    )
+    operator = FuzzyMatchRefsOperator(
+        None, 's3://bucket/src', 's3://bucket/dst', None,
+        msearch_batch_size=100, local_batch_size=1000,
+        backend='local-index', publications_path='publications.json.gz'
+    )
+    matcher = RecordingMatcher()
+    operator.match_references(matcher, None)
+
+    assert matcher.batch_size == 1000
+
+
+def test_join_document_metadata():
+    metadata = {'file_hash': 'doc0', 'url': 'http://doc/0'}
+    records = [
+        {'document_id': 'doc0', 'document_url': 'http://doc/0',
+         'document_metadata': metadata},
+        {'document_id': 'doc0', 'reference_id': 0},
+        {'document_id': 'doc0', 'reference_id': 1},
+        # Records of the denormalized output keep their own metadata
+        {'document_id': 'doc1', 'reference_id': 2,
+         'metadata': {'file_hash': 'doc1'}},
+        {'document_id': 'doc2', 'reference_id': 3},
+    ]
+
+    refs = list(join_document_metadata(records))
+
+    assert [ref['reference_id'] for ref in refs] == [0, 1, 2, 3]
+    assert refs[0]['metadata'] is refs[1]['metadata']
+    assert refs[0]['metadata'] == metadata
+    assert refs[2]['metadata'] == {'file_hash': 'doc1'}
+    assert refs[3]['metadata'] == {}
+
+
+def test_normalized_references_are_matched_with_their_policy(monkeypatch):
+    records = [
+        {'document_id': 'doc0', 'document_url': 'http://doc/0',
+         'document_metadata': {'file_hash': 'doc0', 'title': 'Policy'}},
+        {'document_id': 'doc0', 'reference_id': 0,
+         'Title': PUBLICATIONS[0]['title']},
+    ]
+    monkeypatch.setattr(
+        fuzzymatcher_task, 'yield_structured_references',
+        lambda s3, key: iter(records)
+    )
+    monkeypatch.setattr(
+        fuzzymatcher_task.elastic.common, 'connect', lambda hosts: None
+    )
+    operator = FuzzyMatchRefsOperator(
+        None, 's3://bucket/src', 's3://bucket/dst', 'epmc',
+        organisation='who_iris'
+    )
+
+    matches = operator.match_references(
+        create_matcher(FakeElasticsearch()), None
+    )
+
+    policy = matches['es-0']['policies'][0]
+    assert (policy['doc_id'], policy['title']) == ('doc0', 'Policy')
@@ -21,12 +21,14 @@ class ParsePdfOperator:
 
     Args:
         organisation: The organisation to pull documents from.
+        workers: Number of processes parsing pdfs.
     """
 
-    def __init__(self, organisation, src_s3_dir, dst_s3_key):
+    def __init__(self, organisation, src_s3_dir, dst_s3_key, workers=1):
         self.organisation = organisation
         self.src_s3_dir = src_s3_dir
         self.dst_s3_key = dst_s3_key
+        self.workers = workers
 
         self.client = s3hook.S3Hook()
 
@@ -45,6 +47,7 @@ class ParsePdfOperator:
             self.organisation,
             self.src_s3_dir,
             self.dst_s3_key,
+            workers=self.workers,
         )
 
 
@@ -66,6 +69,12 @@ if __name__ == '__main__':
         choices=s3hook.ORGS,
         help='The organisation to scrape.'
     )
+    arg_parser.add_argument(
+        '--workers',
+        help='Number of processes parsing pdfs.',
+        default=int(os.environ.get('PDF_PARSER_WORKERS', 1)),
+        type=int
+    )
 
     args = arg_parser.parse_args()
 
@@ -78,7 +87,8 @@ if __name__ == '__main__':
     parser = ParsePdfOperator(
         args.organisation,
         args.src_s3_dir,
-        parser_dst_key
+        parser_dst_key,
+        workers=args.workers
     )
     parser.execute()
 
@@ -12,22 +12,34 @@ Example:
 
 """
 from argparse import ArgumentParser
+from collections import deque
 from urllib.parse import urlparse, urljoin
 import gzip
 import json
 import logging
+import multiprocessing
 import os
 import os.path
 import shutil
 import tempfile
 
 from hooks.s3hook import S3Hook
-from .pdf_parse import parse_pdf_document, grab_section
+from .prefetch import PdfPrefetcher
+from .pdf_parse import parse_pdf_document, grab_sections
 
 logger = logging.getLogger(__name__)
 
 KEYWORD_SEARCH_CONTEXT = 2
 
+# Seconds a worker may spend on a single pdf before it is given up on
+PARSE_TIMEOUT = 15 * 60
+ERR_PARSE_FAILED = 'pdf parse failed'
+ERR_PARSE_TIMEOUT = 'pdf parse timed out'
+
+# Number of pdfs downloaded ahead of the one being parsed
+PREFETCH = 8
+PREFETCH_MAX_MB = 256
+
 
 def default_resources_dir():
     """ Returns path to resources/ within our repo. """
@@ -62,6 +74,18 @@ def write_to_file(output_url, items, organisation):
             'Unsupported output_url: %s' % output_url)
 
 
+def failed_item(pdf_hash, errors):
+    """The item of a pdf that couldn't be parsed."""
+    # We still have to return something for the json to be complete.
+    return {
+        'file_hash': pdf_hash,
+        'sections': None,
+        'keywords': None,
+        'text': None,
+        'errors': errors,
+    }
+
+
 def parse_pdf(pdf, words, titles, context, pdf_hash, metadata):
     """Parse the given pdf and returns a dict containing its test, sections and
        keywords.
@@ -85,14 +109,7 @@ def parse_pdf(pdf, words, titles, context, pdf_hash, metadata):
             pdf_hash, ','.join(errors)
         )
 
-        # We still have to return something for the json to be complete.
-        return {
-            'file_hash': pdf_hash,
-            'sections': None,
-            'keywords': None,
-            'text': None,
-            'errors': errors,
-        }
+        return failed_item(pdf_hash, errors)
 
     # Fetch references or other keyworded list
     keyword_dict = pdf_file.get_lines_by_keywords(
@@ -101,9 +118,9 @@ def parse_pdf(pdf, words, titles, context, pdf_hash, metadata):
     )
 
     section_dict = {}
+    sections = grab_sections(pdf_file, titles)
     for title in titles:
-        # Fetch references or other keyworded list
-        section = grab_section(pdf_file, title)
+        section = sections[title]
 
         # Add references and PDF name to JSON returned file
         # If no section matchs, leave the attribute undefined
@@ -183,10 +200,41 @@ def create_argparser(description):
         type=int
     )
 
+    parser.add_argument(
+        '--workers',
+        help='Number of processes parsing pdfs.',
+        default=int(os.environ.get('PDF_PARSER_WORKERS', 1)),
+        type=int
+    )
+
+    parser.add_argument(
+        '--prefetch',
+        help='Number of pdfs downloaded ahead of the parser, 0 to disable.',
+        default=int(os.environ.get('PDF_PARSER_PREFETCH', PREFETCH)),
+        type=int
+    )
+
+    parser.add_argument(
+        '--prefetch-max-mb',
+        help='Size of the downloaded pdfs above which prefetching pauses.',
+        default=int(os.environ.get(
+            'PDF_PARSER_PREFETCH_MAX_MB', PREFETCH_MAX_MB)),
+        type=int
+    )
+
+    parser.add_argument(
+        '--spool-dir',
+        help='Directory in which to download prefetched pdfs.',
+        default=os.environ.get('PDF_PARSER_SPOOL_DIR'),
+    )
+
     return parser
 
 
-def _yield_items(s3_hook, words, titles, context, src_url, organisation):
+def _yield_manifest_entries(s3_hook, src_url, organisation):
+    """Yields the (item_key, pdf_hash, metadata) of each pdf of the
+    manifest, in order.
+    """
     content = s3_hook.get_manifest(src_url, organisation)['content']
     # Load data about individual documents
     data = s3_hook.get_manifest(src_url, organisation)['data']
@@ -205,27 +253,130 @@ def _yield_items(s3_hook, words, titles, context, src_url, organisation):
                 item + '.pdf'
             )
             logger.info(item_key + '  --- ' + directory)
+            yield item_key, item, metadata_lookup.get(item, {})
 
-            pdf = s3_hook.get(
-                item_key
+
+def _parse_manifest_entry(s3_hook, words, titles, context,
+                          item_key, item, metadata):
+    pdf = s3_hook.get(
+        item_key
+    )
+
+    with tempfile.NamedTemporaryFile() as tf:
+        shutil.copyfileobj(pdf, tf)
+        tf.seek(0)
+        return parse_pdf(
+            tf,
+            words,
+            titles,
+            context,
+            item,
+            metadata
+        )
+
+
+def _yield_items(s3_hook, words, titles, context, src_url, organisation):
+    entries = _yield_manifest_entries(s3_hook, src_url, organisation)
+    for item_key, item, metadata in entries:
+        yield _parse_manifest_entry(
+            s3_hook, words, titles, context, item_key, item, metadata
+        )
+
+
+def _yield_prefetched_items(prefetcher, words, titles, context):
+    """Parse the pdfs downloaded by a PdfPrefetcher, in order."""
+    for item_key, item, metadata, path in prefetcher:
+        with open(path, 'rb') as f:
+            yield parse_pdf(
+                f,
+                words,
+                titles,
+                context,
+                item,
+                metadata
             )
+    prefetcher.log_stats()
+
+
+# Settings of a worker process, see _init_worker
+_worker_args = None
 
-            with tempfile.NamedTemporaryFile() as tf:
-                shutil.copyfileobj(pdf, tf)
-                tf.seek(0)
-                yield parse_pdf(
-                    tf,
-                    words,
-                    titles,
-                    context,
-                    item,
-                    metadata_lookup.get(item, {})
-                )
+
+def _init_worker(words, titles, context):
+    global _worker_args
+    # boto3 sessions can't be shared with forked processes
+    _worker_args = (S3Hook(), words, titles, context)
+
+
+def _parse_manifest_entry_in_worker(item_key, item, metadata):
+    """Parse a pdf in a worker process, downloading it to a temporary
+    file of its own. Any error is returned as a failed item, so that it
+    doesn't stop the other pdfs from being parsed.
+    """
+    try:
+        return _parse_manifest_entry(*_worker_args, item_key, item, metadata)
+    except Exception as e:
+        logger.exception(
+            '_parse_manifest_entry_in_worker: pdf_hash=%s', item)
+        return failed_item(item, [ERR_PARSE_FAILED, repr(e)])
+
+
+def _yield_items_in_pool(entries, words, titles, context, workers,
+                         timeout=PARSE_TIMEOUT):
+    """Parse the pdfs of manifest entries on a pool of workers processes,
+    yielding back their items in the order of entries.
+
+    At most twice as many pdfs as workers are submitted and not yet
+    yielded. A pdf not parsed within timeout seconds, e.g. because it
+    hangs or crashes its worker, is yielded as a failed item, and the
+    pool is replaced so that its worker doesn't stay stuck on it: the
+    other pending pdfs are submitted again to the new pool.
+    """
+    def create_pool():
+        return multiprocessing.Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(words, titles, context)
+        )
+
+    def submit(entry):
+        return pool.apply_async(_parse_manifest_entry_in_worker, entry)
+
+    pool = create_pool()
+    pending = deque()
+
+    def next_result():
+        nonlocal pool
+        entry, result = pending.popleft()
+        try:
+            return result.get(timeout)
+        except multiprocessing.TimeoutError:
+            logger.warning(
+                '_yield_items_in_pool: timeout pdf_hash=%s', entry[1])
+            pool.terminate()
+            pool.join()
+            pool = create_pool()
+            for i, (pending_entry, _) in enumerate(pending):
+                pending[i] = (pending_entry, submit(pending_entry))
+            return failed_item(entry[1], [ERR_PARSE_TIMEOUT])
+
+    try:
+        for entry in entries:
+            pending.append((entry, submit(entry)))
+            if len(pending) >= 2 * workers:
+                yield next_result()
+        while pending:
+            yield next_result()
+    finally:
+        # Workers may still be stuck on pdfs which timed out
+        pool.terminate()
+        pool.join()
 
 
 def parse_all_pdf(organisation, input_url, output_url,
                   context=KEYWORD_SEARCH_CONTEXT,
-                  resources_dir=None):
+                  resources_dir=None, workers=1, prefetch=PREFETCH,
+                  prefetch_max_mb=PREFETCH_MAX_MB, spool_dir=None):
     """Parses all the pdfs from the manifest in the input url and export the
     result to the ouput url.
 
@@ -245,11 +396,20 @@ def parse_all_pdf(organisation, input_url, output_url,
         resources_dir: Path to directory containing keywords.txt and
                        section_keywords.txt, used for finding titles and
                        words to look for.
+        workers: Number of processes downloading and parsing pdfs. Items
+                 are written in the order of the manifest either way.
+        prefetch: Number of pdfs downloaded ahead of the one being
+                  parsed by a single worker, 0 to download each pdf only
+                  once it's its turn.
+        prefetch_max_mb: Size of the prefetched pdfs above which no new
+                         download starts.
+        spool_dir: Directory in which to download prefetched pdfs.
     """
     logger.info(
         "parse_all_pdf: input_url=%s output_url=%s organisation=%s "
-        "context=%d resources_dir=%s",
-        input_url, output_url, organisation, context, resources_dir)
+        "context=%d resources_dir=%s workers=%d prefetch=%d",
+        input_url, output_url, organisation, context, resources_dir,
+        workers, prefetch)
     if resources_dir is None:
         resources_dir = default_resources_dir()
     keywords_file = os.path.join(resources_dir, 'keywords.txt')
@@ -260,8 +420,24 @@ def parse_all_pdf(organisation, input_url, output_url,
     titles = parse_keywords_files(sections_file)
 
     s3_hook = S3Hook()
-    parsed_items = _yield_items(s3_hook, words, titles, context,
-                                input_url, organisation)
+    if workers > 1:
+        parsed_items = _yield_items_in_pool(
+            _yield_manifest_entries(s3_hook, input_url, organisation),
+            words, titles, context, workers
+        )
+    elif prefetch > 0:
+        prefetcher = PdfPrefetcher(
+            _yield_manifest_entries(s3_hook, input_url, organisation),
+            spool_dir=spool_dir,
+            max_ahead=prefetch,
+            max_bytes=prefetch_max_mb * 1024 * 1024
+        )
+        parsed_items = _yield_prefetched_items(
+            prefetcher, words, titles, context
+        )
+    else:
+        parsed_items = _yield_items(s3_hook, words, titles, context,
+                                    input_url, organisation)
 
     write_to_file(output_url, parsed_items, organisation)
 
@@ -278,4 +454,8 @@ if __name__ == '__main__':
         args.output_url,
         args.keyword_search_context,
         resources_dir=args.resources_dir,
+        workers=args.workers,
+        prefetch=args.prefetch,
+        prefetch_max_mb=args.prefetch_max_mb,
+        spool_dir=args.spool_dir,
     )
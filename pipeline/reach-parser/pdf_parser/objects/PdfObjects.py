@@ -3,6 +3,7 @@ import attr
 import json
 import math
 import ahocorasick
+from collections import Counter
 
 
 @attr.s
@@ -52,6 +53,59 @@ class PdfPage(object):
         return page_text
 
 
+@attr.s
+class PdfFontIndex(object):
+    """Font statistics of a pdf file, computed in a single scan of its lines:
+        - (dict)lines_by_size       : The lines of each font size, in order.
+        - (int[])font_sizes         : The distinct font sizes.
+        - (Counter)font_face_counts : The number of lines of each font face.
+        - (int)mean_size            : The mean of the font sizes.
+        - (int)upper_mean_size      : The mean of the font sizes above
+                                      mean_size.
+    """
+    lines_by_size = attr.ib(default=attr.Factory(dict), type=dict)
+    font_sizes = attr.ib(default=attr.Factory(list), type=list)
+    font_face_counts = attr.ib(default=attr.Factory(Counter), type=Counter)
+    mean_size = attr.ib(default=0, type=int)
+    upper_mean_size = attr.ib(default=0, type=int)
+
+    @classmethod
+    def from_pages(cls, pages):
+        """Build the index of a list of PdfPage."""
+        lines_by_size = {}
+        # Titles are looked for in the order of this set, as they were
+        # before the index, and it depends on the order of insertions.
+        font_sizes = set()
+        font_face_counts = Counter()
+        for page in pages:
+            for line in page.lines:
+                lines_by_size.setdefault(line.size, []).append(line)
+                font_sizes.add(line.size)
+                font_face_counts[line.font_face] += 1
+
+        total_lines = sum(len(lines) for lines in lines_by_size.values())
+        sum_size = sum(
+            size * len(lines) for size, lines in lines_by_size.items()
+        )
+        mean_size = math.ceil(sum_size / max(total_lines, 1))
+
+        upper_lines = 0
+        upper_sum_size = 0
+        for size, lines in lines_by_size.items():
+            if size > mean_size:
+                upper_lines += len(lines)
+                upper_sum_size += size * len(lines)
+        upper_mean_size = int(upper_sum_size / max(upper_lines, 1))
+
+        return cls(
+            lines_by_size,
+            list(font_sizes),
+            font_face_counts,
+            mean_size,
+            upper_mean_size
+        )
+
+
 @attr.s
 class PdfFile(object):
     """Represent a pdf file, defined by the following attributes:
@@ -62,6 +116,20 @@ class PdfFile(object):
     pages = attr.ib(default=[], type=list)
     has_bold = attr.ib(default=False, type=bool)
 
+    def __attrs_post_init__(self):
+        # Built on first use by get_font_index, not a field so that it
+        # isn't serialized nor compared.
+        self._font_index = None
+
+    def get_font_index(self):
+        """Return the PdfFontIndex of the pdf file, built on first use.
+        Lines added to pages by other means than add_page or from_json
+        aren't taken into account once it's built.
+        """
+        if self._font_index is None:
+            self._font_index = PdfFontIndex.from_pages(self.pages)
+        return self._font_index
+
     def from_json(self, json_pdf):
         """Initialize a PdfFile object from a json representation."""
         dict_pdf = json.loads(json_pdf)
@@ -78,6 +146,7 @@ class PdfFile(object):
             pdf_pages.append(pdf_page)
         self.pages = pdf_pages
         self.has_bold = dict_pdf.get('has_bold', False)
+        self._font_index = None
 
     def to_json(self):
         """Return a dictionary representation of the PdfFile."""
@@ -87,6 +156,7 @@ class PdfFile(object):
     def add_page(self, pdf_page):
         """Add a PdfPage to the pages list."""
         self.pages.append(pdf_page)
+        self._font_index = None
 
     def get_page(self, page_number):
         """Return the PdfPage for the argument (int)page_number."""
@@ -94,44 +164,23 @@ class PdfFile(object):
 
     def get_mean_font_size(self):
         """Return the mean of the pdf file font sizes."""
-        sum_size = 0
-        total_fonts = 0
-        for page in self.pages:
-            for line in page.lines:
-                sum_size += line.size
-                total_fonts += 1
-        return math.ceil(sum_size / max(total_fonts, 1))
+        return self.get_font_index().mean_size
 
     def get_upper_mean_font_size(self):
         """Return the mean of all fonts ubove the average size."""
-        basic_mean = self.get_mean_font_size()
-        sum_size = 0
-        total_fonts = 0
-        for page in self.pages:
-            for line in page.lines:
-                if line.size > basic_mean:
-                    sum_size += line.size
-                    total_fonts += 1
-        return int(sum_size / max(total_fonts, 1))
+        return self.get_font_index().upper_mean_size
 
     def get_lines_by_font_size(self, font_size):
         """Return all the lines of (int)font_size size."""
-        lines_results = []
-        for page in self.pages:
-            lines = [line for line in page.lines if line.size == font_size]
-            lines = list(filter(lambda x: x.size == font_size, page.lines))
-            lines_results.extend(lines)
-
-        return lines_results
+        return list(self.get_font_index().lines_by_size.get(font_size, []))
 
     def get_font_size_list(self):
         """Return a list containing all the font sizes in the pdf file."""
-        font_sizes = []
-        for page in self.pages:
-            lines = [line.size for line in page.lines]
-            font_sizes.extend(list(lines))
-        # Convert to set and back to list to remove duplicates
-        return list(set(font_sizes))
+        return list(self.get_font_index().font_sizes)
+
+    def get_font_face_counts(self):
+        """Return a Counter of the number of lines in each font face."""
+        return self.get_font_index().font_face_counts
 
     def get_bold_lines(self):
         """Return all the bold lines in the document."""
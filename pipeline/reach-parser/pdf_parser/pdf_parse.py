@@ -1,5 +1,4 @@
 import errno
-import io
 import logging
 import os
 import subprocess
@@ -9,7 +8,7 @@ import lxml.etree
 from lxml.etree import XMLSyntaxError
 
 from pdf_parser.objects.PdfObjects import PdfFile, PdfLine, PdfPage
-from pdf_parser.tools.extraction import (_find_elements, _flatten_text,
+from pdf_parser.tools.extraction import (_find_all_elements, _flatten_text,
                                _flatten_fontspec)
 
 MAX_HTML_SIZE = 64 * 1024 * 1024
@@ -19,8 +18,15 @@ ERR_EMPTY_FILE = 'html file was empty'
 ERR_FILE_TOO_LARGE = 'html file too large'
 ERR_XML_SYNTAX = 'xml file has some syntax error'
 ERR_PDFINFO_NONZERO_EXIT = 'pdfinfo could not get pdf metadata'
+ERR_PDF2HTML_TIMEOUT = 'pdf2html timed out'
+
+# Seconds pdfinfo and pdftohtml may run on a single pdf
+PDFINFO_TIMEOUT = 60
+PDF2HTML_TIMEOUT = 10 * 60
 
 BASE_FONT_SIZE = -10
+# Font of the lines whose font isn't declared
+UNKNOWN_FONT = {'size': BASE_FONT_SIZE, 'family': ''}
 
 logger = logging.getLogger(__name__)
 
@@ -48,11 +54,16 @@ def get_pdf_metadata(document):
 
     meta = {}
 
-    result = subprocess.run(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
+    try:
+        result = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=PDFINFO_TIMEOUT,
+        )
+    except subprocess.TimeoutExpired:
+        logger.warning("pdfinfo timed out on [%s]", document.name)
+        return meta
 
     # We ignore all other errors, as we want
     # to carry on to trying to parse the PDF
@@ -75,6 +86,62 @@ def get_pdf_metadata(document):
     return meta
 
 
+def parse_xml_document(xml_file):
+    """ Parses the xml output of pdftohtml in a single pass, returning a
+    PdfFile object and the full text of the document.
+
+    Elements are freed as soon as they're read, so that memory only holds
+    the current page of the xml rather than all of it.
+
+    Args:
+        xml_file: path or file object of the xml document
+    """
+    fontspec = {}
+    file_pages = []
+    page_lines = []
+    texts = []
+
+    elements = lxml.etree.iterparse(
+        xml_file,
+        events=('end',),
+        tag=('fontspec', 'text', 'page'),
+        encoding='utf-8',
+        recover=True,
+    )
+    for _, element in elements:
+        if element.tag == 'fontspec':
+            # Fonts are declared on the first page using them
+            fontspec.update(_flatten_fontspec([element]))
+
+        elif element.tag == 'text':
+            text = _flatten_text(element)
+            texts.append(text)
+
+            if element.getparent().tag == 'page':
+                # Malformed xml may use fonts it declares later, or not
+                # at all
+                font = fontspec.get(element.get('font'), UNKNOWN_FONT)
+                page_lines.append(PdfLine(
+                    int(font['size']),
+                    False,
+                    text,
+                    len(file_pages),
+                    font['family']
+                ))
+
+        else:
+            file_pages.append(PdfPage(page_lines, len(file_pages)))
+            page_lines = []
+
+        element.clear()
+        if element.tag == 'page':
+            # Drop the pages already read from the root too
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+    return PdfFile(file_pages), '\n'.join(texts)
+
+
 def parse_pdf_document(document):
     """ Parses a file using pdftohtml, returning a
     PdfFile object, easier to analyse.
@@ -101,8 +168,14 @@ def parse_pdf_document(document):
             subprocess.check_call(
                 cmd,
                 stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
+                stderr=subprocess.DEVNULL,
+                timeout=PDF2HTML_TIMEOUT
             )
+        except subprocess.TimeoutExpired:
+            logger.warning(
+                "The pdf [%s] timed out during conversion", document.name
+            )
+            return None, None, None, [ERR_PDF2HTML_TIMEOUT]
         except subprocess.CalledProcessError as e:
             logger.warning(
                 "The pdf [%s] could not be converted: %r",
@@ -133,76 +206,40 @@ def parse_pdf_document(document):
 
             return None, None, None, [ERR_FILE_TOO_LARGE]
 
-        parser = lxml.etree.XMLParser(encoding="utf-8", recover=True)
         try:
-            tree = lxml.etree.parse(io.BytesIO(tf.read()), parser)
+            pdf_file, full_text = parse_xml_document(tf.name)
         except XMLSyntaxError:
             return None, None, None, [ERR_XML_SYNTAX]
 
-        file_pages = []
-        full_text = '\n'.join(
-            [_flatten_text(text) for text in tree.xpath('//text')]
-        )
-        pages = tree.xpath('page')
-
-        for page_num, page in enumerate(pages):
-            lines = page.xpath('text')
-            page_lines = []
-
-            # Create a mapping dict to allow font family and size lookups
-            fontspec = _flatten_fontspec(page.xpath('//fontspec'))
-
-            for line in lines:
-                family = fontspec[line.get('font')]['family']
-                size = int(fontspec[line.get('font')]['size'])
-                text = _flatten_text(line)
-
-                pdf_line = None
-                pdf_line = PdfLine(
-                    size,
-                    False,
-                    text,
-                    page_num,
-                    family
-                )
+        return pdf_file, full_text, metadata, None
 
-                if pdf_line:
-                    page_lines.append(pdf_line)
 
-            file_pages.append(PdfPage(page_lines, page_num))
+def grab_sections(pdf_file, keywords):
+    """Given a pdf parsed file object (PdfFile) and keywords corresponding to
+    titles, returns a dict of the matching section of the pdf text for each
+    keyword, empty if there is none.
 
-        pdf_file = PdfFile(file_pages)
+    The sections of all the keywords are found in a single pass, and their
+    text is sliced from the lines of the pdf, from the title line to the
+    line before the next title, or the end of the document.
+    """
+    lines = [line for page in pdf_file.pages for line in page.lines]
+    offsets = dict((id(line), offset) for offset, line in enumerate(lines))
 
-        return pdf_file, full_text, metadata, None
+    sections = {}
+    elements = _find_all_elements(pdf_file, keywords)
+    for keyword, keyword_elements in elements.items():
+        result = ''
+        for start_title, end_title in keyword_elements:
+            start = offsets[id(start_title)]
+            end = offsets[id(end_title)] if end_title else len(lines)
+            result += ''.join(line.text + '\n' for line in lines[start:end])
+        sections[keyword] = result
+    return sections
 
 
 def grab_section(pdf_file, keyword):
     """Given a pdf parsed file object (PdfFile) and a keyword corresponding to
     a title, returns the matching section of the pdf text.
     """
-
-    result = ''
-    elements = _find_elements(pdf_file, keyword)
-    for start_title, end_title in elements:
-        text = ''
-        # If there is no end to this section, then get text from
-        # the start of this section until the end of the entire document.
-        # For sections where start page = end page, need
-        # to add 1 to the end page number otherwise no text will be
-        # appended in the for loop (list(range(x,x)) = [])
-        if not end_title:
-            end_page = len(pdf_file.pages)
-        elif (start_title.page_number != end_title.page_number):
-            end_page = end_title.page_number
-        else:
-            end_page = end_title.page_number + 1
-        for page_number in range(start_title.page_number, end_page):
-            if pdf_file.get_page(page_number).get_page_text(True):
-                text += pdf_file.get_page(page_number).get_page_text()
-        if end_title:
-            result += text[
-                    text.find(start_title.text):text.find(end_title.text)
-                ]
-        else:
-            result += text[text.find(start_title.text):]
-    return result
+    return grab_sections(pdf_file, [keyword])[keyword]
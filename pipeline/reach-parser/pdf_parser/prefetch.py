@@ -0,0 +1,189 @@
+"""
+Download the pdfs of a manifest ahead of the parser.
+
+A PdfPrefetcher downloads the next manifest entries into a local spool
+directory on a pool of threads while the current pdf is being parsed,
+so that downloads and parsing overlap instead of taking turns.
+
+The spool is bounded both by number of pdfs and by bytes: downloads
+pause while the pdfs downloaded and not yet parsed take max_bytes,
+except for the one the parser waits on, which goes through whatever its
+size.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from hooks.s3hook import S3Hook
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class _Stopped(Exception):
+    pass
+
+
+class PdfPrefetcher:
+    def __init__(self, entries, s3_hook_factory=S3Hook, spool_dir=None,
+                 workers=4, max_ahead=8, max_bytes=256 * 1024 * 1024):
+        """
+        Args:
+            entries: iterable of (item_key, pdf_hash, metadata) manifest
+                entries.
+            s3_hook_factory: callable returning an S3Hook; each download
+                thread gets its own, as boto3 resources can't be shared
+                between threads.
+            spool_dir: Directory in which to create the spool, defaults
+                to the system's temporary directory.
+            workers: Number of threads downloading pdfs.
+            max_ahead: Maximum number of pdfs downloaded or downloading
+                and not yet parsed.
+            max_bytes: Size of the downloaded pdfs above which downloads
+                pause.
+        """
+        self.entries = entries
+        self.s3_hook_factory = s3_hook_factory
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.max_ahead = max_ahead
+        self.max_bytes = max_bytes
+
+        self.local = threading.local()
+        self.cond = threading.Condition()
+        self.spooled_bytes = 0
+        # Index of the entry the parser is waiting on
+        self.head = 0
+        self.stopped = False
+
+        self.hits = 0
+        self.misses = 0
+        self.wait = 0.0
+        self.max_spooled_bytes = 0
+
+    def _reserve(self, index, size):
+        with self.cond:
+            while (index != self.head and not self.stopped
+                   and self.spooled_bytes + size > self.max_bytes):
+                self.cond.wait()
+            if self.stopped:
+                raise _Stopped()
+            self.spooled_bytes += size
+            self.max_spooled_bytes = max(
+                self.max_spooled_bytes, self.spooled_bytes
+            )
+
+    def _release(self, size):
+        with self.cond:
+            self.spooled_bytes -= size
+            self.cond.notify_all()
+
+    def _download(self, index, item_key, item, spool):
+        s3_hook = getattr(self.local, 's3_hook', None)
+        if s3_hook is None:
+            s3_hook = self.local.s3_hook = self.s3_hook_factory()
+
+        # Named after the entry too, as a manifest may list a pdf twice
+        path = os.path.join(spool, '{}-{}.pdf'.format(index, item))
+        pdf = s3_hook.get(item_key)
+        size = 0
+        try:
+            with open(path, 'wb') as f:
+                while True:
+                    chunk = pdf.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self._reserve(index, len(chunk))
+                    size += len(chunk)
+                    f.write(chunk)
+        except BaseException:
+            self._release(size)
+            raise
+        return path, size
+
+    def _advance(self, index):
+        with self.cond:
+            self.head = index
+            self.cond.notify_all()
+
+    def __iter__(self):
+        """
+        Yields (item_key, pdf_hash, metadata, path) for each entry, in
+        order. The file at path is removed once the next entry is asked
+        for. Download errors are raised when their entry is reached.
+        """
+        entries = enumerate(self.entries)
+        pending = deque()
+        spool = tempfile.mkdtemp(prefix='pdf-spool-', dir=self.spool_dir)
+        executor = ThreadPoolExecutor(self.workers)
+        try:
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < self.max_ahead:
+                    try:
+                        index, (item_key, item, metadata) = next(entries)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.append((
+                        index, item_key, item, metadata,
+                        executor.submit(
+                            self._download, index, item_key, item, spool
+                        )
+                    ))
+                if not pending:
+                    return
+
+                index, item_key, item, metadata, future = pending.popleft()
+                self._advance(index)
+                if future.done():
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                t0 = time.time()
+                path, size = future.result()
+                self.wait += time.time() - t0
+
+                try:
+                    yield item_key, item, metadata, path
+                finally:
+                    os.remove(path)
+                    self._release(size)
+        finally:
+            with self.cond:
+                self.stopped = True
+                self.cond.notify_all()
+            for _, _, _, _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            shutil.rmtree(spool, ignore_errors=True)
+
+    def stats(self):
+        """
+        Returns:
+            dict of the number of pdfs already downloaded when the parser
+            reached them (hits) or not (misses), the seconds the parser
+            spent waiting on downloads, and the largest size of the
+            spool in bytes.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'wait': self.wait,
+            'max_spooled_bytes': self.max_spooled_bytes,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(
+            'PdfPrefetcher.log_stats: hits=%d misses=%d wait=%.3f '
+            'max_spooled_bytes=%d',
+            stats['hits'], stats['misses'], stats['wait'],
+            stats['max_spooled_bytes']
+        )
@@ -0,0 +1,65 @@
+import io
+import time
+import unittest
+from unittest import mock
+
+from pdf_parser import main
+
+
+class FakeS3Hook:
+    def get(self, key):
+        return io.BytesIO(key.encode('utf-8'))
+
+
+def fake_parse_pdf(pdf, words, titles, context, pdf_hash, metadata):
+    if pdf_hash == 'bad':
+        raise ValueError(pdf_hash)
+    if pdf_hash.startswith('hang'):
+        time.sleep(60)
+    return {
+        'file_hash': pdf_hash,
+        'text': pdf.read().decode('utf-8'),
+        'errors': None,
+    }
+
+
+class TestParseInPool(unittest.TestCase):
+
+    def test_items_in_manifest_order(self):
+        entries = [
+            ('s3://bucket/pdf/%s.pdf' % item, item, {})
+            for item in ['a', 'bad', 'c', 'd', 'e']
+        ]
+        with mock.patch.object(main, 'S3Hook', FakeS3Hook), \
+                mock.patch.object(main, 'parse_pdf', fake_parse_pdf):
+            items = list(main._yield_items_in_pool(
+                iter(entries), [], [], 2, workers=2
+            ))
+
+        self.assertEqual(
+            [item['file_hash'] for item in items],
+            ['a', 'bad', 'c', 'd', 'e']
+        )
+        self.assertEqual(items[0]['text'], 's3://bucket/pdf/a.pdf')
+        self.assertIsNone(items[1]['sections'])
+        self.assertEqual(items[1]['errors'][0], main.ERR_PARSE_FAILED)
+        self.assertIsNone(items[4]['errors'])
+
+    def test_hung_pdfs_dont_stall_the_others(self):
+        entries = [
+            ('s3://bucket/pdf/%s.pdf' % item, item, {})
+            for item in ['hang0', 'hang1', 'a', 'b', 'c', 'd']
+        ]
+        t0 = time.time()
+        with mock.patch.object(main, 'S3Hook', FakeS3Hook), \
+                mock.patch.object(main, 'parse_pdf', fake_parse_pdf):
+            items = list(main._yield_items_in_pool(
+                iter(entries), [], [], 2, workers=2, timeout=1
+            ))
+
+        self.assertEqual(
+            [item['errors'] for item in items],
+            [[main.ERR_PARSE_TIMEOUT]] * 2 + [None] * 4
+        )
+        self.assertEqual(items[2]['text'], 's3://bucket/pdf/a.pdf')
+        self.assertLess(time.time() - t0, 10)
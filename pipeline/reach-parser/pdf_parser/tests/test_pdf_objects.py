@@ -3,7 +3,7 @@ import pytest
 import sys
 import unittest
 
-from pdf_parser.objects.PdfObjects import PdfFile
+from pdf_parser.objects.PdfObjects import PdfFile, PdfLine, PdfPage
 from pdf_parser.pdf_parse import parse_pdf_document
 from tests.common import (TEST_PDF, TEST_PDF_MULTIPAGE,
                                        TEST_PDF_PAGE_NUMBER)
@@ -192,3 +192,43 @@ class TestPdfObjectsPageNumber(unittest.TestCase):
         """
         self.assertEqual(self.lines[4], '99')
         self.assertEqual(self.lines[8], '99')
+
+
+class TestPdfFontIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.pdf_file = PdfFile()
+        self.pdf_file.from_json(JSON_PDF)
+
+    def test_font_statistics(self):
+        index = self.pdf_file.get_font_index()
+
+        self.assertEqual(
+            {size: [line.text for line in lines]
+             for size, lines in index.lines_by_size.items()},
+            {17: ['Page 1 - Title 1', 'Page 2 - Title 2'],
+             12: ['Page 2 - Text 1']}
+        )
+        self.assertEqual(index.font_face_counts, {'Times': 3})
+        self.assertEqual(self.pdf_file.get_mean_font_size(), 16)
+        self.assertEqual(self.pdf_file.get_upper_mean_font_size(), 17)
+        self.assertEqual(sorted(self.pdf_file.get_font_size_list()), [12, 17])
+
+    def test_index_is_cached_and_not_serialized(self):
+        index = self.pdf_file.get_font_index()
+
+        self.assertIs(self.pdf_file.get_font_index(), index)
+        self.assertNotIn('_font_index', json.loads(self.pdf_file.to_json()))
+
+    def test_add_page_resets_index(self):
+        index = self.pdf_file.get_font_index()
+        self.pdf_file.add_page(PdfPage(
+            [PdfLine(30, False, 'Page 3 - Title 3', 3, 'Arial')], 3
+        ))
+
+        self.assertIsNot(self.pdf_file.get_font_index(), index)
+        self.assertEqual(
+            [line.text for line in self.pdf_file.get_lines_by_font_size(30)],
+            ['Page 3 - Title 3']
+        )
+        self.assertEqual(self.pdf_file.get_font_face_counts()['Arial'], 1)
@@ -1,9 +1,14 @@
+import io
 import unittest
 
 from lxml import etree
 
-from pdf_parser.pdf_parse import parse_pdf_document
+from pdf_parser.objects.PdfObjects import PdfFile, PdfLine, PdfPage
+from pdf_parser.pdf_parse import (BASE_FONT_SIZE, parse_pdf_document,
+                                  parse_xml_document, grab_section,
+                                  grab_sections)
 from pdf_parser.tools.extraction import (_find_elements,
+                                                    _find_all_elements,
                                                     _flatten_text,
                                                     _flatten_fontspec)
 from tests.common import TEST_PDF, TEST_XML
@@ -56,3 +61,113 @@ class TestFlattenTools(unittest.TestCase):
         font_map = _flatten_fontspec(self.fontspecs)
         self.assertEqual(len(font_map), 2)
         self.assertIs(type(font_map), dict)
+
+
+class TestParseXmlDocument(unittest.TestCase):
+
+    def setUp(self):
+        tree = etree.parse(TEST_XML)
+        self.texts = [_flatten_text(text) for text in tree.xpath('//text')]
+
+    def test_pages_and_lines(self):
+        pdf_file, full_text = parse_xml_document(TEST_XML)
+
+        self.assertEqual([page.number for page in pdf_file.pages], [0, 1])
+        self.assertEqual(
+            [line.text for line in pdf_file.pages[0].lines],
+            self.texts[:5]
+        )
+        line = pdf_file.pages[1].lines[0]
+        self.assertEqual(
+            (line.size, line.text, line.page_number, line.font_face),
+            (25, 'TestPage 2', 1, 'Times')
+        )
+        self.assertEqual(full_text, '\n'.join(self.texts))
+
+    def test_truncated_xml(self):
+        with open(TEST_XML, 'rb') as f:
+            xml = f.read()
+        truncated = xml[:xml.index(b'<page number="2"')]
+
+        pdf_file, full_text = parse_xml_document(io.BytesIO(truncated))
+
+        self.assertEqual(len(pdf_file.pages), 1)
+        self.assertEqual(full_text, '\n'.join(self.texts[:5]))
+
+    def test_undeclared_font(self):
+        xml = (
+            b'<pdf2xml><page number="1">'
+            b'<text font="7">Undeclared</text>'
+            b'<text>No font</text>'
+            b'<fontspec id="7" size="12" family="Times"/>'
+            b'<text font="7">Declared</text>'
+            b'</page></pdf2xml>'
+        )
+
+        pdf_file, full_text = parse_xml_document(io.BytesIO(xml))
+
+        self.assertEqual(
+            [(line.size, line.font_face, line.text)
+             for line in pdf_file.pages[0].lines],
+            [(BASE_FONT_SIZE, '', 'Undeclared'),
+             (BASE_FONT_SIZE, '', 'No font'),
+             (12, 'Times', 'Declared')]
+        )
+        self.assertEqual(full_text, 'Undeclared\nNo font\nDeclared')
+
+
+def _pdf_file(pages):
+    return PdfFile([
+        PdfPage(
+            [PdfLine(size, False, text, number, 'Times')
+             for size, text in lines],
+            number
+        )
+        for number, lines in enumerate(pages)
+    ])
+
+
+class TestGrabSections(unittest.TestCase):
+
+    def setUp(self):
+        self.pdf_file = _pdf_file([
+            [(20, 'Introduction'), (10, 'Some text.'), (10, '1')],
+            [(10, 'More text.'), (20, 'References'),
+             (10, 'Smith et al. 2019'), (10, 'Bibliography of Jones')],
+            [(10, 'Jones 2018'), (20, 'Annex'), (10, 'Tables')],
+        ])
+
+    def test_sections_of_all_titles(self):
+        sections = grab_sections(
+            self.pdf_file, ['introduction', 'reference', 'bibliograph']
+        )
+
+        self.assertEqual(sections, {
+            'introduction': 'Introduction\nSome text.\n1\nMore text.\n',
+            'reference': 'References\nSmith et al. 2019\n'
+                         'Bibliography of Jones\nJones 2018\n',
+            'bibliograph': '',
+        })
+        self.assertEqual(
+            grab_section(self.pdf_file, 'reference'), sections['reference']
+        )
+
+    def test_last_section_ends_with_document(self):
+        sections = grab_sections(self.pdf_file, ['annex'])
+
+        self.assertEqual(sections, {'annex': 'Annex\nTables\n'})
+
+    def test_find_all_elements(self):
+        elements = _find_all_elements(
+            self.pdf_file, ['reference', 'annex', 'missing']
+        )
+
+        self.assertEqual(
+            [(start.text, end.text) for start, end in elements['reference']],
+            [('References', 'Annex')]
+        )
+        self.assertEqual(elements['annex'][0][1], None)
+        self.assertEqual(elements['missing'], [])
+        self.assertEqual(
+            _find_elements(self.pdf_file, 'annex'), elements['annex']
+        )
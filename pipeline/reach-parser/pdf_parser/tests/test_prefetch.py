@@ -0,0 +1,108 @@
+import io
+import os
+import threading
+import unittest
+
+from pdf_parser.prefetch import PdfPrefetcher
+
+
+class FakeS3Hook:
+    def __init__(self, objects, released=None):
+        self.objects = objects
+        self.released = released
+
+    def get(self, key):
+        if self.released is not None:
+            self.released.wait()
+        return io.BytesIO(self.objects[key])
+
+
+def entries(objects):
+    return [(key, key.split('/')[-1], {'key': key}) for key in objects]
+
+
+class TestPdfPrefetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.objects = {
+            's3://bucket/pdf/%s' % item: item.encode('utf-8') * 100
+            for item in ['a', 'b', 'c', 'd']
+        }
+
+    def test_yields_entries_in_order(self):
+        prefetcher = PdfPrefetcher(
+            entries(self.objects),
+            s3_hook_factory=lambda: FakeS3Hook(self.objects),
+            workers=2,
+            max_ahead=3
+        )
+        paths = []
+        for item_key, item, metadata, path in prefetcher:
+            self.assertEqual(metadata, {'key': item_key})
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), self.objects[item_key])
+            paths.append(path)
+
+        self.assertEqual(
+            [os.path.basename(p) for p in paths],
+            ['0-a.pdf', '1-b.pdf', '2-c.pdf', '3-d.pdf']
+        )
+        self.assertFalse(os.path.exists(os.path.dirname(paths[0])))
+        stats = prefetcher.stats()
+        self.assertEqual(stats['hits'] + stats['misses'], 4)
+
+    def test_duplicate_pdfs(self):
+        duplicates = entries(self.objects)
+        duplicates.insert(1, duplicates[0])
+        prefetcher = PdfPrefetcher(
+            duplicates,
+            s3_hook_factory=lambda: FakeS3Hook(self.objects),
+            workers=2,
+            max_ahead=3
+        )
+        keys = []
+        for item_key, _, _, path in prefetcher:
+            # The first copy is removed before the second one is read
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), self.objects[item_key])
+            keys.append(item_key)
+
+        self.assertEqual(keys, [key for key, _, _ in duplicates])
+
+    def test_spool_is_capped_by_bytes(self):
+        released = threading.Event()
+        prefetcher = PdfPrefetcher(
+            entries(self.objects),
+            s3_hook_factory=lambda: FakeS3Hook(self.objects, released),
+            workers=4,
+            max_ahead=4,
+            max_bytes=150
+        )
+        released.set()
+        for _, _, _, path in prefetcher:
+            spool = os.path.dirname(path)
+            spooled = sum(
+                os.path.getsize(os.path.join(spool, name))
+                for name in os.listdir(spool)
+            )
+            # The pdf being parsed, and at most max_bytes of others
+            self.assertLessEqual(spooled, 250)
+
+        self.assertLessEqual(prefetcher.stats()['max_spooled_bytes'], 250)
+
+    def test_miss_when_download_is_slow(self):
+        released = threading.Event()
+        prefetcher = PdfPrefetcher(
+            entries(self.objects),
+            s3_hook_factory=lambda: FakeS3Hook(self.objects, released),
+            workers=1,
+            max_ahead=1
+        )
+        timer = threading.Timer(0.05, released.set)
+        timer.start()
+        items = [item for _, item, _, _ in prefetcher]
+        timer.join()
+
+        self.assertEqual(items, ['a', 'b', 'c', 'd'])
+        self.assertGreaterEqual(prefetcher.stats()['misses'], 1)
+        self.assertGreater(prefetcher.stats()['wait'], 0)
@@ -1,74 +1,130 @@
 import re
 
+import ahocorasick
 
-def _find_elements(pdf_file, keyword):
-    """Return an array of elements defining section matching the given keyword.
-    Built to be used only inside the grab_section() function.
+
+def _is_title_candidate(pdf_file, font_index, fsize, line, max_fonts_name):
+    """Return True if a line of font size fsize looks like a title."""
+    mean_fonts = font_index.mean_size
+    upper_mean = font_index.upper_mean_size
+    # PdfFile has some bold font
+    if pdf_file.has_bold:
+        # If a font is bold, in title font and bigger than other,
+        # it is probably a title
+        font_is_bigger = fsize >= (upper_mean
+                                   + (upper_mean - mean_fonts))
+        font_is_big_and_bold = font_is_bigger and line.bold
+        font_is_title_like = (fsize > upper_mean + 2
+                              and line.font_face == max_fonts_name)
+        return font_is_big_and_bold or font_is_title_like
+
+    # PdfFile has been parsed using pdftotext or has no bold
+    font_is_bigger = fsize > mean_fonts + 1
+    font_is_title_like = (fsize > upper_mean + 2
+                          and line.font_face == max_fonts_name)
+    return font_is_bigger or font_is_title_like
+
+
+def _keywords_automaton(keywords, ignore_case=False):
+    """Return an automaton finding the given keywords in lower cased texts,
+    ignoring the case of keywords too if ignore_case.
     """
+    automaton = ahocorasick.Automaton()
+    for keyword in keywords:
+        word = keyword.lower() if ignore_case else keyword
+        if word:
+            automaton.add_word(
+                word, automaton.get(word, ()) + (keyword,)
+            )
+    if len(automaton):
+        automaton.make_automaton()
+    return automaton
 
-    titles = []
-    titles_font_size = 0
-    list_fonts = pdf_file.get_font_size_list()
-    max_fonts_name = ''
-    regex = r''.join([r'(^|[\W]+)', keyword, r'[a-z]*(?=[\W]+|$)'])
 
+def _keywords_in_text(automaton, text):
+    """Return the set of keywords appearing in the lower cased text."""
+    if not len(automaton):
+        return set()
+    return set(
+        keyword
+        for _, keywords in automaton.iter(text.lower())
+        for keyword in keywords
+    )
+
+
+def _find_all_elements(pdf_file, keywords):
+    """Return a dict of the arrays of elements defining the sections matching
+    each of the given keywords, as _find_elements would, in a single scan
+    of the title candidates and of the title lines.
+
+    Keywords are matched literally by an Aho-Corasick automaton, and only
+    lines containing one of them are checked against their title regex.
+    """
+    keywords = list(dict.fromkeys(keywords))
+    elements = dict((keyword, []) for keyword in keywords)
+    list_fonts = pdf_file.get_font_size_list()
     if not list_fonts:
-        return titles
+        return elements
+
+    font_index = pdf_file.get_font_index()
+    lines_by_size = font_index.lines_by_size
+    automaton = _keywords_automaton(keywords, ignore_case=True)
+    regexes = dict(
+        (keyword, re.compile(
+            r''.join([r'(^|[\W]+)', keyword, r'[a-z]*(?=[\W]+|$)']),
+            re.IGNORECASE
+        ))
+        for keyword in keywords
+    )
 
     # Get the name of the biggest font
-    for line in pdf_file.get_lines_by_font_size(max(list_fonts)):
-        max_fonts_name = line.font_face
-        break
+    max_fonts_name = lines_by_size[max(list_fonts)][0].font_face
 
-    mean_fonts = pdf_file.get_mean_font_size()
-    upper_mean = pdf_file.get_upper_mean_font_size()
+    # The title font size of a keyword is the last font size, in the order
+    # of list_fonts, with a title candidate matching it.
+    titles_font_size = dict((keyword, 0) for keyword in keywords)
     for fsize in list_fonts:
-        for line in pdf_file.get_lines_by_font_size(fsize):
-
-            # If a font is bold, in title font and bigger than other,
-            # it is probably a title
-            text = line.text
-
-            # PdfFile has some bold font
-            if pdf_file.has_bold:
-                font_is_bigger = fsize >= (upper_mean
-                                           + (upper_mean - mean_fonts))
-                font_is_big_and_bold = font_is_bigger and line.bold
-                font_is_title_like = (fsize > upper_mean + 2
-                                      and line.font_face == max_fonts_name)
-
-                if font_is_big_and_bold or font_is_title_like:
-                    match = re.search(regex, text, re.IGNORECASE)
-                    if match:
-                        titles_font_size = line.size
-                        break
-
-            # PdfFile has been parsed using pdftotext or has no bold
-            else:
-                font_is_bigger = fsize > mean_fonts + 1
-                font_is_title_like = (fsize > upper_mean + 2
-                                      and line.font_face == max_fonts_name)
-                if font_is_bigger or font_is_title_like:
-                    match = re.search(regex, text, re.IGNORECASE)
-                    if match:
-                        titles_font_size = line.size
-                        break
-
-    # Get all the line of found title font size
-    titles_section = pdf_file.get_lines_by_font_size(titles_font_size)
-    # Sometimes titles text can be whitespaces but happen to be in the titles_font_size, remove these
-    titles_section = [t for t in titles_section if t.text.strip() != ""]
-    start_title = None
-    for line in titles_section:
-        if start_title:
-            titles.append((start_title, line))
-            start_title = None
-        if keyword in line.text.lower():
-            start_title = line
-    if start_title:
-        titles.append((start_title, None))
-
-    return titles
+        for line in lines_by_size[fsize]:
+            if not _is_title_candidate(
+                    pdf_file, font_index, fsize, line, max_fonts_name):
+                continue
+            for keyword in _keywords_in_text(automaton, line.text):
+                if regexes[keyword].search(line.text):
+                    titles_font_size[keyword] = line.size
+
+    keywords_by_size = {}
+    for keyword, fsize in titles_font_size.items():
+        keywords_by_size.setdefault(fsize, []).append(keyword)
+
+    for fsize, size_keywords in keywords_by_size.items():
+        size_automaton = _keywords_automaton(size_keywords)
+        # Get all the line of found title font size
+        titles_section = lines_by_size.get(fsize, [])
+        start_titles = {}
+        for line in titles_section:
+            # Sometimes titles text can be whitespaces but happen to be in
+            # the titles_font_size, skip these
+            if line.text.strip() == "":
+                continue
+            # A title line ends the sections started by the previous one
+            for keyword, start_title in start_titles.items():
+                elements[keyword].append((start_title, line))
+            start_titles = dict(
+                (keyword, line)
+                for keyword in _keywords_in_text(size_automaton, line.text)
+            )
+        for keyword, start_title in start_titles.items():
+            elements[keyword].append((start_title, None))
+
+    return elements
+
+
+def _find_elements(pdf_file, keyword):
+    """Return an array of elements defining section matching the given keyword.
+    Built to be used only inside the grab_section() function.
+    """
+    return _find_all_elements(pdf_file, [keyword])[keyword]
+
 
 def _flatten_text(element):
     """